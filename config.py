@@ -0,0 +1,13 @@
+"""
+Общие настройки бота.
+
+ADMIN_ID — Telegram ID администратора: ему доступны админские команды
+и ему приходят фоновые уведомления (например, utils.slot_autosync).
+"""
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ADMIN_ID = int(os.getenv('ADMIN_ID') or '922109605')
@@ -0,0 +1,180 @@
+"""
+Витрина записей на собеседования: таблица booking_view (миграция 010).
+
+Одна строка на запись (sobes — interviews, reserv — reserv_bookings,
+finfak — finfak_bookings) с уже готовыми для вывода полями: ФИО и username
+кандидата, факультет, дата/время, собеседующий и его ID из таблицы.
+Соединения interviews -> time_slots -> interviewers -> people/bot_users
+выполняются один раз при записи, а не в каждом экспорте и списке.
+
+Хендлеры подтверждения и отмены вызывают sync_booking_view в той же
+транзакции, что и изменение записи, — витрина не расходится с источником.
+"""
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from sqlalchemy import text, select, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import BookingView
+
+
+KIND_SOBES = 'sobes'
+KIND_RESERV = 'reserv'
+KIND_FINFAK = 'finfak'
+
+ACTIVE_STATUSES = ('confirmed', 'pending')
+
+_COLUMNS = (
+    'kind', 'booking_id', 'status', 'candidate_name', 'candidate_username', 'faculty',
+    'date', 'time_start', 'time_end', 'interviewer_id', 'interviewer_name',
+    'interviewer_username', 'interviewer_sheet_id', 'interviewer_tg_id', 'created_at',
+)
+
+
+class BookingRow(NamedTuple):
+    kind: str
+    booking_id: int
+    status: str
+    candidate_name: str
+    candidate_username: Optional[str]
+    faculty: Optional[str]
+    date: Optional[str]
+    time_start: Optional[str]
+    time_end: Optional[str]
+    interviewer_id: int
+    interviewer_name: Optional[str]
+    interviewer_username: Optional[str]
+    interviewer_sheet_id: Optional[str]
+    interviewer_tg_id: Optional[int]
+    created_at: Optional[object]
+
+    def work_row(self) -> Dict[str, str]:
+        """Строка для листа WORK (utils.google_sheets)."""
+        return {
+            'candidate_name': self.candidate_name,
+            'faculty': self.faculty or "Не указан",
+            'date': self.date or "",
+            'time': f"{self.time_start}-{self.time_end}" if self.time_start else "",
+            'interviewer_name': self.interviewer_name or "Не указан",
+            'interviewer_id': self.interviewer_sheet_id or "",
+            'status': self.status,
+            'created_at': self.created_at.strftime("%Y-%m-%d %H:%M") if self.created_at else "",
+        }
+
+
+def _source(kind: str, booking_table: str, slot_table: str, candidate_name: str, candidate_username: str, faculty: str) -> str:
+    return f"""
+        SELECT '{kind}', bk.id, coalesce(bk.status, 'confirmed'), {candidate_name}, {candidate_username}, {faculty},
+               s.date, s.time_start, s.time_end, iv.id, iv.full_name, iv.telegram_username,
+               iv.interviewer_sheet_id, iv.telegram_id, bk.created_at
+        FROM {booking_table} bk
+        JOIN {slot_table} s ON s.id = bk.time_slot_id
+        JOIN interviewers iv ON iv.id = bk.interviewer_id
+        LEFT JOIN bot_users b ON b.id = bk.bot_user_id
+        LEFT JOIN people p ON p.id = bk.person_id
+    """
+
+
+# Как каждая запись выглядит в витрине (те же правила, что были в экспорте и списках)
+_SOURCES = {
+    KIND_SOBES: _source(
+        KIND_SOBES, 'interviews', 'time_slots',
+        candidate_name="""CASE
+            WHEN bk.person_id IS NOT NULL THEN coalesce(p.full_name, 'Не указано')
+            WHEN b.telegram_username IS NOT NULL THEN '@' || b.telegram_username
+            ELSE 'Не указано' END""",
+        candidate_username="b.telegram_username",
+        faculty="bk.faculty",
+    ),
+    KIND_RESERV: _source(
+        KIND_RESERV, 'reserv_bookings', 'reserv_time_slots',
+        candidate_name="coalesce(p.full_name, 'Неизвестен')",
+        candidate_username="ltrim(coalesce(p.telegram_username, b.telegram_username), '@')",
+        faculty="p.faculty",
+    ),
+    KIND_FINFAK: _source(
+        KIND_FINFAK, 'finfak_bookings', 'finfak_time_slots',
+        candidate_name="coalesce(p.full_name, 'Неизвестен')",
+        candidate_username="ltrim(coalesce(p.telegram_username, b.telegram_username), '@')",
+        faculty="'Финфак'",
+    ),
+}
+
+_UPSERT_TAIL = """
+    ON CONFLICT (kind, booking_id) DO UPDATE SET
+        {updates},
+        updated_at = now()
+    RETURNING {columns}
+""".format(
+    updates=',\n        '.join(f'{col} = EXCLUDED.{col}' for col in _COLUMNS if col not in ('kind', 'booking_id')),
+    columns=', '.join(_COLUMNS),
+)
+
+
+async def sync_booking_view(session: AsyncSession, kind: str, booking_id: int) -> Optional[BookingRow]:
+    """
+    Пересобирает строку витрины для записи из источника (в текущей транзакции).
+
+    Вызывается после создания/отмены записи, до commit. Возвращает строку витрины.
+    """
+    # Запись и слот должны быть уже в БД (новая запись — ещё не закоммичена)
+    await session.flush()
+    stmt = text(
+        f"INSERT INTO booking_view ({', '.join(_COLUMNS)})"
+        f"{_SOURCES[kind]} WHERE bk.id = :booking_id"
+        f"{_UPSERT_TAIL}"
+    )
+    result = await session.execute(stmt, {'booking_id': booking_id})
+    row = result.first()
+    return BookingRow(*row) if row else None
+
+
+async def delete_booking_view(session: AsyncSession, kind: str, booking_ids: Iterable[int]) -> None:
+    """Удаляет строки витрины для удалённых записей."""
+    booking_ids = list(booking_ids)
+    if not booking_ids:
+        return
+    await session.execute(
+        delete(BookingView).where(BookingView.kind == kind, BookingView.booking_id.in_(booking_ids))
+    )
+
+
+def _select_rows():
+    return select(*(getattr(BookingView, col) for col in _COLUMNS))
+
+
+async def list_active_bookings(session: AsyncSession, kind: str) -> List[BookingRow]:
+    """Активные записи вида kind по времени создания (экспорт в WORK)."""
+    stmt = (
+        _select_rows()
+        .where(BookingView.kind == kind, BookingView.status.in_(ACTIVE_STATUSES))
+        .order_by(BookingView.created_at)
+    )
+    result = await session.execute(stmt)
+    return [BookingRow(*row) for row in result.all()]
+
+
+async def list_interviewer_bookings(session: AsyncSession, interviewer_id: int, kind: str = KIND_SOBES) -> List[BookingRow]:
+    """Активные записи собеседующего по дате и времени (/my_interviews)."""
+    stmt = (
+        _select_rows()
+        .where(
+            BookingView.interviewer_id == interviewer_id,
+            BookingView.status.in_(ACTIVE_STATUSES),
+            BookingView.kind == kind,
+        )
+        .order_by(BookingView.date, BookingView.time_start)
+    )
+    result = await session.execute(stmt)
+    return [BookingRow(*row) for row in result.all()]
+
+
+async def count_active_bookings(session: AsyncSession) -> Dict[str, int]:
+    """Число активных записей по видам (статистика)."""
+    stmt = (
+        select(BookingView.kind, func.count())
+        .where(BookingView.status.in_(ACTIVE_STATUSES))
+        .group_by(BookingView.kind)
+    )
+    result = await session.execute(stmt)
+    return dict(result.all())
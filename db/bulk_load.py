@@ -0,0 +1,120 @@
+"""
+Массовая загрузка строк из Excel через COPY.
+
+Строки копируются (asyncpg copy_records_to_table) во временную таблицу,
+затем вливаются в целевую одним INSERT ... ON CONFLICT (username_norm).
+Вместо запросов на каждую строку — несколько запросов на весь файл.
+
+Правила слияния:
+- ключ — username_norm (генерируемая колонка, миграция 009); из повторов
+  в файле берётся первое вхождение;
+- строки без username сверяются с базой по name_key (например, ФИО) и
+  добавляются, только если такой записи ещё нет;
+- при update=True существующие записи обновляются (пустые значения из файла
+  не затирают заполненные), иначе пропускаются.
+"""
+from typing import Iterable, NamedTuple, Sequence, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+class BulkResult(NamedTuple):
+    inserted: int
+    updated: int
+    skipped: int
+
+
+def _name_match(left: str, right: str, name_key: Sequence[str]) -> str:
+    return ' AND '.join(
+        f"lower(coalesce({left}.{col}::text, '')) = lower(coalesce({right}.{col}::text, ''))"
+        for col in name_key
+    )
+
+
+async def bulk_upsert(
+    session: AsyncSession,
+    table: str,
+    columns: Sequence[str],
+    records: Iterable[Tuple],
+    name_key: Sequence[str] = ('full_name',),
+    update: bool = False,
+) -> BulkResult:
+    """
+    Вливает records (кортежи в порядке columns) в таблицу table.
+
+    columns должны включать telegram_username. Коммит — за вызывающим.
+    """
+    stage = f'_stage_{table}'
+    cols = ', '.join(columns)
+    src_cols = ', '.join(f'src.{col}' for col in columns)
+    rows = [tuple(record) + (row_no,) for row_no, record in enumerate(records)]
+    if not rows:
+        return BulkResult(0, 0, 0)
+
+    # Временная таблица с теми же типами колонок, живёт до конца транзакции
+    await session.execute(text(f"DROP TABLE IF EXISTS {stage}"))
+    await session.execute(text(
+        f"CREATE TEMP TABLE {stage} ON COMMIT DROP AS SELECT {cols} FROM {table} WITH NO DATA"
+    ))
+    await session.execute(text(f"ALTER TABLE {stage} ADD COLUMN row_no integer"))
+
+    connection = await session.connection()
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        stage, records=rows, columns=list(columns) + ['row_no']
+    )
+
+    name_match = _name_match('t', 'src', name_key)
+
+    # Из повторов в файле берём первое вхождение (по username, а без него — по name_key)
+    dedup_key = "coalesce(lower(ltrim(telegram_username, '@')), " + " || '|' || ".join(
+        f"lower(coalesce({col}::text, ''))" for col in name_key
+    ) + ")"
+    source = f"""
+        SELECT DISTINCT ON ({dedup_key}) *, lower(ltrim(telegram_username, '@')) AS username_norm
+        FROM {stage}
+        WHERE nullif(ltrim(coalesce(telegram_username, ''), '@'), '') IS NOT NULL
+           OR nullif({name_key[0]}::text, '') IS NOT NULL
+        ORDER BY {dedup_key}, row_no
+    """
+
+    # Строки без username, совпавшие по name_key с существующими, обновляем отдельно
+    # (до INSERT, чтобы не задеть только что добавленные)
+    updated = 0
+    if update:
+        updates = ', '.join(
+            f"{col} = coalesce(src.{col}, t.{col})"
+            for col in columns if col not in name_key and col != 'telegram_username'
+        )
+        if updates:
+            result = await session.execute(text(f"""
+                UPDATE {table} AS t SET {updates}
+                FROM ({source}) AS src
+                WHERE src.username_norm IS NULL AND {name_match}
+            """))
+            updated = max(result.rowcount or 0, 0)
+
+    if update:
+        updates = ', '.join(
+            f"{col} = coalesce(EXCLUDED.{col}, t.{col})"
+            for col in columns if col != 'telegram_username'
+        )
+        on_conflict = f"DO UPDATE SET {updates}"
+    else:
+        on_conflict = "DO NOTHING"
+
+    result = await session.execute(text(f"""
+        INSERT INTO {table} AS t ({cols})
+        SELECT {src_cols}
+        FROM ({source}) AS src
+        WHERE src.username_norm IS NOT NULL
+           OR NOT EXISTS (SELECT 1 FROM {table} t WHERE {name_match})
+        ON CONFLICT (username_norm) {on_conflict}
+        RETURNING (xmax = 0) AS inserted
+    """))
+    flags = [inserted for (inserted,) in result.all()]
+    inserted = sum(1 for flag in flags if flag)
+    updated += len(flags) - inserted
+
+    return BulkResult(inserted, updated, len(rows) - inserted - updated)
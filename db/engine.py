@@ -2,12 +2,24 @@ import os
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
 from dotenv import load_dotenv
+from .query_stats import install_query_stats
 load_dotenv()
 
 
-engine = create_async_engine(os.getenv('DB_URL'), echo=True)
+# DB_ECHO=0 отключает печать всех SQL (медленные запросы логирует db.query_stats)
+engine = create_async_engine(os.getenv('DB_URL'), echo=os.getenv('DB_ECHO', '1') == '1')
 async_session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+install_query_stats(engine)
+
+# Необязательная реплика только для чтения (тяжёлые отчёты админа), см. db.routing
+read_engine = None
+read_session_maker = None
+if os.getenv('DB_READ_URL'):
+    read_engine = create_async_engine(os.getenv('DB_READ_URL'), echo=os.getenv('DB_ECHO', '1') == '1')
+    read_session_maker = sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
+    install_query_stats(read_engine)
+
 
 class Base(DeclarativeBase):
     __abstract__ = True
\ No newline at end of file
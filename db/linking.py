@@ -0,0 +1,46 @@
+"""
+Связывание BotUser -> Person по telegram_username одним запросом.
+
+UPDATE bot_users ... FROM people по people.username_norm (миграция 009):
+сколько бы ни было пользователей, это один round-trip. Person, уже связанный
+с другим BotUser, пропускается (person_id уникален); если на одного Person
+претендуют несколько BotUser (username отличается только регистром),
+связывается первый по id.
+"""
+from typing import List, NamedTuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+class LinkedBotUser(NamedTuple):
+    bot_user_id: int
+    telegram_username: str
+    person_id: int
+    full_name: str
+
+
+_LINK_SQL = text("""
+    UPDATE bot_users AS b
+    SET person_id = m.person_id
+    FROM (
+        SELECT DISTINCT ON (p.id) b.id AS bot_user_id, p.id AS person_id, p.full_name
+        FROM bot_users b
+        JOIN people p ON p.username_norm = lower(ltrim(b.telegram_username, '@'))
+        WHERE b.person_id IS NULL
+          AND NOT EXISTS (SELECT 1 FROM bot_users linked WHERE linked.person_id = p.id)
+        ORDER BY p.id, b.id
+    ) AS m
+    WHERE b.id = m.bot_user_id
+    RETURNING b.id, b.telegram_username, m.person_id, m.full_name
+""")
+
+
+async def link_bot_users(session: AsyncSession) -> List[LinkedBotUser]:
+    """
+    Связывает всех несвязанных BotUser с Person по username.
+
+    Возвращает созданные связи. Коммит (или откат для dry-run) — за вызывающим.
+    """
+    result = await session.execute(_LINK_SQL)
+    return [LinkedBotUser(*row) for row in result.all()]
@@ -0,0 +1,68 @@
+"""
+Middleware aiogram для работы с БД
+"""
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy.orm import sessionmaker
+
+from .query_stats import current_handler
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """
+    Одна AsyncSession на апдейт, доступная хендлерам как аргумент `session`.
+
+    Сессия создаётся лениво: соединение из пула берётся только при первом
+    запросе (autobegin), поэтому апдейты без обращений к БД ничего не стоят.
+    В конце обработки открытая транзакция коммитится один раз,
+    при исключении — откатывается.
+    """
+
+    def __init__(self, session_maker: sessionmaker):
+        super().__init__()
+        self.session_maker = session_maker
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        async with self.session_maker() as session:
+            data['session'] = session
+            try:
+                result = await handler(event, data)
+            except Exception:
+                await session.rollback()
+                raise
+
+            if session.in_transaction():
+                await session.commit()
+            return result
+
+
+class HandlerContextMiddleware(BaseMiddleware):
+    """
+    Запоминает имя хендлера в contextvar current_handler на время его выполнения,
+    чтобы db.query_stats относил SQL-запросы к хендлеру.
+
+    Регистрируется как inner-middleware (там уже известен выбранный хендлер).
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get('handler')
+        callback = getattr(handler_object, 'callback', None)
+        name = getattr(callback, '__name__', None) or '-'
+
+        token = current_handler.set(name)
+        try:
+            return await handler(event, data)
+        finally:
+            current_handler.reset(token)
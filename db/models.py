@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, UniqueConstraint, ForeignKey, BigInteger, Boolean, DateTime, func
+from sqlalchemy import Column, Integer, Sequence, String, UniqueConstraint, Index, ForeignKey, BigInteger, Boolean, DateTime, Computed, JSON, Text, Float, func
 from sqlalchemy.orm import relationship
 from .engine import Base
 
@@ -7,6 +7,7 @@ class Person(Base):
 	__tablename__ = 'people'
 	__table_args__ = (
 		UniqueConstraint('telegram_username', name='uq_people_telegram_username'),
+		Index('ux_people_username_norm', 'username_norm', unique=True),
 	)
 
 	id = Column(Integer, primary_key=True, index=True)
@@ -14,6 +15,8 @@ class Person(Base):
 	course = Column(String(128), nullable=True)
 	faculty = Column(String(255), nullable=True)
 	telegram_username = Column(String(64), nullable=True)
+	# Нормализованный username (без '@', в нижнем регистре) — ключ массовой загрузки
+	username_norm = Column(String(64), Computed("lower(ltrim(telegram_username, '@'))", persisted=True))
 
 	# Связь к одному пользователю бота (если пользователь связал свою учётку)
 	bot_user = relationship('BotUser', back_populates='person', uselist=False)
@@ -44,6 +47,9 @@ class BotUser(Base):
 class CO(Base):
 	f"""Campaign / рассылка (CO) - хранит параметры рассылки, текст и метаданные."""
 	__tablename__ = 'co_campaigns'
+	__table_args__ = (
+		Index('ix_co_campaigns_faculty', 'faculty'),
+	)
 
 	id = Column(Integer, primary_key=True, index=True)
 	admin_id = Column(BigInteger, nullable=False)
@@ -58,12 +64,19 @@ class CO(Base):
 class COResponse(Base):
 	f"""Ответ пользователя на кампанию (да/нет)."""
 	__tablename__ = 'co_responses'
+	__table_args__ = (
+		Index('ix_co_responses_campaign_id_bot_user_id', 'campaign_id', 'bot_user_id'),
+		Index('ix_co_responses_bot_user_id', 'bot_user_id'),
+	)
 
-	id = Column(Integer, primary_key=True, index=True)
+	# Первичный ключ составной (id, responded_at): без явной последовательности SQLAlchemy
+	# не считает id автоинкрементным и не получает его обратно после INSERT
+	id = Column(Integer, Sequence('co_responses_id_seq'), primary_key=True, index=True)
 	campaign_id = Column(Integer, ForeignKey('co_campaigns.id'), nullable=False)
 	bot_user_id = Column(Integer, ForeignKey('bot_users.id'), nullable=False)
 	answer = Column(String(16), nullable=False)  # 'yes' / 'no'
-	responded_at = Column(DateTime(timezone=True), server_default=func.now())
+	# Ключ помесячного партиционирования (миграция 008), поэтому входит в первичный ключ
+	responded_at = Column(DateTime(timezone=True), primary_key=True, nullable=False, server_default=func.now())
 
 	campaign = relationship('CO', back_populates='responses')
 	bot_user = relationship('BotUser')
@@ -74,6 +87,8 @@ class Reserv(Base):
 	__tablename__ = 'reserv'
 	__table_args__ = (
 		UniqueConstraint('telegram_username', name='uq_reserv_telegram_username'),
+		Index('ux_reserv_username_norm', 'username_norm', unique=True),
+		Index('ix_reserv_faculty_last_answer', 'faculty', 'last_answer'),
 	)
 
 	id = Column(Integer, primary_key=True, index=True)
@@ -81,6 +96,8 @@ class Reserv(Base):
 	course = Column(String(128), nullable=True)
 	faculty = Column(String(255), nullable=True)
 	telegram_username = Column(String(64), nullable=True)
+	# Нормализованный username (без '@', в нижнем регистре) — ключ массовой загрузки
+	username_norm = Column(String(64), Computed("lower(ltrim(telegram_username, '@'))", persisted=True))
 	message_sent = Column(Boolean, default=False)  # флаг отправки сообщения
 	last_answer = Column(String(16), nullable=True)  # последний ответ: 'yes' / 'no'
 	answered_at = Column(DateTime(timezone=True), nullable=True)  # время ответа
@@ -115,6 +132,9 @@ class Interviewer(Base):
 class TimeSlot(Base):
 	f"""Временные слоты для собеседований."""
 	__tablename__ = 'time_slots'
+	__table_args__ = (
+		Index('ix_time_slots_interviewer_id_date_time_start', 'interviewer_id', 'date', 'time_start'),
+	)
 
 	id = Column(Integer, primary_key=True, index=True)
 	interviewer_id = Column(Integer, ForeignKey('interviewers.id'), nullable=False)
@@ -136,6 +156,11 @@ class TimeSlot(Base):
 class Interview(Base):
 	f"""Записи на собеседования."""
 	__tablename__ = 'interviews'
+	__table_args__ = (
+		Index('ix_interviews_bot_user_id_status', 'bot_user_id', 'status'),
+		Index('ix_interviews_interviewer_id_status', 'interviewer_id', 'status'),
+		Index('ix_interviews_status', 'status'),
+	)
 
 	id = Column(Integer, primary_key=True, index=True)
 	time_slot_id = Column(Integer, ForeignKey('time_slots.id'), nullable=False, unique=True)
@@ -163,15 +188,21 @@ class Interview(Base):
 class InterviewMessage(Base):
 	f"""Сообщения между студентом и собеседующим."""
 	__tablename__ = 'interview_messages'
+	__table_args__ = (
+		Index('ix_interview_messages_interview_id', 'interview_id'),
+		Index('ix_interview_messages_to_user_id', 'to_user_id'),
+	)
 
-	id = Column(Integer, primary_key=True, index=True)
+	# Первичный ключ составной (id, created_at) — id берётся из последовательности явно (см. COResponse)
+	id = Column(Integer, Sequence('interview_messages_id_seq'), primary_key=True, index=True)
 	interview_id = Column(Integer, ForeignKey('interviews.id'), nullable=False)
 	from_user_id = Column(BigInteger, nullable=False)  # tg_id отправителя
 	to_user_id = Column(BigInteger, nullable=False)  # tg_id получателя
 	message_text = Column(String(4000), nullable=False)
 	message_id = Column(BigInteger, nullable=True)  # ID сообщения в Telegram
 	is_read = Column(Boolean, default=False)
-	created_at = Column(DateTime(timezone=True), server_default=func.now())
+	# Ключ помесячного партиционирования (миграция 008), поэтому входит в первичный ключ
+	created_at = Column(DateTime(timezone=True), primary_key=True, nullable=False, server_default=func.now())
 
 	# Связи
 	interview = relationship('Interview', back_populates='messages')
@@ -183,6 +214,9 @@ class InterviewMessage(Base):
 class ReservTimeSlot(Base):
 	"""Временные слоты для листа 'резерв'."""
 	__tablename__ = 'reserv_time_slots'
+	__table_args__ = (
+		Index('ix_reserv_time_slots_date_time_start', 'date', 'time_start'),
+	)
 
 	id = Column(Integer, primary_key=True, index=True)
 	interviewer_id = Column(Integer, ForeignKey('interviewers.id'), nullable=False)
@@ -203,6 +237,9 @@ class ReservTimeSlot(Base):
 class ReservBooking(Base):
 	"""Записи на собеседования для листа 'резерв'."""
 	__tablename__ = 'reserv_bookings'
+	__table_args__ = (
+		Index('ix_reserv_bookings_bot_user_id_status', 'bot_user_id', 'status'),
+	)
 
 	id = Column(Integer, primary_key=True, index=True)
 	time_slot_id = Column(Integer, ForeignKey('reserv_time_slots.id'), nullable=False, unique=True)
@@ -226,6 +263,9 @@ class ReservBooking(Base):
 class FinfakTimeSlot(Base):
 	"""Временные слоты для листа 'финфак'."""
 	__tablename__ = 'finfak_time_slots'
+	__table_args__ = (
+		Index('ix_finfak_time_slots_date_time_start', 'date', 'time_start'),
+	)
 
 	id = Column(Integer, primary_key=True, index=True)
 	interviewer_id = Column(Integer, ForeignKey('interviewers.id'), nullable=False)
@@ -246,6 +286,9 @@ class FinfakTimeSlot(Base):
 class FinfakBooking(Base):
 	"""Записи на собеседования для листа 'финфак'."""
 	__tablename__ = 'finfak_bookings'
+	__table_args__ = (
+		Index('ix_finfak_bookings_bot_user_id_status', 'bot_user_id', 'status'),
+	)
 
 	id = Column(Integer, primary_key=True, index=True)
 	time_slot_id = Column(Integer, ForeignKey('finfak_time_slots.id'), nullable=False, unique=True)
@@ -271,6 +314,7 @@ class Uchastnik(Base):
 	__tablename__ = 'uchastniki'
 	__table_args__ = (
 		UniqueConstraint('telegram_username', name='uq_uchastniki_telegram_username'),
+		Index('ux_uchastniki_username_norm', 'username_norm', unique=True),
 	)
 
 	id = Column(Integer, primary_key=True, index=True)
@@ -278,8 +322,110 @@ class Uchastnik(Base):
 	course = Column(String(128), nullable=True)
 	faculty = Column(String(255), nullable=True)
 	telegram_username = Column(String(64), nullable=True)
+	# Нормализованный username (без '@', в нижнем регистре) — ключ массовой загрузки
+	username_norm = Column(String(64), Computed("lower(ltrim(telegram_username, '@'))", persisted=True))
 	tg_id = Column(BigInteger, nullable=True)  # ID из BotUser для рассылки
 	created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 	def __repr__(self) -> str:
-		return f"<Uchastnik(id={self.id!r}, full_name={self.full_name!r}, telegram={self.telegram_username!r}, tg_id={self.tg_id!r})>"
\ No newline at end of file
+		return f"<Uchastnik(id={self.id!r}, full_name={self.full_name!r}, telegram={self.telegram_username!r}, tg_id={self.tg_id!r})>"
+
+
+class CacheVersion(Base):
+	"""Версии справочных данных — для инвалидации in-process кэшей бота из скриптов импорта."""
+	__tablename__ = 'cache_versions'
+
+	name = Column(String(64), primary_key=True)  # 'people', 'reserv', ...
+	version = Column(BigInteger, nullable=False, default=0)
+	updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+	def __repr__(self) -> str:
+		return f"<CacheVersion(name={self.name!r}, version={self.version!r})>"
+
+
+class BookingView(Base):
+	"""Денормализованная витрина записей на собеседования (sobes / reserv / finfak) для экспорта и списков."""
+	__tablename__ = 'booking_view'
+	__table_args__ = (
+		UniqueConstraint('kind', 'booking_id', name='uq_booking_view_kind_booking_id'),
+		# Экспорт в WORK: активные записи вида по времени создания
+		Index(
+			'ix_booking_view_kind_status_created_at', 'kind', 'status', 'created_at',
+			postgresql_include=['candidate_name', 'faculty', 'date', 'time_start', 'time_end', 'interviewer_name', 'interviewer_sheet_id'],
+		),
+		# /my_interviews: записи собеседующего по дате и времени
+		Index(
+			'ix_booking_view_interviewer_id_status_date', 'interviewer_id', 'status', 'date', 'time_start',
+			postgresql_include=['kind', 'candidate_name', 'candidate_username', 'faculty', 'time_end'],
+		),
+	)
+
+	id = Column(Integer, primary_key=True)
+	kind = Column(String(16), nullable=False)  # 'sobes' / 'reserv' / 'finfak'
+	booking_id = Column(Integer, nullable=False)  # id в interviews / reserv_bookings / finfak_bookings
+	status = Column(String(20), nullable=False)
+	candidate_name = Column(String(255), nullable=False)
+	candidate_username = Column(String(64), nullable=True)  # без '@'
+	faculty = Column(String(255), nullable=True)
+	date = Column(String(10), nullable=True)  # Формат: YYYY-MM-DD
+	time_start = Column(String(5), nullable=True)  # Формат: HH:MM
+	time_end = Column(String(5), nullable=True)  # Формат: HH:MM
+	interviewer_id = Column(Integer, nullable=False)
+	interviewer_name = Column(String(255), nullable=True)
+	interviewer_username = Column(String(64), nullable=True)
+	interviewer_sheet_id = Column(String(64), nullable=True)
+	interviewer_tg_id = Column(BigInteger, nullable=True)
+	created_at = Column(DateTime(timezone=True), nullable=True)  # время создания записи
+	updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+	def __repr__(self) -> str:
+		return f"<BookingView(kind={self.kind!r}, booking_id={self.booking_id!r}, status={self.status!r})>"
+
+
+class SheetOutbox(Base):
+	"""Очередь экспорта в Google Sheets: пишется в одной транзакции с записью, отправляется фоновым relay."""
+	__tablename__ = 'sheet_outbox'
+	__table_args__ = (
+		UniqueConstraint('idempotency_key', name='uq_sheet_outbox_idempotency_key'),
+		Index('ix_sheet_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),
+	)
+
+	id = Column(Integer, primary_key=True)
+	idempotency_key = Column(String(128), nullable=False)  # например 'sobes:15:work'
+	kind = Column(String(32), nullable=False)  # work_append / reserv_matrix / reserv_all / finfak_matrix / finfak_all
+	payload = Column(JSON, nullable=False)
+	status = Column(String(16), nullable=False, default='pending')  # pending / processing / done / failed
+	attempts = Column(Integer, nullable=False, default=0)
+	next_attempt_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+	last_error = Column(Text, nullable=True)
+	created_at = Column(DateTime(timezone=True), server_default=func.now())
+	processed_at = Column(DateTime(timezone=True), nullable=True)
+
+	def __repr__(self) -> str:
+		return f"<SheetOutbox(id={self.id!r}, key={self.idempotency_key!r}, status={self.status!r})>"
+
+
+class SheetsQuota(Base):
+	"""Общее ведро токенов квоты Google Sheets для нескольких процессов (SHEETS_QUOTA_DB, utils/sheets_quota.py)."""
+	__tablename__ = 'sheets_quota'
+
+	bucket = Column(String(16), primary_key=True)  # read / write
+	tokens = Column(Float, nullable=False)
+	updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+	def __repr__(self) -> str:
+		return f"<SheetsQuota(bucket={self.bucket!r}, tokens={self.tokens!r})>"
+
+
+class SheetSyncState(Base):
+	"""Хэши листов и строк собеседующих с прошлой синхронизации слотов (utils/slot_sync.py)."""
+	__tablename__ = 'sheet_sync_state'
+
+	source = Column(String(32), primary_key=True)  # schedule / резерв / финфак
+	sheet_name = Column(String(64), primary_key=True)
+	content_hash = Column(String(40), nullable=False)  # хэш всех строк листа
+	row_hashes = Column(JSON, nullable=False)  # ID собеседующего -> хэш его слотов на листе
+	synced_at = Column(DateTime(timezone=True), server_default=func.now())
+
+	def __repr__(self) -> str:
+		return f"<SheetSyncState(source={self.source!r}, sheet_name={self.sheet_name!r})>"
@@ -0,0 +1,127 @@
+"""
+Помесячные партиции co_responses и interview_messages (миграция 008).
+
+- ensure_partitions создаёт партиции на текущий и следующие месяцы
+  (фоновый partition_keeper — при старте бота и раз в PARTITION_CHECK_INTERVAL,
+  а также скрипт архивации). Строки, успевшие лечь в {таблица}_default,
+  переносятся в новую партицию (функция ensure_monthly_partition, миграция 014);
+- season_filter ограничивает запрос текущим сезоном, чтобы PostgreSQL
+  читал только его партиции (partition pruning);
+- старые сезоны выгружает и удаляет scripts/archive_partitions.py.
+"""
+import asyncio
+import os
+import re
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.engine import async_session_maker
+
+
+# Партиционированная таблица -> колонка партиционирования
+PARTITIONED_TABLES = {
+    'co_responses': 'responded_at',
+    'interview_messages': 'created_at',
+}
+
+# На сколько месяцев вперёд держать готовые партиции
+PARTITION_MONTHS_AHEAD = int(os.getenv('PARTITION_MONTHS_AHEAD', '2'))
+# Как часто проверять партиции, пока бот работает (секунды)
+PARTITION_CHECK_INTERVAL = float(os.getenv('PARTITION_CHECK_INTERVAL', str(24 * 60 * 60)))
+
+# Начало текущего сезона набора (YYYY-MM-DD). Если не задано — последние SEASON_DAYS дней
+SEASON_START = os.getenv('SEASON_START')
+SEASON_DAYS = int(os.getenv('SEASON_DAYS', '183'))
+
+_PARTITION_RE = re.compile(r'^(?P<parent>[a-z_]+)_(?P<year>\d{4})_(?P<month>\d{2})$')
+
+
+def season_start() -> datetime:
+    """Начало текущего сезона (UTC)."""
+    if SEASON_START:
+        return datetime.strptime(SEASON_START, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+    return datetime.now(timezone.utc) - timedelta(days=SEASON_DAYS)
+
+
+def season_filter(column):
+    """Условие «строка из текущего сезона» по колонке партиционирования."""
+    return column >= season_start()
+
+
+def _add_months(value: date, months: int) -> date:
+    month_index = value.year * 12 + value.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+async def ensure_partitions(session: AsyncSession, months_ahead: int = PARTITION_MONTHS_AHEAD) -> List[str]:
+    """Создаёт недостающие партиции с текущего месяца на months_ahead вперёд."""
+    first_month = date.today().replace(day=1)
+    created = []
+    for table in PARTITIONED_TABLES:
+        for offset in range(months_ahead + 1):
+            result = await session.execute(
+                text("SELECT ensure_monthly_partition(:parent, :month)"),
+                {'parent': table, 'month': _add_months(first_month, offset)},
+            )
+            created.append(result.scalar())
+    await session.commit()
+    return created
+
+
+async def list_monthly_partitions(session: AsyncSession, table: str) -> List[Tuple[str, date]]:
+    """Помесячные партиции таблицы: (имя, первый день месяца), по возрастанию."""
+    result = await session.execute(text("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = :table
+    """), {'table': table})
+
+    partitions = []
+    for (name,) in result.all():
+        match = _PARTITION_RE.match(name)
+        if match and match.group('parent') == table:
+            partitions.append((name, date(int(match.group('year')), int(match.group('month')), 1)))
+    return sorted(partitions, key=lambda item: item[1])
+
+
+class PartitionKeeper:
+    """Создаёт партиции при старте бота и затем раз в PARTITION_CHECK_INTERVAL."""
+
+    def __init__(self, interval: float = PARTITION_CHECK_INTERVAL):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self) -> None:
+        try:
+            async with async_session_maker() as session:
+                await ensure_partitions(session)
+        except Exception as e:
+            # Без новой партиции строки лягут в *_default — бот от этого не должен падать
+            print(f"⚠️ Не удалось создать партиции: {e}")
+
+    async def start(self) -> None:
+        await self.run_once()
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.run_once()
+
+
+partition_keeper = PartitionKeeper()
@@ -0,0 +1,90 @@
+"""
+Лёгкие запросы для списков и отчётов.
+
+Отчёты читают тысячи строк, но используют два-три поля. Вместо ORM-объектов
+(identity map, состояние экземпляров) здесь Core select по нужным колонкам,
+результат — именованные кортежи.
+"""
+from typing import List, NamedTuple, Optional
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import Person, BotUser, Reserv
+
+
+class PersonListing(NamedTuple):
+    full_name: str
+    faculty: Optional[str]
+    telegram_username: Optional[str]
+    in_bot: bool
+
+
+class BotUserListing(NamedTuple):
+    full_name: str
+    faculty: Optional[str]
+    telegram_username: Optional[str]  # username из BotUser
+
+
+class ReservListing(NamedTuple):
+    full_name: str
+    faculty: Optional[str]
+    telegram_username: Optional[str]
+    in_bot: bool
+
+
+class ReservAnswer(NamedTuple):
+    faculty: str
+    answer: str  # 'yes' / 'no'
+    full_name: str
+    telegram_username: Optional[str]
+
+
+async def list_people_with_bot_status(session: AsyncSession) -> List[PersonListing]:
+    """Люди с факультетом и признаком «есть в боте», по факультету и ФИО."""
+    stmt = (
+        select(Person.full_name, Person.faculty, Person.telegram_username, BotUser.id.isnot(None))
+        .outerjoin(BotUser, BotUser.person_id == Person.id)
+        .where(Person.faculty.isnot(None))
+        .order_by(Person.faculty, Person.full_name)
+    )
+    result = await session.execute(stmt)
+    return [PersonListing(*row) for row in result.all()]
+
+
+async def list_linked_bot_users(session: AsyncSession) -> List[BotUserListing]:
+    """Пользователи бота, связанные с Person, по ФИО."""
+    stmt = (
+        select(Person.full_name, Person.faculty, BotUser.telegram_username)
+        .join(Person, BotUser.person_id == Person.id)
+        .order_by(Person.full_name)
+    )
+    result = await session.execute(stmt)
+    return [BotUserListing(*row) for row in result.all()]
+
+
+async def list_reserv_with_bot_status(session: AsyncSession) -> List[ReservListing]:
+    """Записи Reserv с username и признаком «есть в боте» (username без учёта регистра)."""
+    # Некоррелированный IN: PostgreSQL один раз строит хэш username'ов бота (hashed SubPlan),
+    # а не сканирует bot_users для каждой строки reserv
+    in_bot = func.lower(Reserv.telegram_username).in_(
+        select(func.lower(BotUser.telegram_username)).where(BotUser.telegram_username.isnot(None))
+    )
+    stmt = (
+        select(Reserv.full_name, Reserv.faculty, Reserv.telegram_username, in_bot)
+        .where(Reserv.telegram_username.isnot(None))
+        .order_by(Reserv.id)
+    )
+    result = await session.execute(stmt)
+    return [ReservListing(*row) for row in result.all()]
+
+
+async def list_reserv_answers(session: AsyncSession) -> List[ReservAnswer]:
+    """Все ответы Да/Нет из Reserv одним запросом, по факультету и ФИО."""
+    stmt = (
+        select(Reserv.faculty, Reserv.last_answer, Reserv.full_name, Reserv.telegram_username)
+        .where(Reserv.faculty.isnot(None), Reserv.last_answer.in_(['yes', 'no']))
+        .order_by(Reserv.faculty, Reserv.full_name)
+    )
+    result = await session.execute(stmt)
+    return [ReservAnswer(*row) for row in result.all()]
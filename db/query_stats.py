@@ -0,0 +1,128 @@
+"""
+Статистика SQL-запросов по хендлерам и лог медленных запросов.
+
+Хуки before/after_cursor_execute на движке замеряют каждый запрос:
+отпечаток (текст без литералов), длительность, число строк и хендлер aiogram,
+из которого запрос выполнен (contextvar current_handler ставит HandlerContextMiddleware).
+Запросы дольше SLOW_QUERY_MS печатаются в лог. Сводка — команда /db_stats.
+"""
+import os
+import re
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+
+# Порог медленного запроса (миллисекунды)
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '200'))
+
+# Хендлер, выполняющий запрос ('-' — вне хендлеров: скрипты, фоновые задачи)
+current_handler: ContextVar[str] = ContextVar('current_handler', default='-')
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PARAM_RE = re.compile(r'\$\d+|%\([^)]+\)s|%s|(?<!:):\w+')
+_IN_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACES_RE = re.compile(r'\s+')
+
+
+def fingerprint(statement: str) -> str:
+    """Нормализованный текст запроса: литералы и параметры заменены на '?'."""
+    value = _STRING_RE.sub('?', statement)
+    value = _PARAM_RE.sub('?', value)
+    value = _NUMBER_RE.sub('?', value)
+    value = _IN_LIST_RE.sub('(?...)', value)
+    return _SPACES_RE.sub(' ', value).strip()
+
+
+class _Counter:
+    __slots__ = ('count', 'total_ms', 'max_ms', 'rows')
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+
+    def add(self, duration_ms: float, rows: int) -> None:
+        self.count += 1
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+        self.rows += rows
+
+
+class QueryStats:
+    """Агрегаты по хендлерам и по отпечаткам запросов с момента запуска/сброса."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self.by_handler: Dict[str, _Counter] = {}
+        self.by_fingerprint: Dict[str, _Counter] = {}
+        self.slow_count = 0
+        self.started_at = time.time()
+
+    def record(self, handler: str, statement: str, duration_ms: float, rows: int) -> None:
+        self.by_handler.setdefault(handler, _Counter()).add(duration_ms, rows)
+        self.by_fingerprint.setdefault(fingerprint(statement), _Counter()).add(duration_ms, rows)
+        if duration_ms >= SLOW_QUERY_MS:
+            self.slow_count += 1
+            print(f"[SLOW SQL] {duration_ms:.0f} мс, строк: {rows}, хендлер: {handler}\n{statement}")
+
+    def top_handlers(self, limit: int = 10) -> List[Tuple[str, _Counter]]:
+        return sorted(self.by_handler.items(), key=lambda item: item[1].total_ms, reverse=True)[:limit]
+
+    def top_fingerprints(self, limit: int = 10) -> List[Tuple[str, _Counter]]:
+        return sorted(self.by_fingerprint.items(), key=lambda item: item[1].total_ms, reverse=True)[:limit]
+
+    def format_report(self, limit: int = 10) -> str:
+        minutes = (time.time() - self.started_at) / 60
+        lines = [f'🗄 Статистика SQL за {minutes:.0f} мин', f'Медленных запросов (≥ {SLOW_QUERY_MS:.0f} мс): {self.slow_count}', '']
+
+        lines.append('👤 Хендлеры (по суммарному времени):')
+        if not self.by_handler:
+            lines.append('  нет данных')
+        for handler, counter in self.top_handlers(limit):
+            lines.append(
+                f'  • {handler}: {counter.count} запросов, {counter.total_ms:.0f} мс, '
+                f'макс. {counter.max_ms:.0f} мс, строк: {counter.rows}'
+            )
+        lines.append('')
+
+        lines.append('🔎 Запросы (по суммарному времени):')
+        if not self.by_fingerprint:
+            lines.append('  нет данных')
+        for query, counter in self.top_fingerprints(limit):
+            if len(query) > 150:
+                query = query[:150] + '…'
+            lines.append(f'  • {counter.count}× {counter.total_ms:.0f} мс (макс. {counter.max_ms:.0f} мс)')
+            lines.append(f'    {query}')
+
+        return '\n'.join(lines)
+
+
+query_stats = QueryStats()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start_times = conn.info.get('query_start_time')
+    if not start_times:
+        return
+    duration_ms = (time.perf_counter() - start_times.pop()) * 1000
+    # Для SELECT драйвер может не знать число строк до выборки (-1)
+    rows = max(getattr(cursor, 'rowcount', -1) or 0, 0)
+    query_stats.record(current_handler.get(), statement, duration_ms, rows)
+
+
+def install_query_stats(engine: AsyncEngine) -> None:
+    """Подключает хуки статистики к движку."""
+    event.listen(engine.sync_engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine.sync_engine, 'after_cursor_execute', _after_cursor_execute)
@@ -0,0 +1,72 @@
+"""
+Регистрация пользователя бота (/start, /CO) одним запросом.
+
+INSERT INTO bot_users ... ON CONFLICT (tg_id) DO UPDATE, Person находится в CTE
+по people.username_norm (миграция 009). Повторный /start без изменений не
+переписывает строку: WHERE в DO UPDATE отсекает пустое обновление, а существующая
+запись возвращается из того же запроса.
+
+Связь с Person только добавляется или меняется на найденную по username;
+без username пользователь регистрируется без связи. Person, уже связанный
+с другим пользователем бота, не перепривязывается (person_id уникален).
+"""
+from typing import NamedTuple, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+class Registration(NamedTuple):
+    bot_user_id: int
+    person_id: Optional[int]
+    full_name: Optional[str]  # ФИО связанного Person
+    created: bool  # пользователь зарегистрирован этим запросом
+    changed: bool  # запись создана или изменена (username / связь с Person)
+
+
+_REGISTER_SQL = text("""
+    WITH person AS (
+        SELECT p.id
+        FROM people p
+        WHERE p.username_norm = CAST(:username AS varchar)
+          AND NOT EXISTS (
+              SELECT 1 FROM bot_users linked
+              WHERE linked.person_id = p.id AND linked.tg_id <> :tg_id
+          )
+    ),
+    upsert AS (
+        INSERT INTO bot_users (tg_id, telegram_username, person_id)
+        VALUES (:tg_id, :username, (SELECT id FROM person))
+        ON CONFLICT (tg_id) DO UPDATE SET
+            telegram_username = coalesce(EXCLUDED.telegram_username, bot_users.telegram_username),
+            person_id = coalesce(EXCLUDED.person_id, bot_users.person_id)
+        WHERE bot_users.telegram_username IS DISTINCT FROM coalesce(EXCLUDED.telegram_username, bot_users.telegram_username)
+           OR bot_users.person_id IS DISTINCT FROM coalesce(EXCLUDED.person_id, bot_users.person_id)
+        RETURNING id, person_id, (xmax = 0) AS created
+    ),
+    registered AS (
+        SELECT id, person_id, created, true AS changed FROM upsert
+        UNION ALL
+        SELECT b.id, b.person_id, false, false
+        FROM bot_users b
+        WHERE b.tg_id = :tg_id AND NOT EXISTS (SELECT 1 FROM upsert)
+    )
+    SELECT r.id, r.person_id, p.full_name, r.created, r.changed
+    FROM registered r
+    LEFT JOIN people p ON p.id = r.person_id
+""")
+
+
+def normalize_username(raw_username: Optional[str]) -> Optional[str]:
+    """Username без ведущего @ в нижнем регистре (None, если пустой)."""
+    if not raw_username:
+        return None
+    return str(raw_username).strip().lstrip('@').lower() or None
+
+
+async def register_bot_user(session: AsyncSession, tg_id: int, raw_username: Optional[str]) -> Registration:
+    """Создаёт или обновляет BotUser и связь с Person. Коммит — за вызывающим."""
+    result = await session.execute(
+        _REGISTER_SQL, {'tg_id': tg_id, 'username': normalize_username(raw_username)}
+    )
+    return Registration(*result.one())
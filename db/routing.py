@@ -0,0 +1,83 @@
+"""
+Маршрутизация тяжёлых отчётов на реплику только для чтения.
+
+Если задан DB_READ_URL, отчёты админа (report_session) читают с реплики, чтобы
+не нагружать основную БД, на которой идут записи на собеседования.
+Перед использованием реплики проверяется её отставание; если оно больше
+DB_READ_MAX_LAG секунд или реплика недоступна — запрос уходит на основную БД.
+Результат проверки кэшируется на DB_READ_LAG_CHECK_SECONDS.
+"""
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .engine import async_session_maker, read_session_maker
+
+
+# Допустимое отставание реплики (секунды)
+READ_MAX_LAG = float(os.getenv('DB_READ_MAX_LAG', '30'))
+
+# Как часто перепроверять отставание (секунды)
+LAG_CHECK_INTERVAL = float(os.getenv('DB_READ_LAG_CHECK_SECONDS', '5'))
+
+# Отставание реплики: 0, если всё полученное уже применено (нет новых записей на основной БД)
+_LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+
+class ReplicaRouter:
+    """Выбирает реплику или основную БД для отчётов."""
+
+    def __init__(self, max_lag: float = READ_MAX_LAG, check_interval: float = LAG_CHECK_INTERVAL):
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.last_lag: Optional[float] = None
+        self._usable = False
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def _check_replica(self) -> bool:
+        try:
+            async with read_session_maker() as session:
+                lag = float((await session.execute(_LAG_QUERY)).scalar() or 0)
+        except Exception as e:
+            print(f"⚠️ Реплика недоступна, отчёты идут на основную БД: {e}")
+            self.last_lag = None
+            return False
+
+        self.last_lag = lag
+        if lag > self.max_lag:
+            print(f"⚠️ Реплика отстаёт на {lag:.1f} с (допустимо {self.max_lag:.0f} с), отчёты идут на основную БД")
+            return False
+        return True
+
+    async def replica_usable(self) -> bool:
+        if read_session_maker is None:
+            return False
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            async with self._lock:
+                if time.monotonic() - self._checked_at >= self.check_interval:
+                    self._usable = await self._check_replica()
+                    self._checked_at = time.monotonic()
+        return self._usable
+
+    @asynccontextmanager
+    async def report_session(self) -> AsyncIterator[AsyncSession]:
+        """Сессия для отчётов только на чтение: реплика, если она свежая, иначе основная БД."""
+        session_maker = read_session_maker if await self.replica_usable() else async_session_maker
+        async with session_maker() as session:
+            yield session
+
+
+replica_router = ReplicaRouter()
+report_session = replica_router.report_session
@@ -0,0 +1,140 @@
+"""
+Материализованные представления статистики рассылок (миграция 007).
+
+faculty_campaign_stats — получатели и ответы CO по факультету и кампании
+(campaign_id = 0 — все кампании факультета), faculty_reserv_stats — то же для Reserv.
+Команды статистики читают одну маленькую таблицу вместо десятка запросов на факультет.
+
+Обновление: хендлеры ответов вызывают stats_refresher.mark_dirty(...); через
+STATS_REFRESH_DELAY секунд представление обновляется (REFRESH ... CONCURRENTLY,
+чтение при этом не блокируется). Несколько ответов подряд дают одно обновление.
+Команды статистики перед чтением вызывают refresh_if_dirty, чтобы не ждать таймер.
+"""
+import asyncio
+import os
+from typing import Dict, List, NamedTuple
+
+from sqlalchemy import select, text, table, column
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .engine import engine
+
+
+CAMPAIGN_STATS = 'faculty_campaign_stats'
+RESERV_STATS = 'faculty_reserv_stats'
+_VIEWS = (CAMPAIGN_STATS, RESERV_STATS)
+
+# Задержка перед обновлением после изменения данных (секунды)
+STATS_REFRESH_DELAY = float(os.getenv('STATS_REFRESH_DELAY', '10'))
+
+# campaign_id = 0 — итог по всем кампаниям факультета
+ALL_CAMPAIGNS = 0
+
+
+faculty_campaign_stats = table(
+    CAMPAIGN_STATS,
+    column('faculty'), column('campaign_id'), column('recipients'),
+    column('yes_count'), column('no_count'), column('answered_count'),
+    column('yes_names'), column('no_names'),
+)
+
+faculty_reserv_stats = table(
+    RESERV_STATS,
+    column('faculty'), column('total'), column('sent'),
+    column('yes_count'), column('no_count'),
+    column('yes_names'), column('no_names'),
+)
+
+
+class CampaignStats(NamedTuple):
+    faculty: str
+    recipients: int
+    yes_count: int
+    no_count: int
+    answered_count: int
+    yes_names: List[str]
+    no_names: List[str]
+
+
+class ReservStats(NamedTuple):
+    faculty: str
+    total: int
+    sent: int
+    yes_count: int
+    no_count: int
+    yes_names: List[str]
+    no_names: List[str]
+
+
+async def load_campaign_stats(session: AsyncSession, campaign_id: int = ALL_CAMPAIGNS) -> List[CampaignStats]:
+    """Статистика CO по факультетам (по всем кампаниям или по одной)."""
+    t = faculty_campaign_stats.c
+    stmt = (
+        select(t.faculty, t.recipients, t.yes_count, t.no_count, t.answered_count, t.yes_names, t.no_names)
+        .where(t.campaign_id == campaign_id)
+        .order_by(t.faculty)
+    )
+    result = await session.execute(stmt)
+    return [CampaignStats(*row) for row in result.all()]
+
+
+async def load_reserv_stats(session: AsyncSession) -> List[ReservStats]:
+    """Статистика Reserv по факультетам."""
+    t = faculty_reserv_stats.c
+    stmt = (
+        select(t.faculty, t.total, t.sent, t.yes_count, t.no_count, t.yes_names, t.no_names)
+        .order_by(t.faculty)
+    )
+    result = await session.execute(stmt)
+    return [ReservStats(*row) for row in result.all()]
+
+
+async def refresh_stats_view(view: str) -> None:
+    """Обновляет представление без блокировки чтения (используется и скриптами импорта)."""
+    if view not in _VIEWS:
+        raise ValueError(f'Неизвестное представление статистики: {view}')
+    async with engine.begin() as conn:
+        await conn.execute(text(f'REFRESH MATERIALIZED VIEW CONCURRENTLY {view}'))
+
+
+class StatsViewRefresher:
+    """Отложенное обновление представлений: много изменений — одно обновление."""
+
+    def __init__(self, delay: float = STATS_REFRESH_DELAY):
+        self.delay = delay
+        self._dirty = set()
+        self._scheduled: Dict[str, asyncio.Task] = {}
+        self._locks: Dict[str, asyncio.Lock] = {view: asyncio.Lock() for view in _VIEWS}
+
+    def mark_dirty(self, *views: str) -> None:
+        """Данные изменились — запланировать обновление представлений."""
+        for view in views:
+            self._dirty.add(view)
+            task = self._scheduled.get(view)
+            if task is None or task.done():
+                self._scheduled[view] = asyncio.get_running_loop().create_task(self._delayed_refresh(view))
+
+    async def _delayed_refresh(self, view: str) -> None:
+        await asyncio.sleep(self.delay)
+        try:
+            await self.refresh_if_dirty(view)
+        except Exception as e:
+            print(f"⚠️ Не удалось обновить {view}: {e}")
+
+    async def refresh_if_dirty(self, view: str) -> None:
+        """Обновляет представление, если с прошлого обновления были изменения."""
+        if view not in self._dirty:
+            return
+        async with self._locks[view]:
+            if view not in self._dirty:
+                return
+            # Снимаем флаг до обновления: изменения во время REFRESH снова его поставят
+            self._dirty.discard(view)
+            try:
+                await refresh_stats_view(view)
+            except Exception:
+                self._dirty.add(view)
+                raise
+
+
+stats_refresher = StatsViewRefresher()
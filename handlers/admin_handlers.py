@@ -1,5 +1,5 @@
 from aiogram import Router, Bot, types
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.fsm.context import FSMContext
@@ -9,15 +9,26 @@ from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
 import asyncio
 import pandas as pd
 from pathlib import Path
-from sqlalchemy import select, func
+from sqlalchemy import select, func, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import ADMIN_ID
 from db.engine import async_session_maker
+from db.routing import report_session
+from db.queries import list_reserv_with_bot_status, list_reserv_answers
+from db.partitions import season_filter
+from db.stats_views import stats_refresher, load_campaign_stats, load_reserv_stats, CAMPAIGN_STATS, RESERV_STATS
 from db.models import CO, COResponse, Person, BotUser, Reserv, Uchastnik
+from utils.identity_cache import identity_cache
+from utils.reference_cache import get_person_faculties, get_reserv_faculties, get_faculty_person_counts, get_reserv_faculty_counts
+from utils.db_report import build_index_report
+from db.query_stats import query_stats
+from utils.sheet_outbox import sheet_outbox_relay, get_outbox_summary, retry_failed, format_outbox_summary
+from utils.sheets_quota import sheets_quota
+from utils.sheets_client import sheets_breaker, retry_budget
 
 
 admin_router = Router()
 
-ADMIN_ID = 922109605
-
 
 MAX_RATE_LIMIT_RETRIES = 5
 
@@ -92,6 +103,20 @@ async def safe_send_file(bot: Bot, chat_id: int, text: str | None, file: dict):
             await asyncio.sleep(0.5)
 
 
+async def _mark_reserv_sent(session: AsyncSession, usernames: list[str]):
+    """Помечает записи Reserv с указанными username (lowercase) как получившие рассылку."""
+    if not usernames:
+        return
+    await session.execute(
+        update(Reserv)
+        .where(func.lower(Reserv.telegram_username).in_(usernames))
+        .values(message_sent=True)
+        .execution_options(synchronize_session=False)
+    )
+    await session.commit()
+    stats_refresher.mark_dirty(RESERV_STATS)
+
+
 class COCreateStates(StatesGroup):
     waiting_faculty = State()
     waiting_presence = State()
@@ -141,9 +166,7 @@ async def create_rass(message: types.Message, state: FSMContext):
         return
 
     async with async_session_maker() as session:
-        stmt = select(Person.faculty).distinct()
-        res = await session.execute(stmt)
-        faculties = [row[0] for row in res.all() if row[0]]
+        faculties = await get_person_faculties(session)
 
     if not faculties:
         await message.answer('Нет записей с факультетами в базе.')
@@ -159,12 +182,13 @@ async def create_rass(message: types.Message, state: FSMContext):
 
 
 @admin_router.callback_query(lambda c: c.data and c.data.startswith('co_faculty:'))
-async def faculty_chosen(callback: types.CallbackQuery, state: FSMContext):
+async def faculty_chosen(callback: types.CallbackQuery, state: FSMContext, session: AsyncSession):
     if callback.from_user.id != ADMIN_ID:
         await callback.answer('Нет доступа', show_alert=True)
         return
 
     _, faculty = callback.data.split(':', 1)
+    faculty_counts = await get_faculty_person_counts(session)
     await state.update_data(faculty=faculty)
     await state.set_state(COCreateStates.waiting_presence)
 
@@ -175,7 +199,12 @@ async def faculty_chosen(callback: types.CallbackQuery, state: FSMContext):
     )
     kb = kb.as_markup()
 
-    await callback.message.answer(f'Выбран факультет: {faculty}\nЭто рассылка для присутствия?', reply_markup=kb)
+    await callback.message.answer(
+        f'Выбран факультет: {faculty}\n'
+        f'Людей в базе: {faculty_counts.get(faculty, 0)}\n'
+        f'Это рассылка для присутствия?',
+        reply_markup=kb
+    )
     await callback.answer()
 
 
@@ -252,9 +281,7 @@ async def dodep_start(message: types.Message, state: FSMContext):
         return
 
     async with async_session_maker() as session:
-        stmt = select(Person.faculty).distinct()
-        res = await session.execute(stmt)
-        faculties = [row[0] for row in res.all() if row[0]]
+        faculties = await get_person_faculties(session)
 
     if not faculties:
         await message.answer('Нет записей с факультетами в базе.')
@@ -299,8 +326,8 @@ async def dodep_send(message: types.Message, state: FSMContext):
         await session.commit()
         await session.refresh(campaign)
 
-        # subquery: bot_user ids who already have a response for any campaign of this faculty
-        subq = select(COResponse.bot_user_id).join(CO, COResponse.campaign_id == CO.id).where(CO.faculty == faculty).distinct()
+        # subquery: bot_user ids who already have a response for any campaign of this faculty (current season)
+        subq = select(COResponse.bot_user_id).join(CO, COResponse.campaign_id == CO.id).where(CO.faculty == faculty, season_filter(COResponse.responded_at)).distinct()
 
         # получатели: BotUser связанный с Person данного факультета и НЕ в subq
         stmt = select(BotUser).join(Person, BotUser.person_id == Person.id).where(Person.faculty == faculty, ~BotUser.id.in_(subq))
@@ -373,7 +400,7 @@ async def receive_all_text(message: types.Message, state: FSMContext):
 
 
 @admin_router.callback_query(lambda c: c.data and c.data.startswith('co_answer:'))
-async def handle_answer(callback: types.CallbackQuery):
+async def handle_answer(callback: types.CallbackQuery, session: AsyncSession):
     # Студент нажал Да/Нет
     try:
         _, campaign_id_str, answer = callback.data.split(':', 2)
@@ -384,27 +411,26 @@ async def handle_answer(callback: types.CallbackQuery):
 
     tg_id = callback.from_user.id
 
-    async with async_session_maker() as session:
-        # найти bot_user
-        stmt = select(BotUser).where(BotUser.tg_id == tg_id)
-        res = await session.execute(stmt)
-        bot_user = res.scalars().first()
-        if not bot_user:
-            await callback.answer('Ваша учётная запись не связана с базой.', show_alert=True)
-            return
+    # найти bot_user (через кэш идентификации)
+    identity = await identity_cache.get(session, tg_id)
+    if not identity:
+        await callback.answer('Ваша учётная запись не связана с базой.', show_alert=True)
+        return
 
-        # проверить есть ли уже ответ для этой кампании от этого пользователя
-        stmt2 = select(COResponse).where(COResponse.campaign_id == campaign_id, COResponse.bot_user_id == bot_user.id)
-        res2 = await session.execute(stmt2)
-        resp = res2.scalars().first()
-        if resp:
-            resp.answer = answer
-            session.add(resp)
-            await session.commit()
-        else:
-            new = COResponse(campaign_id=campaign_id, bot_user_id=bot_user.id, answer=answer)
-            session.add(new)
-            await session.commit()
+    # проверить есть ли уже ответ для этой кампании от этого пользователя
+    # (без season_filter: ответ, данный до начала сезона, тоже надо обновить, а не дублировать)
+    stmt2 = select(COResponse).where(
+        COResponse.campaign_id == campaign_id,
+        COResponse.bot_user_id == identity.bot_user_id,
+    )
+    res2 = await session.execute(stmt2)
+    resp = res2.scalars().first()
+    if resp:
+        resp.answer = answer
+    else:
+        session.add(COResponse(campaign_id=campaign_id, bot_user_id=identity.bot_user_id, answer=answer))
+    await session.commit()
+    stats_refresher.mark_dirty(CAMPAIGN_STATS)
 
     # Попытаемся отредактировать исходное сообщение: убрать кнопки и показать подтверждение
     try:
@@ -424,68 +450,28 @@ async def get_stats(message: types.Message):
         await message.answer(f"⛔ Нет доступа. Ваш ID: {message.from_user.id}, нужен: {ADMIN_ID}")
         return
 
-    async with async_session_maker() as session:
-        stmt = select(Person.faculty).distinct()
-        res = await session.execute(stmt)
-        faculties = [row[0] for row in res.all() if row[0]]
+    # Свежие данные, если с прошлого обновления были ответы
+    await stats_refresher.refresh_if_dirty(CAMPAIGN_STATS)
 
-        if not faculties:
-            await message.answer('В базе нет факультетов для отчёта.')
-            return
+    async with report_session() as session:
+        faculty_stats = await load_campaign_stats(session)
 
-        for faculty in faculties:
-            # сколько связанных BotUser у этого факультета
-            rec_stmt = select(func.count(BotUser.id)).join(Person, BotUser.person_id == Person.id).where(Person.faculty == faculty)
-            rec_res = await session.execute(rec_stmt)
-            recipients = rec_res.scalar() or 0
-
-            # уникальные ответы 'yes'
-            yes_stmt = select(func.count(func.distinct(COResponse.bot_user_id))).join(CO, COResponse.campaign_id == CO.id).where(CO.faculty == faculty, COResponse.answer == 'yes')
-            yes_res = await session.execute(yes_stmt)
-            yes_count = yes_res.scalar() or 0
-
-            # уникальные ответы 'no'
-            no_stmt = select(func.count(func.distinct(COResponse.bot_user_id))).join(CO, COResponse.campaign_id == CO.id).where(CO.faculty == faculty, COResponse.answer == 'no')
-            no_res = await session.execute(no_stmt)
-            no_count = no_res.scalar() or 0
-
-            # количество тех, кто НЕ ответил: связанные BotUser у этого факультета без записи в COResponse для этой факультеты
-            # считаем связанных BotUser
-            total_stmt = select(func.count(BotUser.id)).join(Person, BotUser.person_id == Person.id).where(Person.faculty == faculty)
-            total_res = await session.execute(total_stmt)
-            total_linked = total_res.scalar() or 0
-
-            # те, у кого есть ответы (yes или no) для этой факультеты
-            answered_stmt = select(func.count(func.distinct(COResponse.bot_user_id))).join(CO, COResponse.campaign_id == CO.id).where(CO.faculty == faculty)
-            answered_res = await session.execute(answered_stmt)
-            answered_count = answered_res.scalar() or 0
-
-            not_answered = total_linked - answered_count
-
-            # Списки ФИО (или фамилий) проголосовавших 'yes' и 'no'
-            # Получаем full_name из Person через BotUser
-            yes_names = []
-            no_names = []
-
-            yes_names_stmt = select(Person.full_name).join(BotUser, BotUser.person_id == Person.id).join(COResponse, COResponse.bot_user_id == BotUser.id).join(CO, COResponse.campaign_id == CO.id).where(CO.faculty == faculty, COResponse.answer == 'yes')
-            yes_names_res = await session.execute(yes_names_stmt)
-            yes_names = [r[0] for r in yes_names_res.fetchall() if r[0]]
-
-            no_names_stmt = select(Person.full_name).join(BotUser, BotUser.person_id == Person.id).join(COResponse, COResponse.bot_user_id == BotUser.id).join(CO, COResponse.campaign_id == CO.id).where(CO.faculty == faculty, COResponse.answer == 'no')
-            no_names_res = await session.execute(no_names_stmt)
-            no_names = [r[0] for r in no_names_res.fetchall() if r[0]]
-
-            text = (
-                f"Факультет: {faculty}\n"
-                f"Получателей (связанных с ботом): {recipients}\n"
-                f"Ответы — Да: {yes_count}, Нет: {no_count}"
-            )
+    if not faculty_stats:
+        await message.answer('В базе нет факультетов для отчёта.')
+        return
 
-            if yes_names:
-                text += '\n\nПоставили "Да":\n' + '\n'.join(yes_names)
-            if no_names:
-                text += '\n\nПоставили "Нет":\n' + '\n'.join(no_names)
-            await message.answer(text)
+    for stats in faculty_stats:
+        text = (
+            f"Факультет: {stats.faculty}\n"
+            f"Получателей (связанных с ботом): {stats.recipients}\n"
+            f"Ответы — Да: {stats.yes_count}, Нет: {stats.no_count}"
+        )
+
+        if stats.yes_names:
+            text += '\n\nПоставили "Да":\n' + '\n'.join(stats.yes_names)
+        if stats.no_names:
+            text += '\n\nПоставили "Нет":\n' + '\n'.join(stats.no_names)
+        await message.answer(text)
 
 
 @admin_router.message(Command(commands=['poter']))
@@ -494,21 +480,14 @@ async def poter_check(message: types.Message):
     if message.from_user.id != ADMIN_ID:
         return
     
-    async with async_session_maker() as session:
-        # Получаем все записи из Reserv
-        reserv_stmt = select(Reserv).where(Reserv.telegram_username.isnot(None))
-        reserv_result = await session.execute(reserv_stmt)
-        reserv_users = reserv_result.scalars().all()
+    async with report_session() as session:
+        # Записи Reserv с username и признаком «есть в боте» (сравнение без учёта регистра — в SQL)
+        reserv_users = await list_reserv_with_bot_status(session)
         
         if not reserv_users:
             await message.answer("❌ В таблице Reserv нет пользователей с telegram_username.")
             return
         
-        # Получаем все telegram_username из BotUser (приводим к lowercase)
-        bot_users_stmt = select(BotUser.telegram_username).where(BotUser.telegram_username.isnot(None))
-        bot_users_result = await session.execute(bot_users_stmt)
-        bot_usernames = {username.lower() for (username,) in bot_users_result.fetchall() if username}
-        
         # Группируем по факультетам
         faculty_stats = {}
         
@@ -524,10 +503,7 @@ async def poter_check(message: types.Message):
             
             faculty_stats[faculty]["total"] += 1
             
-            # Приводим к lowercase и проверяем
-            username_lower = reserv_user.telegram_username.lower() if reserv_user.telegram_username else None
-            
-            if username_lower and username_lower in bot_usernames:
+            if reserv_user.in_bot:
                 faculty_stats[faculty]["found"] += 1
             else:
                 faculty_stats[faculty]["not_found"].append({
@@ -603,10 +579,8 @@ async def create_reserv_rass(message: types.Message, state: FSMContext):
         return
 
     async with async_session_maker() as session:
-        # Получаем уникальные факультеты из Reserv
-        stmt = select(Reserv.faculty).distinct()
-        res = await session.execute(stmt)
-        faculties = [row[0] for row in res.all() if row[0]]
+        # Факультеты из Reserv (кэш справочных данных)
+        faculties = await get_reserv_faculties(session)
 
     if not faculties:
         await message.answer('❌ Нет записей с факультетами в таблице Reserv.')
@@ -622,12 +596,13 @@ async def create_reserv_rass(message: types.Message, state: FSMContext):
 
 
 @admin_router.callback_query(lambda c: c.data and c.data.startswith('reserv_faculty:'))
-async def reserv_faculty_chosen(callback: types.CallbackQuery, state: FSMContext):
+async def reserv_faculty_chosen(callback: types.CallbackQuery, state: FSMContext, session: AsyncSession):
     if callback.from_user.id != ADMIN_ID:
         await callback.answer('Нет доступа', show_alert=True)
         return
 
     _, faculty = callback.data.split(':', 1)
+    faculty_counts = await get_reserv_faculty_counts(session)
     await state.update_data(faculty=faculty)
     await state.set_state(ReservRassStates.waiting_presence)
 
@@ -638,7 +613,12 @@ async def reserv_faculty_chosen(callback: types.CallbackQuery, state: FSMContext
     )
     kb = kb.as_markup()
 
-    await callback.message.answer(f'Выбран факультет: {faculty}\nЭто рассылка для присутствия?', reply_markup=kb)
+    await callback.message.answer(
+        f'Выбран факультет: {faculty}\n'
+        f'Записей в Reserv: {faculty_counts.get(faculty, 0)}\n'
+        f'Это рассылка для присутствия?',
+        reply_markup=kb
+    )
     await callback.answer()
 
 
@@ -658,7 +638,7 @@ async def reserv_presence_chosen(callback: types.CallbackQuery, state: FSMContex
 
 
 @admin_router.message(StateFilter(ReservRassStates.waiting_text))
-async def receive_reserv_text(message: types.Message, state: FSMContext):
+async def receive_reserv_text(message: types.Message, state: FSMContext, session: AsyncSession):
     if message.from_user.id != ADMIN_ID:
         return
 
@@ -667,33 +647,35 @@ async def receive_reserv_text(message: types.Message, state: FSMContext):
     is_presence = data.get('is_presence', False)
     text = message.text
 
-    async with async_session_maker() as session:
-        # Получаем список получателей из Reserv по факультету с username
-        reserv_stmt = select(Reserv).where(
-            Reserv.faculty == faculty,
-            Reserv.telegram_username.isnot(None)
-        )
-        reserv_result = await session.execute(reserv_stmt)
-        reserv_users = reserv_result.scalars().all()
+    # Получаем список получателей из Reserv по факультету с username
+    reserv_stmt = select(Reserv).where(
+        Reserv.faculty == faculty,
+        Reserv.telegram_username.isnot(None)
+    )
+    reserv_result = await session.execute(reserv_stmt)
+    reserv_users = reserv_result.scalars().all()
 
-        if not reserv_users:
-            await message.answer(f'❌ В таблице Reserv нет пользователей факультета "{faculty}" с telegram_username.')
-            await state.clear()
-            return
+    if not reserv_users:
+        await message.answer(f'❌ В таблице Reserv нет пользователей факультета "{faculty}" с telegram_username.')
+        await state.clear()
+        return
 
-        # Получаем соответствующих BotUser по username (приводим к lowercase)
-        reserv_usernames = [ru.telegram_username.lower() for ru in reserv_users if ru.telegram_username]
-        
-        bot_users_stmt = select(BotUser).where(
-            func.lower(BotUser.telegram_username).in_(reserv_usernames)
-        )
-        bot_users_result = await session.execute(bot_users_stmt)
-        bot_users = bot_users_result.scalars().all()
+    # Получаем соответствующих BotUser по username (приводим к lowercase)
+    reserv_usernames = [ru.telegram_username.lower() for ru in reserv_users if ru.telegram_username]
+    
+    bot_users_stmt = select(BotUser).where(
+        func.lower(BotUser.telegram_username).in_(reserv_usernames)
+    )
+    bot_users_result = await session.execute(bot_users_stmt)
+    bot_users = bot_users_result.scalars().all()
 
-        if not bot_users:
-            await message.answer(f'❌ Не найдено ни одного пользователя из Reserv в BotUser для факультета "{faculty}".')
-            await state.clear()
-            return
+    # Отпускаем соединение на время рассылки — она может идти минутами
+    await session.commit()
+
+    if not bot_users:
+        await message.answer(f'❌ Не найдено ни одного пользователя из Reserv в BotUser для факультета "{faculty}".')
+        await state.clear()
+        return
 
     # Клавиатура для опроса (если нужна)
     def mk_kb(is_presence_flag: bool):
@@ -707,6 +689,7 @@ async def receive_reserv_text(message: types.Message, state: FSMContext):
     sent = 0
     errors = 0
     PAUSE_SECONDS = 0.1
+    sent_usernames = []
     
     for bu in bot_users:
         try:
@@ -716,27 +699,17 @@ async def receive_reserv_text(message: types.Message, state: FSMContext):
             else:
                 await message.bot.send_message(chat_id=bu.tg_id, text=text)
             sent += 1
-            
-            # Обновляем флаг message_sent для соответствующих записей Reserv
-            async with async_session_maker() as session:
-                username_lower = bu.telegram_username.lower() if bu.telegram_username else None
-                if username_lower:
-                    update_stmt = select(Reserv).where(
-                        func.lower(Reserv.telegram_username) == username_lower
-                    )
-                    update_result = await session.execute(update_stmt)
-                    reserv_record = update_result.scalars().first()
-                    
-                    if reserv_record:
-                        reserv_record.message_sent = True
-                        session.add(reserv_record)
-                        await session.commit()
+            if bu.telegram_username:
+                sent_usernames.append(bu.telegram_username.lower())
             
             await asyncio.sleep(PAUSE_SECONDS)
         except Exception as e:
             errors += 1
             print(f"Ошибка отправки для {bu.tg_id}: {e}")
 
+    # Обновляем флаг message_sent одним запросом для всех доставленных
+    await _mark_reserv_sent(session, sent_usernames)
+
     await message.answer(
         f'✅ Рассылка из Reserv отправлена.\n'
         f'Найдено в Reserv: {len(reserv_users)}\n'
@@ -754,10 +727,8 @@ async def dodep_reserv_start(message: types.Message, state: FSMContext):
         return
 
     async with async_session_maker() as session:
-        # Получаем уникальные факультеты из Reserv
-        stmt = select(Reserv.faculty).distinct()
-        res = await session.execute(stmt)
-        faculties = [row[0] for row in res.all() if row[0]]
+        # Факультеты из Reserv (кэш справочных данных)
+        faculties = await get_reserv_faculties(session)
 
     if not faculties:
         await message.answer('❌ Нет записей с факультетами в таблице Reserv.')
@@ -787,7 +758,7 @@ async def dodep_reserv_faculty_chosen(callback: types.CallbackQuery, state: FSMC
 
 
 @admin_router.message(StateFilter(DODepReservStates.waiting_text))
-async def dodep_reserv_send(message: types.Message, state: FSMContext):
+async def dodep_reserv_send(message: types.Message, state: FSMContext, session: AsyncSession):
     if message.from_user.id != ADMIN_ID:
         return
 
@@ -795,34 +766,36 @@ async def dodep_reserv_send(message: types.Message, state: FSMContext):
     faculty = data.get('faculty')
     text = message.text
 
-    async with async_session_maker() as session:
-        # Получаем пользователей из Reserv, которым ещё не отправлялось (message_sent = False)
-        reserv_stmt = select(Reserv).where(
-            Reserv.faculty == faculty,
-            Reserv.telegram_username.isnot(None),
-            Reserv.message_sent == False
-        )
-        reserv_result = await session.execute(reserv_stmt)
-        reserv_users = reserv_result.scalars().all()
+    # Получаем пользователей из Reserv, которым ещё не отправлялось (message_sent = False)
+    reserv_stmt = select(Reserv).where(
+        Reserv.faculty == faculty,
+        Reserv.telegram_username.isnot(None),
+        Reserv.message_sent == False
+    )
+    reserv_result = await session.execute(reserv_stmt)
+    reserv_users = reserv_result.scalars().all()
 
-        if not reserv_users:
-            await message.answer(f'✅ Всем пользователям из Reserv факультета "{faculty}" уже отправлялись сообщения.')
-            await state.clear()
-            return
+    if not reserv_users:
+        await message.answer(f'✅ Всем пользователям из Reserv факультета "{faculty}" уже отправлялись сообщения.')
+        await state.clear()
+        return
 
-        # Получаем соответствующих BotUser
-        reserv_usernames = [ru.telegram_username.lower() for ru in reserv_users if ru.telegram_username]
-        
-        bot_users_stmt = select(BotUser).where(
-            func.lower(BotUser.telegram_username).in_(reserv_usernames)
-        )
-        bot_users_result = await session.execute(bot_users_stmt)
-        bot_users = bot_users_result.scalars().all()
+    # Получаем соответствующих BotUser
+    reserv_usernames = [ru.telegram_username.lower() for ru in reserv_users if ru.telegram_username]
+    
+    bot_users_stmt = select(BotUser).where(
+        func.lower(BotUser.telegram_username).in_(reserv_usernames)
+    )
+    bot_users_result = await session.execute(bot_users_stmt)
+    bot_users = bot_users_result.scalars().all()
 
-        if not bot_users:
-            await message.answer(f'❌ Не найдено пользователей из Reserv в боте для факультета "{faculty}".')
-            await state.clear()
-            return
+    # Отпускаем соединение на время рассылки — она может идти минутами
+    await session.commit()
+
+    if not bot_users:
+        await message.answer(f'❌ Не найдено пользователей из Reserv в боте для факультета "{faculty}".')
+        await state.clear()
+        return
 
     # Клавиатура с кнопками Да/Нет
     def mk_kb():
@@ -835,32 +808,23 @@ async def dodep_reserv_send(message: types.Message, state: FSMContext):
     errors = 0
     PAUSE_SECONDS = 0.1
     
+    sent_usernames = []
     for bu in bot_users:
         try:
             reply = mk_kb()
             await message.bot.send_message(chat_id=bu.tg_id, text=text, reply_markup=reply)
             sent += 1
-            
-            # Обновляем флаг message_sent
-            async with async_session_maker() as session:
-                username_lower = bu.telegram_username.lower() if bu.telegram_username else None
-                if username_lower:
-                    update_stmt = select(Reserv).where(
-                        func.lower(Reserv.telegram_username) == username_lower
-                    )
-                    update_result = await session.execute(update_stmt)
-                    reserv_record = update_result.scalars().first()
-                    
-                    if reserv_record:
-                        reserv_record.message_sent = True
-                        session.add(reserv_record)
-                        await session.commit()
+            if bu.telegram_username:
+                sent_usernames.append(bu.telegram_username.lower())
             
             await asyncio.sleep(PAUSE_SECONDS)
         except Exception as e:
             errors += 1
             print(f"Ошибка отправки для {bu.tg_id}: {e}")
 
+    # Обновляем флаг message_sent одним запросом
+    await _mark_reserv_sent(session, sent_usernames)
+
     await message.answer(
         f'✅ Повторная рассылка из Reserv завершена.\n'
         f'Найдено без отправки: {len(reserv_users)}\n'
@@ -872,7 +836,7 @@ async def dodep_reserv_send(message: types.Message, state: FSMContext):
 
 
 @admin_router.callback_query(lambda c: c.data and c.data.startswith('reserv_answer:'))
-async def handle_reserv_answer(callback: types.CallbackQuery):
+async def handle_reserv_answer(callback: types.CallbackQuery, session: AsyncSession):
     """Обработка ответов Да/Нет на рассылки из Reserv."""
     try:
         _, answer = callback.data.split(':', 1)
@@ -882,33 +846,32 @@ async def handle_reserv_answer(callback: types.CallbackQuery):
 
     tg_id = callback.from_user.id
 
-    async with async_session_maker() as session:
-        # Найти bot_user
-        stmt = select(BotUser).where(BotUser.tg_id == tg_id)
-        res = await session.execute(stmt)
-        bot_user = res.scalars().first()
-        
-        if not bot_user:
-            await callback.answer('Ваша учётная запись не связана с базой.', show_alert=True)
-            return
+    # Найти bot_user
+    stmt = select(BotUser).where(BotUser.tg_id == tg_id)
+    res = await session.execute(stmt)
+    bot_user = res.scalars().first()
+    
+    if not bot_user:
+        await callback.answer('Ваша учётная запись не связана с базой.', show_alert=True)
+        return
 
-        # Найти соответствующую запись в Reserv по telegram_username
-        if bot_user.telegram_username:
-            username_lower = bot_user.telegram_username.lower()
-            reserv_stmt = select(Reserv).where(
-                func.lower(Reserv.telegram_username) == username_lower
-            )
-            reserv_result = await session.execute(reserv_stmt)
-            reserv_record = reserv_result.scalars().first()
-            
-            if reserv_record:
-                # Сохраняем ответ в базу
-                reserv_record.last_answer = answer
-                from datetime import datetime
-                reserv_record.answered_at = datetime.now()
-                session.add(reserv_record)
-                await session.commit()
-                print(f"✅ Ответ сохранён: {bot_user.telegram_username} ({reserv_record.full_name}) → {answer}")
+    # Найти соответствующую запись в Reserv по telegram_username
+    if bot_user.telegram_username:
+        username_lower = bot_user.telegram_username.lower()
+        reserv_stmt = select(Reserv).where(
+            func.lower(Reserv.telegram_username) == username_lower
+        )
+        reserv_result = await session.execute(reserv_stmt)
+        reserv_record = reserv_result.scalars().first()
+        
+        if reserv_record:
+            # Сохраняем ответ в базу
+            reserv_record.last_answer = answer
+            from datetime import datetime
+            reserv_record.answered_at = datetime.now()
+            await session.commit()
+            stats_refresher.mark_dirty(RESERV_STATS)
+            print(f"✅ Ответ сохранён: {bot_user.telegram_username} ({reserv_record.full_name}) → {answer}")
 
     # Редактируем сообщение, убираем кнопки
     try:
@@ -929,77 +892,36 @@ async def get_reserv_stats(message: types.Message):
     if message.from_user.id != ADMIN_ID:
         return
     
+    # Свежие данные, если с прошлого обновления были ответы или отправки
+    await stats_refresher.refresh_if_dirty(RESERV_STATS)
+
     async with async_session_maker() as session:
-        # Получаем уникальные факультеты
-        stmt = select(Reserv.faculty).distinct()
-        res = await session.execute(stmt)
-        faculties = [row[0] for row in res.all() if row[0]]
-        
-        if not faculties:
-            await message.answer('В таблице Reserv нет данных.')
-            return
-        
-        for faculty in sorted(faculties):
-            # Статистика по факультету
-            total_stmt = select(func.count(Reserv.id)).where(Reserv.faculty == faculty)
-            total_res = await session.execute(total_stmt)
-            total = total_res.scalar() or 0
-            
-            sent_stmt = select(func.count(Reserv.id)).where(
-                Reserv.faculty == faculty,
-                Reserv.message_sent == True
-            )
-            sent_res = await session.execute(sent_stmt)
-            sent = sent_res.scalar() or 0
-            
-            yes_stmt = select(func.count(Reserv.id)).where(
-                Reserv.faculty == faculty,
-                Reserv.last_answer == 'yes'
-            )
-            yes_res = await session.execute(yes_stmt)
-            yes_count = yes_res.scalar() or 0
-            
-            no_stmt = select(func.count(Reserv.id)).where(
-                Reserv.faculty == faculty,
-                Reserv.last_answer == 'no'
-            )
-            no_res = await session.execute(no_stmt)
-            no_count = no_res.scalar() or 0
-            
-            # Списки ФИО ответивших
-            yes_names_stmt = select(Reserv.full_name).where(
-                Reserv.faculty == faculty,
-                Reserv.last_answer == 'yes'
-            )
-            yes_names_res = await session.execute(yes_names_stmt)
-            yes_names = [r[0] for r in yes_names_res.fetchall()]
-            
-            no_names_stmt = select(Reserv.full_name).where(
-                Reserv.faculty == faculty,
-                Reserv.last_answer == 'no'
-            )
-            no_names_res = await session.execute(no_names_stmt)
-            no_names = [r[0] for r in no_names_res.fetchall()]
-            
-            text = (
-                f"📊 Факультет: {faculty}\n\n"
-                f"📋 Всего в Reserv: {total} чел.\n"
-                f"📤 Отправлено рассылок: {sent} чел.\n"
-                f"📊 Ответы:\n"
-                f"   ✅ Да: {yes_count} чел.\n"
-                f"   ❌ Нет: {no_count} чел.\n"
-                f"   ⏳ Не ответили: {sent - yes_count - no_count} чел."
-            )
-            
-            if yes_names:
-                text += '\n\n✅ Ответили "Да":\n' + '\n'.join(f"• {name}" for name in yes_names)
-            
-            if no_names:
-                text += '\n\n❌ Ответили "Нет":\n' + '\n'.join(f"• {name}" for name in no_names)
-            
-            text += '\n\n' + '─' * 30
-            
-            await message.answer(text)
+        faculty_stats = await load_reserv_stats(session)
+
+    if not faculty_stats:
+        await message.answer('В таблице Reserv нет данных.')
+        return
+
+    for stats in faculty_stats:
+        text = (
+            f"📊 Факультет: {stats.faculty}\n\n"
+            f"📋 Всего в Reserv: {stats.total} чел.\n"
+            f"📤 Отправлено рассылок: {stats.sent} чел.\n"
+            f"📊 Ответы:\n"
+            f"   ✅ Да: {stats.yes_count} чел.\n"
+            f"   ❌ Нет: {stats.no_count} чел.\n"
+            f"   ⏳ Не ответили: {stats.sent - stats.yes_count - stats.no_count} чел."
+        )
+
+        if stats.yes_names:
+            text += '\n\n✅ Ответили "Да":\n' + '\n'.join(f"• {name}" for name in stats.yes_names)
+
+        if stats.no_names:
+            text += '\n\n❌ Ответили "Нет":\n' + '\n'.join(f"• {name}" for name in stats.no_names)
+
+        text += '\n\n' + '─' * 30
+
+        await message.answer(text)
 
 
 @admin_router.message(Command(commands=['stats_res']))
@@ -1009,11 +931,9 @@ async def stats_res(message: types.Message):
         await message.answer(f"⛔ Нет доступа. Ваш ID: {message.from_user.id}, нужен: {ADMIN_ID}")
         return
     
-    async with async_session_maker() as session:
-        # Получаем уникальные факультеты
-        stmt = select(Reserv.faculty).distinct()
-        res = await session.execute(stmt)
-        faculties = [row[0] for row in res.all() if row[0]]
+    async with report_session() as session:
+        # Факультеты из Reserv (кэш справочных данных)
+        faculties = await get_reserv_faculties(session)
         
         if not faculties:
             await message.answer('В таблице Reserv нет данных.')
@@ -1021,22 +941,17 @@ async def stats_res(message: types.Message):
         
         has_answers = False  # Флаг для проверки наличия ответов
         
+        # Все ответы Да/Нет одним запросом, группируем по факультету
+        answers_by_faculty = {}
+        for row in await list_reserv_answers(session):
+            answers_by_faculty.setdefault(row.faculty, {'yes': [], 'no': []})[row.answer].append(
+                (row.full_name, row.telegram_username)
+            )
+        
         for faculty in sorted(faculties):
-            # Получаем тех, кто ответил "Да"
-            yes_stmt = select(Reserv.full_name, Reserv.telegram_username).where(
-                Reserv.faculty == faculty,
-                Reserv.last_answer == 'yes'
-            ).order_by(Reserv.full_name)
-            yes_result = await session.execute(yes_stmt)
-            yes_users = yes_result.fetchall()
-            
-            # Получаем тех, кто ответил "Нет"
-            no_stmt = select(Reserv.full_name, Reserv.telegram_username).where(
-                Reserv.faculty == faculty,
-                Reserv.last_answer == 'no'
-            ).order_by(Reserv.full_name)
-            no_result = await session.execute(no_stmt)
-            no_users = no_result.fetchall()
+            faculty_answers = answers_by_faculty.get(faculty, {'yes': [], 'no': []})
+            yes_users = faculty_answers['yes']
+            no_users = faculty_answers['no']
             
             if not yes_users and not no_users:
                 continue  # Пропускаем факультеты без ответов
@@ -2695,3 +2610,76 @@ async def dodepus_send(message: types.Message, state: FSMContext):
     await message.answer(stats_text)
     await state.clear()
 
+
+
+async def _answer_long(message: types.Message, text: str):
+    """Отправляет длинный текст частями по строкам (лимит Telegram 4096 символов)."""
+    parts = []
+    current = ''
+    for line in text.split('\n'):
+        if len(current) + len(line) + 1 > 4000:
+            parts.append(current)
+            current = ''
+        current += line + '\n'
+    if current.strip():
+        parts.append(current)
+
+    for part in parts:
+        await message.answer(part)
+
+
+@admin_router.message(Command(commands=['db_indexes']))
+async def db_indexes_report(message: types.Message, session: AsyncSession):
+    """Неиспользуемые индексы, таблицы с последовательными сканированиями и тяжёлые запросы."""
+    if message.from_user.id != ADMIN_ID:
+        return
+
+    report = await build_index_report(session)
+    await _answer_long(message, report)
+
+
+@admin_router.message(Command(commands=['db_stats']))
+async def db_stats_report(message: types.Message, command: CommandObject):
+    """Число SQL-запросов и время БД по хендлерам. /db_stats reset — сбросить счётчики."""
+    if message.from_user.id != ADMIN_ID:
+        return
+
+    if command.args and command.args.strip() == 'reset':
+        query_stats.reset()
+        await message.answer('Статистика SQL сброшена.')
+        return
+
+    await _answer_long(message, query_stats.format_report())
+
+
+@admin_router.message(Command(commands=['outbox']))
+async def outbox_report(message: types.Message, command: CommandObject):
+    """Очередь экспорта в Google Sheets. /outbox retry — вернуть неотправленные задания в очередь."""
+    if message.from_user.id != ADMIN_ID:
+        return
+
+    async with async_session_maker() as session:
+        if command.args and command.args.strip() == 'retry':
+            count = await retry_failed(session)
+            await session.commit()
+            sheet_outbox_relay.wake()
+            await message.answer(f'🔁 Возвращено в очередь: {count}')
+            return
+
+        summary = await get_outbox_summary(session)
+    await _answer_long(message, format_outbox_summary(summary))
+
+
+@admin_router.message(Command(commands=['sheets_stats']))
+async def sheets_stats_report(message: types.Message, command: CommandObject):
+    """Квота Google Sheets, автомат и бюджет повторов. /sheets_stats reset — сбросить статистику квоты."""
+    if message.from_user.id != ADMIN_ID:
+        return
+
+    if command.args and command.args.strip() == 'reset':
+        sheets_quota.reset()
+        await message.answer('Статистика квоты Google Sheets сброшена.')
+        return
+
+    report = '\n'.join([sheets_quota.format_report(), '', sheets_breaker.format_status(), retry_budget.format_status()])
+    await _answer_long(message, report)
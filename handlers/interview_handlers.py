@@ -1,14 +1,25 @@
 from aiogram import Router, types, F
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.exceptions import TelegramBadRequest
 from sqlalchemy import select, and_, or_
+from sqlalchemy.orm import selectinload
+from config import ADMIN_ID
 from db.engine import async_session_maker
+from db.routing import report_session
+from db.partitions import season_filter
+from db.booking_view import (
+    sync_booking_view, delete_booking_view, list_active_bookings, list_interviewer_bookings,
+    count_active_bookings, KIND_SOBES, KIND_RESERV, KIND_FINFAK,
+)
 from db.models import Interviewer, BotUser, TimeSlot, Interview, Person, InterviewMessage
-from utils.google_sheets import find_interviewer_by_code, get_schedules_data, export_interviews_to_sheet, append_interview_to_work, SCHEDULE_SHEETS
+from utils.identity_cache import identity_cache
+from utils.google_sheets import find_interviewer_by_code, export_interviews_to_sheet, SCHEDULE_SHEETS
+from utils.slot_sync import sync_slots, format_sync_result, SCHEDULE
+from utils.sheet_outbox import enqueue_sheet_export, sheet_outbox_relay, WORK_APPEND
 from datetime import datetime
 import random
 
@@ -67,13 +78,18 @@ async def get_podrobno_command(message: types.Message):
     Для каждого собеседующего показываем список факультетов (по данным синхронизации),
     затем полный список его слотов, сгруппированный по датам.
     """
-    ADMIN_ID = 922109605  # TODO: вынести в конфиг
     if message.from_user.id != ADMIN_ID:
         await message.answer("⛔ Нет доступа. Команда только для администратора.")
         return
 
     async with async_session_maker() as session:
-        stmt = select(Interviewer).where(Interviewer.is_active == True).order_by(Interviewer.full_name)
+        # Слоты подгружаем одним запросом для всех собеседующих (selectinload)
+        stmt = (
+            select(Interviewer)
+            .where(Interviewer.is_active == True)
+            .options(selectinload(Interviewer.time_slots))
+            .order_by(Interviewer.full_name)
+        )
         res = await session.execute(stmt)
         interviewers = res.scalars().all()
 
@@ -82,10 +98,7 @@ async def get_podrobno_command(message: types.Message):
             return
 
         for interviewer in interviewers:
-            # Получаем все слоты собеседующего
-            slots_stmt = select(TimeSlot).where(TimeSlot.interviewer_id == interviewer.id).order_by(TimeSlot.date, TimeSlot.time_start)
-            slots_res = await session.execute(slots_stmt)
-            slots = slots_res.scalars().all()
+            slots = sorted(interviewer.time_slots, key=lambda s: (s.date, s.time_start))
 
             faculties_str = interviewer.faculties if interviewer.faculties else "Не указаны"
 
@@ -162,7 +175,7 @@ async def register_sobes_code(message: types.Message, state: FSMContext):
     
     # Ищем в Google Sheets
     try:
-        interviewer_data = find_interviewer_by_code(code)
+        interviewer_data = await find_interviewer_by_code(code)
         
         if not interviewer_data:
             await message.answer(
@@ -305,153 +318,35 @@ async def cancel_registration(message: types.Message, state: FSMContext):
 
 
 @interview_router.message(Command('sync_slots'))
-async def sync_slots(message: types.Message):
-    """Синхронизация слотов из Google Sheets (только для админа)."""
-    ADMIN_ID = 922109605  # TODO: вынести в конфиг
-    
+async def sync_slots_command(message: types.Message, command: CommandObject):
+    """
+    Синхронизация слотов из Google Sheets (только для админа).
+
+    Применяются только изменившиеся строки; /sync_slots force — применить всё.
+    """
     if message.from_user.id != ADMIN_ID:
         await message.answer("⛔ Нет доступа. Команда только для администратора.")
         return
     
+    force = bool(command.args and command.args.strip() == 'force')
     await message.answer("🔄 Начинаю синхронизацию слотов из Google Sheets...")
     
     try:
-        # Получаем данные из Google Sheets
-        slots_data, interviewer_stats = get_schedules_data()
+        result = await sync_slots(SCHEDULE, force=force)
         
-        if not slots_data:
+        if not result.loaded:
             await message.answer("❌ Не удалось загрузить данные из Google Sheets или таблица пуста.")
             return
         
-        async with async_session_maker() as session:
-            added = 0
-            updated = 0
-            skipped = 0
-            errors = 0
-            
-            # Множества для последующей очистки устаревших слотов
-            valid_slot_keys = set()  # (interviewer_id, date, time_start)
-            touched_interviewers = set()
-
-            for slot_info in slots_data:
-                try:
-                    # Находим собеседующего по interviewer_sheet_id
-                    interviewer_stmt = select(Interviewer).where(
-                        Interviewer.interviewer_sheet_id == slot_info['interviewer_sheet_id']
-                    )
-                    interviewer_result = await session.execute(interviewer_stmt)
-                    interviewer = interviewer_result.scalars().first()
-                    
-                    if not interviewer:
-                        # Собеседующий не зарегистрирован - пропускаем
-                        skipped += 1
-                        continue
-                    
-                    touched_interviewers.add(interviewer.id)
-
-                    # Обновляем факультеты собеседующего (добавляем, не перезаписываем)
-                    new_faculties = slot_info['faculties']
-                    
-                    if interviewer.faculties:
-                        # Есть уже факультеты - добавляем новые
-                        existing = set(interviewer.faculties.split(','))
-                        existing.update(new_faculties)
-                        interviewer.faculties = ','.join(sorted(existing))
-                    else:
-                        # Нет факультетов - просто записываем
-                        interviewer.faculties = ','.join(sorted(new_faculties))
-                    
-                    session.add(interviewer)
-                    
-                    # Проверяем, есть ли уже такой слот
-                    existing_slot_stmt = select(TimeSlot).where(
-                        TimeSlot.interviewer_id == interviewer.id,
-                        TimeSlot.date == slot_info['date'],
-                        TimeSlot.time_start == slot_info['time_start']
-                    )
-                    existing_slot_result = await session.execute(existing_slot_stmt)
-                    existing_slot = existing_slot_result.scalars().first()
-                    
-                    if existing_slot:
-                        # Слот уже есть - обновляем только если он свободен
-                        if existing_slot.is_available:
-                            existing_slot.time_end = slot_info['time_end']
-                            existing_slot.google_sheet_sync = datetime.now()
-                            session.add(existing_slot)
-                            updated += 1
-                        else:
-                            # Слот занят - не трогаем
-                            skipped += 1
-                    else:
-                        # Создаём новый слот
-                        new_slot = TimeSlot(
-                            interviewer_id=interviewer.id,
-                            date=slot_info['date'],
-                            time_start=slot_info['time_start'],
-                            time_end=slot_info['time_end'],
-                            is_available=True,
-                            google_sheet_sync=datetime.now()
-                        )
-                        session.add(new_slot)
-                        added += 1
-
-                    # Добавляем ключ валидного слота из актуального Google Sheets
-                    valid_slot_keys.add((interviewer.id, slot_info['date'], slot_info['time_start']))
-                
-                except Exception as e:
-                    print(f"Ошибка обработки слота: {e}")
-                    errors += 1
-            
-            # Сохраняем изменения
-            await session.commit()
-
-            # Очистка: удаляем устаревшие свободные слоты, которых больше нет в Google Sheets
-            try:
-                if touched_interviewers:
-                    stale_deleted = 0
-                    for interviewer_id in touched_interviewers:
-                        slots_stmt = select(TimeSlot).where(TimeSlot.interviewer_id == interviewer_id)
-                        all_slots_res = await session.execute(slots_stmt)
-                        all_slots = all_slots_res.scalars().all()
-                        for s in all_slots:
-                            key = (interviewer_id, s.date, s.time_start)
-                            if key not in valid_slot_keys:
-                                # Слот отсутствует в актуальном листе — можно удалять только если он свободен и нет записи
-                                if s.is_available:
-                                    # Проверим отсутствие активной записи на всякий случай
-                                    existing_interview_stmt = select(Interview).where(
-                                        Interview.time_slot_id == s.id,
-                                        Interview.status.in_(['confirmed', 'pending'])
-                                    )
-                                    existing_interview_res = await session.execute(existing_interview_stmt)
-                                    existing_interview = existing_interview_res.scalars().first()
-                                    if not existing_interview:
-                                        session.delete(s)
-                                        stale_deleted += 1
-                    if stale_deleted:
-                        await session.commit()
-                        print(f"🧹 Удалено устаревших свободных слотов: {stale_deleted}")
-            except Exception as e:
-                print(f"⚠️ Ошибка очистки устаревших слотов: {e}")
-            
-            # Формируем сообщение со статистикой
-            stats_message = (
-                f"✅ Синхронизация завершена!\n\n"
-                f"📊 Статистика:\n"
-                f"• Добавлено новых слотов: {added}\n"
-                f"• Обновлено существующих: {updated}\n"
-                f"• Пропущено (занято или нет собеседующего): {skipped}\n"
-                f"• Ошибок: {errors}\n\n"
-                f"📋 Всего обработано: {len(slots_data)} слотов из Google Sheets\n"
-            )
-            
-            # Добавляем детальную статистику по собеседующим
-            if interviewer_stats:
-                stats_message += f"\n👥 Слоты по собеседующим:\n"
-                for interviewer_name, count in sorted(interviewer_stats.items()):
-                    stats_message += f"• {interviewer_name}: {count} слотов\n"
-            
-            await message.answer(stats_message)
+        stats_message = format_sync_result(result) + "\n"
+        
+        # Добавляем детальную статистику по собеседующим
+        if result.interviewer_stats and result.changed_rows:
+            stats_message += f"\n👥 Слоты по собеседующим:\n"
+            for interviewer_name, count in sorted(result.interviewer_stats.items()):
+                stats_message += f"• {interviewer_name}: {count} слотов\n"
+        
+        await message.answer(stats_message)
     
     except Exception as e:
         print(f"Ошибка синхронизации: {e}")
@@ -467,12 +362,10 @@ async def sobes_start(message: types.Message, state: FSMContext):
     tg_id = message.from_user.id
     
     async with async_session_maker() as session:
-        # Получаем BotUser
-        stmt = select(BotUser).where(BotUser.tg_id == tg_id)
-        result = await session.execute(stmt)
-        bot_user = result.scalars().first()
+        # Получаем BotUser и Person (через кэш идентификации)
+        identity = await identity_cache.get(session, tg_id)
         
-        if not bot_user:
+        if not identity:
             await message.answer(
                 "❌ Вы не зарегистрированы в системе.\n\n"
                 "Для записи на собеседование необходимо сначала зарегистрироваться."
@@ -481,7 +374,7 @@ async def sobes_start(message: types.Message, state: FSMContext):
         
         # Проверяем есть ли уже запись
         existing_stmt = select(Interview).where(
-            Interview.bot_user_id == bot_user.id,
+            Interview.bot_user_id == identity.bot_user_id,
             Interview.status.in_(['confirmed', 'pending'])
         )
         existing_result = await session.execute(existing_stmt)
@@ -505,15 +398,8 @@ async def sobes_start(message: types.Message, state: FSMContext):
             )
             return
         
-        # Получаем Person для определения факультета
-        person = None
-        if bot_user.person_id:
-            person_stmt = select(Person).where(Person.id == bot_user.person_id)
-            person_result = await session.execute(person_stmt)
-            person = person_result.scalars().first()
-        
         # Определяем факультет ТОЛЬКО из People. Если нет — запрещаем запись.
-        if not person or not person.faculty or not person.faculty.strip():
+        if not identity.person_id or not identity.faculty or not identity.faculty.strip():
             await message.answer(
                 "❌ Невозможно записаться: у вашей учётной записи не указан факультет в базе.\n\n"
                 "Пожалуйста, свяжитесь с администратором, чтобы вас добавили в раздел People с корректным факультетом."
@@ -521,7 +407,7 @@ async def sobes_start(message: types.Message, state: FSMContext):
             await state.clear()
             return
 
-        user_faculty = person.faculty.strip()
+        user_faculty = identity.faculty.strip()
 
         # Факультет определён в People — показываем доступные времена только по нему
         await show_available_times(message, session, user_faculty, state)
@@ -701,10 +587,15 @@ async def sobes_confirm_callback(callback: types.CallbackQuery, state: FSMContex
     
     async with async_session_maker() as session:
         try:
-            # Получаем BotUser
-            bot_user_stmt = select(BotUser).where(BotUser.tg_id == tg_id)
-            bot_user_result = await session.execute(bot_user_stmt)
-            bot_user = bot_user_result.scalars().first()
+            # Получаем BotUser (через кэш идентификации)
+            identity = await identity_cache.get(session, tg_id)
+            if not identity:
+                await callback.message.edit_text(
+                    "❌ Вы не зарегистрированы в системе.\n\n"
+                    "Используйте /start для регистрации."
+                )
+                await state.clear()
+                return
             
             # Получаем слот С БЛОКИРОВКОЙ (FOR UPDATE)
             # Это предотвращает race condition при одновременной записи
@@ -762,7 +653,8 @@ async def sobes_confirm_callback(callback: types.CallbackQuery, state: FSMContex
             if cancelled_interviews:
                 for cancelled in cancelled_interviews:
                     print(f"🗑️ Удаляю отменённую запись {cancelled.id} для слота {selected_slot_id}")
-                    session.delete(cancelled)
+                    await session.delete(cancelled)
+                await delete_booking_view(session, KIND_SOBES, [cancelled.id for cancelled in cancelled_interviews])
                 
                 await session.flush()  # Применяем удаление ПРЯМО СЕЙЧАС
                 print(f"✅ Удалено {len(cancelled_interviews)} отменённых записей для слота {selected_slot_id}")
@@ -771,8 +663,8 @@ async def sobes_confirm_callback(callback: types.CallbackQuery, state: FSMContex
             interview = Interview(
                 time_slot_id=slot.id,
                 interviewer_id=slot.interviewer_id,
-                bot_user_id=bot_user.id,
-                person_id=bot_user.person_id if bot_user.person_id else None,
+                bot_user_id=identity.bot_user_id,
+                person_id=identity.person_id,
                 faculty=user_faculty,
                 status='confirmed',
                 cancellation_allowed=True  # Можно отменить 1 раз
@@ -784,14 +676,16 @@ async def sobes_confirm_callback(callback: types.CallbackQuery, state: FSMContex
             
             session.add(interview)
             session.add(slot)
+            await session.flush()
+            # Строка витрины (кандидат, слот, собеседующий) — в той же транзакции
+            booking_row = await sync_booking_view(session, KIND_SOBES, interview.id)
+            # Строка в лист WORK — через очередь sheet_outbox, в той же транзакции
+            if booking_row:
+                await enqueue_sheet_export(session, WORK_APPEND, f'sobes:{interview.id}:work', booking_row.work_row())
             await session.commit()
+            sheet_outbox_relay.wake()
             print(f"✅ Запись создана, slot_id={slot.id}, interview_id={interview.id}")
             
-            # Получаем собеседующего для уведомления
-            interviewer_stmt = select(Interviewer).where(Interviewer.id == slot.interviewer_id)
-            interviewer_result = await session.execute(interviewer_stmt)
-            interviewer = interviewer_result.scalars().first()
-            
             # Кнопки для кандидата
             kb = InlineKeyboardBuilder()
             kb.row(InlineKeyboardButton(text="❓ Задать вопрос", callback_data=f"ask_question:{interview.id}"))
@@ -806,13 +700,13 @@ async def sobes_confirm_callback(callback: types.CallbackQuery, state: FSMContex
             )
             
             # Отправляем уведомление собеседующему
-            if interviewer and interviewer.telegram_id:
+            if booking_row and booking_row.interviewer_tg_id:
                 try:
                     student_name = f"@{callback.from_user.username}" if callback.from_user.username else callback.from_user.full_name
                     
                     # Используем существующий bot вместо создания нового
                     await callback.bot.send_message(
-                        interviewer.telegram_id,
+                        booking_row.interviewer_tg_id,
                         f"📌 Новая запись на собеседование!\n\n"
                         f"👤 Кандидат: {student_name}\n"
                         f"🎓 Факультет: {user_faculty}\n"
@@ -828,35 +722,6 @@ async def sobes_confirm_callback(callback: types.CallbackQuery, state: FSMContex
                 await callback.answer("✅ Запись создана!")
             except TelegramBadRequest:
                 pass
-            
-            # Добавляем запись в лист WORK (автоматически)
-            try:
-                candidate_name = "Не указано"
-                if bot_user.person_id:
-                    person_stmt = select(Person).where(Person.id == bot_user.person_id)
-                    person_result = await session.execute(person_stmt)
-                    person = person_result.scalars().first()
-                    if person:
-                        candidate_name = person.full_name
-                else:
-                    if bot_user and bot_user.telegram_username:
-                        candidate_name = f"@{bot_user.telegram_username}"
-
-                time_display = f"{slot.time_start}-{slot.time_end}"
-                created_at_formatted = interview.created_at.strftime("%Y-%m-%d %H:%M") if interview.created_at else ""
-
-                append_interview_to_work({
-                    'candidate_name': candidate_name,
-                    'faculty': user_faculty or "Не указан",
-                    'date': slot.date,
-                    'time': time_display,
-                    'interviewer_name': interviewer.full_name if interviewer else "Не указан",
-                    'interviewer_id': interviewer.interviewer_sheet_id if interviewer else "",
-                    'status': interview.status,
-                    'created_at': created_at_formatted
-                })
-            except Exception as e:
-                print(f"⚠️ Не удалось добавить строку в WORK: {e}")
         
         except Exception as e:
             print(f"Ошибка при создании записи: {e}")
@@ -935,6 +800,7 @@ async def cancel_interview_callback(callback: types.CallbackQuery, state: FSMCon
             interview.cancellation_allowed = False  # Больше нельзя отменять
             
             session.add(interview)
+            await sync_booking_view(session, KIND_SOBES, interview.id)
             await session.commit()
             print(f"✅ Отмена записи {interview.id} завершена, слот {interview.time_slot_id} освобождён")
             
@@ -996,12 +862,15 @@ async def ask_question_callback(callback: types.CallbackQuery, state: FSMContext
     
     async with async_session_maker() as session:
         # Проверяем что интервью существует и принадлежит пользователю
-        stmt = select(Interview).join(BotUser).where(
-            Interview.id == interview_id,
-            BotUser.tg_id == tg_id
-        )
-        result = await session.execute(stmt)
-        interview = result.scalars().first()
+        identity = await identity_cache.get(session, tg_id)
+        interview = None
+        if identity:
+            stmt = select(Interview).where(
+                Interview.id == interview_id,
+                Interview.bot_user_id == identity.bot_user_id
+            )
+            result = await session.execute(stmt)
+            interview = result.scalars().first()
         
         if not interview:
             await callback.answer("❌ Запись не найдена", show_alert=True)
@@ -1114,7 +983,8 @@ async def answer_question_callback(callback: types.CallbackQuery, state: FSMCont
         # Проверяем что сообщение существует и адресовано этому собеседующему
         stmt = select(InterviewMessage).where(
             InterviewMessage.id == message_id,
-            InterviewMessage.to_user_id == tg_id
+            InterviewMessage.to_user_id == tg_id,
+            season_filter(InterviewMessage.created_at)
         )
         result = await session.execute(stmt)
         msg = result.scalars().first()
@@ -1164,7 +1034,10 @@ async def process_answer(message: types.Message, state: FSMContext):
     
     async with async_session_maker() as session:
         # Получаем оригинальное сообщение
-        stmt = select(InterviewMessage).where(InterviewMessage.id == original_message_id)
+        stmt = select(InterviewMessage).where(
+            InterviewMessage.id == original_message_id,
+            season_filter(InterviewMessage.created_at)
+        )
         result = await session.execute(stmt)
         original_msg = result.scalars().first()
         
@@ -1221,13 +1094,8 @@ async def my_interviews_command(message: types.Message):
             )
             return
         
-        # Получаем все записи собеседующего
-        stmt = select(Interview).where(
-            Interview.interviewer_id == interviewer.id,
-            Interview.status.in_(['confirmed', 'pending'])
-        ).join(TimeSlot).order_by(TimeSlot.date, TimeSlot.time_start)
-        result = await session.execute(stmt)
-        interviews = result.scalars().all()
+        # Записи собеседующего из витрины (без соединений со слотами и кандидатами)
+        interviews = await list_interviewer_bookings(session, interviewer.id)
         
         if not interviews:
             await message.answer(
@@ -1240,31 +1108,12 @@ async def my_interviews_command(message: types.Message):
         from collections import defaultdict
         by_date = defaultdict(list)
         
-        for interview in interviews:
-            # Получаем слот
-            stmt = select(TimeSlot).where(TimeSlot.id == interview.time_slot_id)
-            result = await session.execute(stmt)
-            slot = result.scalars().first()
-            
-            # Получаем кандидата
-            stmt = select(BotUser).where(BotUser.id == interview.bot_user_id)
-            result = await session.execute(stmt)
-            bot_user = result.scalars().first()
-            
-            # Получаем Person если есть
-            person_name = "Не указано"
-            if interview.person_id:
-                stmt = select(Person).where(Person.id == interview.person_id)
-                result = await session.execute(stmt)
-                person = result.scalars().first()
-                if person:
-                    person_name = person.full_name
-            
-            by_date[slot.date].append({
-                'time': f"{slot.time_start}-{slot.time_end}",
-                'candidate': person_name,
-                'faculty': interview.faculty or "Не указан",
-                'username': f"@{bot_user.telegram_username}" if bot_user.telegram_username else "Нет username"
+        for booking in interviews:
+            by_date[booking.date].append({
+                'time': f"{booking.time_start}-{booking.time_end}",
+                'candidate': booking.candidate_name,
+                'faculty': booking.faculty or "Не указан",
+                'username': f"@{booking.candidate_username}" if booking.candidate_username else "Нет username"
             })
         
         # Формируем текст
@@ -1289,15 +1138,18 @@ async def my_interviews_command(message: types.Message):
 @interview_router.message(Command('sobeser_stats'))
 async def sobeser_stats_command(message: types.Message):
     """Статистика по всем собеседующим (для админа)."""
-    ADMIN_ID = 922109605  # TODO: вынести в конфиг
-    
     if message.from_user.id != ADMIN_ID:
         await message.answer("⛔ Нет доступа. Команда только для администратора.")
         return
     
-    async with async_session_maker() as session:
-        # Получаем всех собеседующих
-        stmt = select(Interviewer).where(Interviewer.is_active == True).order_by(Interviewer.full_name)
+    async with report_session() as session:
+        # Получаем всех собеседующих вместе со слотами (один дополнительный запрос на всех)
+        stmt = (
+            select(Interviewer)
+            .where(Interviewer.is_active == True)
+            .options(selectinload(Interviewer.time_slots))
+            .order_by(Interviewer.full_name)
+        )
         result = await session.execute(stmt)
         interviewers = result.scalars().all()
         
@@ -1312,10 +1164,7 @@ async def sobeser_stats_command(message: types.Message):
         total_free = 0
         
         for interviewer in interviewers:
-            # Получаем все слоты собеседующего
-            slots_stmt = select(TimeSlot).where(TimeSlot.interviewer_id == interviewer.id)
-            slots_result = await session.execute(slots_stmt)
-            slots = slots_result.scalars().all()
+            slots = interviewer.time_slots
             
             if not slots:
                 continue
@@ -1358,81 +1207,38 @@ async def sobeser_stats_command(message: types.Message):
             f"🔴 Занято: {total_booked}"
         )
         
+        # Активные записи по видам — из витрины booking_view
+        booking_counts = await count_active_bookings(session)
+        text += (
+            f"\n📋 Записей: собеседования {booking_counts.get(KIND_SOBES, 0)}, "
+            f"резерв {booking_counts.get(KIND_RESERV, 0)}, финфак {booking_counts.get(KIND_FINFAK, 0)}"
+        )
+        
         await message.answer(text, parse_mode="HTML")
 
 
 @interview_router.message(Command('export_interviews'))
 async def export_interviews_command(message: types.Message):
     """Экспорт всех записей в Google Sheets (лист WORK) - только для админа."""
-    ADMIN_ID = 922109605  # TODO: вынести в конфиг
-    
     if message.from_user.id != ADMIN_ID:
         await message.answer("⛔ Нет доступа. Команда только для администратора.")
         return
     
     await message.answer("🔄 Начинаю экспорт записей в Google Sheets...")
     
-    async with async_session_maker() as session:
-        # Получаем все активные записи
-        stmt = select(Interview).where(
-            Interview.status.in_(['confirmed', 'pending'])
-        ).order_by(Interview.created_at)
-        result = await session.execute(stmt)
-        interviews = result.scalars().all()
+    async with report_session() as session:
+        # Активные записи из витрины — уже готовые строки для WORK
+        bookings = await list_active_bookings(session, KIND_SOBES)
         
-        if not interviews:
+        if not bookings:
             await message.answer("📋 Нет активных записей для экспорта.")
             return
         
-        # Подготавливаем данные для экспорта
-        export_data = []
-        
-        for interview in interviews:
-            # Получаем слот
-            slot_stmt = select(TimeSlot).where(TimeSlot.id == interview.time_slot_id)
-            slot_result = await session.execute(slot_stmt)
-            slot = slot_result.scalars().first()
-            
-            # Получаем собеседующего
-            interviewer_stmt = select(Interviewer).where(Interviewer.id == interview.interviewer_id)
-            interviewer_result = await session.execute(interviewer_stmt)
-            interviewer = interviewer_result.scalars().first()
-            
-            # Получаем кандидата
-            candidate_name = "Не указано"
-            if interview.person_id:
-                person_stmt = select(Person).where(Person.id == interview.person_id)
-                person_result = await session.execute(person_stmt)
-                person = person_result.scalars().first()
-                if person:
-                    candidate_name = person.full_name
-            else:
-                # Пытаемся получить из bot_user
-                bot_user_stmt = select(BotUser).where(BotUser.id == interview.bot_user_id)
-                bot_user_result = await session.execute(bot_user_stmt)
-                bot_user = bot_user_result.scalars().first()
-                if bot_user and bot_user.telegram_username:
-                    candidate_name = f"@{bot_user.telegram_username}"
-            
-            # Форматируем дату
-            date_formatted = slot.date if slot else ""
-            time_formatted = f"{slot.time_start}-{slot.time_end}" if slot else ""
-            created_at_formatted = interview.created_at.strftime("%Y-%m-%d %H:%M") if interview.created_at else ""
-            
-            export_data.append({
-                'candidate_name': candidate_name,
-                'faculty': interview.faculty or "Не указан",
-                'date': date_formatted,
-                'time': time_formatted,
-                'interviewer_name': interviewer.full_name if interviewer else "Не указан",
-                'interviewer_id': interviewer.interviewer_sheet_id if interviewer else "",
-                'status': interview.status,
-                'created_at': created_at_formatted
-            })
+        export_data = [booking.work_row() for booking in bookings]
         
         # Экспортируем в Google Sheets
         from utils.google_sheets import SCHEDULE_SHEET_URL
-        success = export_interviews_to_sheet(export_data)
+        success = await export_interviews_to_sheet(export_data)
         
         if success:
             await message.answer(
@@ -1448,7 +1254,6 @@ async def export_interviews_command(message: types.Message):
 @interview_router.message(Command('zapolnit'))
 async def zapolnit_command(message: types.Message):
     """Алиас: создать и заполнить лист WORK всеми записями из БД (только для админа)."""
-    ADMIN_ID = 922109605  # TODO: вынести в конфиг
     if message.from_user.id != ADMIN_ID:
         await message.answer("⛔ Нет доступа. Команда только для администратора.")
         return
@@ -2,28 +2,29 @@
 Обработчики для новой системы резерва
 """
 from aiogram import Router, types, F, Bot
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from sqlalchemy import select, and_, delete, func
+from config import ADMIN_ID
 from db.engine import async_session_maker
-from db.models import Interviewer, BotUser, Person, ReservTimeSlot, ReservBooking, FinfakTimeSlot, FinfakBooking
-from utils.reserv_parser import parse_reserv_sheets, format_stats_message
-from utils.finfak_export import export_finfak_booking_to_sheets
-from utils.reserv_export import export_reserv_booking_to_sheets
+from db.models import Interviewer, Person, ReservTimeSlot, ReservBooking, FinfakTimeSlot, FinfakBooking
+from db.booking_view import sync_booking_view, KIND_FINFAK, KIND_RESERV
+from utils.identity_cache import identity_cache, UserIdentity
+from utils.reserv_parser import format_stats_message
+from utils.slot_sync import sync_slots, format_sync_result, RESERV, FINFAK
+from utils.sheet_outbox import (
+    enqueue_sheet_export, booking_payload, sheet_outbox_relay, FINFAK_MATRIX, FINFAK_ALL, RESERV_MATRIX, RESERV_ALL,
+)
 from datetime import datetime
 import pytz
 import random
-import asyncio
 
 
 reserv_router = Router()
 
-# ID администратора
-ADMIN_ID = 922109605  # TODO: вынести в конфиг
-
 # Даты собеседований
 FINFAK_DATE = "2025-11-07"  # 7 ноября 2025 - Финфак
 RESERV_DATE = "2025-11-08"  # 8 ноября 2025 - Резерв
@@ -44,32 +45,27 @@ class ReservBookingStates(StatesGroup):
     waiting_confirmation = State()
 
 
-async def _parse_sheet_common(message: types.Message, sheet_name: str):
+async def _parse_sheet_common(message: types.Message, sheet_name: str, force: bool = False):
     """
     Общая функция для парсинга листа.
     
+    Применяются только изменившиеся строки листа (utils.slot_sync).
+    
     Args:
         message: Сообщение от пользователя
         sheet_name: Имя листа для парсинга ('резерв' или 'финфак')
+        force: Применить все строки, даже если лист не менялся
     """
-    # Определяем модели для каждого листа
-    if sheet_name == "резерв":
-        TimeSlotModel = ReservTimeSlot
-        BookingModel = ReservBooking
-    elif sheet_name == "финфак":
-        TimeSlotModel = FinfakTimeSlot
-        BookingModel = FinfakBooking
-    else:
+    if sheet_name not in (RESERV, FINFAK):
         await message.answer(f"❌ Неизвестный лист: {sheet_name}")
         return
     
     await message.answer(f"🔄 Начинаю парсинг листа '{sheet_name}'...\n\nЭто может занять несколько секунд...")
     
     try:
-        # Парсим указанный лист
-        slots_data, interviewer_stats = parse_reserv_sheets(sheet_names=[sheet_name])
+        result = await sync_slots(sheet_name, force=force)
         
-        if not slots_data:
+        if not result.loaded:
             await message.answer(
                 "❌ Не удалось загрузить данные из Google Sheets.\n\n"
                 "Проверьте:\n"
@@ -79,159 +75,38 @@ async def _parse_sheet_common(message: types.Message, sheet_name: str):
             )
             return
         
-        # Сохраняем в БД
-        async with async_session_maker() as session:
-            added = 0
-            updated = 0
-            skipped = 0
-            errors = 0
-            
-            # Множество для отслеживания валидных слотов
-            valid_slot_keys = set()  # (interviewer_id, date, time_start)
-            touched_interviewers = set()  # {interviewer_id}
-            
-            for slot_info in slots_data:
-                try:
-                    # Находим собеседующего по interviewer_sheet_id
-                    interviewer_stmt = select(Interviewer).where(
-                        Interviewer.interviewer_sheet_id == slot_info['interviewer_sheet_id']
-                    )
-                    interviewer_result = await session.execute(interviewer_stmt)
-                    interviewer = interviewer_result.scalars().first()
-                    
-                    if not interviewer:
-                        # Собеседующий не зарегистрирован в системе - пропускаем
-                        skipped += 1
-                        continue
-                    
-                    # Отслеживаем затронутых собеседующих
-                    touched_interviewers.add(interviewer.id)
-                    
-                    # Проверяем, есть ли уже такой слот
-                    existing_slot_stmt = select(TimeSlotModel).where(
-                        TimeSlotModel.interviewer_id == interviewer.id,
-                        TimeSlotModel.date == slot_info['date'],
-                        TimeSlotModel.time_start == slot_info['time_start']
-                    )
-                    existing_slot_result = await session.execute(existing_slot_stmt)
-                    existing_slot = existing_slot_result.scalars().first()
-                    
-                    if existing_slot:
-                        # Слот уже есть - обновляем только если он свободен
-                        if existing_slot.is_available:
-                            existing_slot.time_end = slot_info['time_end']
-                            existing_slot.google_sheet_sync = datetime.now()
-                            session.add(existing_slot)
-                            updated += 1
-                        else:
-                            # Слот занят - не трогаем
-                            skipped += 1
+        await message.answer(format_sync_result(result))
+        
+        interviewer_stats = result.interviewer_stats
+        if not result.changed_rows:
+            return
+        
+        # Отправляем детальную статистику по собеседующим
+        if interviewer_stats:
+            detailed_stats = format_stats_message(interviewer_stats)
+            
+            # Разбиваем на части если сообщение слишком длинное
+            max_length = 4000
+            if len(detailed_stats) <= max_length:
+                await message.answer(detailed_stats)
+            else:
+                # Отправляем по частям
+                parts = []
+                current_part = "📊 СТАТИСТИКА ПО СОБЕСЕДУЮЩИМ\n\n"
+                
+                for line in detailed_stats.split('\n')[2:]:  # Пропускаем заголовок
+                    if len(current_part + line + '\n') > max_length:
+                        parts.append(current_part)
+                        current_part = line + '\n'
                     else:
-                        # Создаем новый слот
-                        new_slot = TimeSlotModel(
-                            interviewer_id=interviewer.id,
-                            date=slot_info['date'],
-                            time_start=slot_info['time_start'],
-                            time_end=slot_info['time_end'],
-                            is_available=True,
-                            google_sheet_sync=datetime.now()
-                        )
-                        session.add(new_slot)
-                        added += 1
-                    
-                    # Добавляем ключ валидного слота
-                    valid_slot_keys.add((
-                        interviewer.id,
-                        slot_info['date'],
-                        slot_info['time_start']
-                    ))
+                        current_part += line + '\n'
                 
-                except Exception as e:
-                    print(f"Ошибка обработки слота: {e}")
-                    errors += 1
-            
-            # Сохраняем изменения
-            await session.commit()
-            
-            # Очистка: удаляем устаревшие свободные слоты
-            stale_deleted = 0
-            try:
-                for interviewer_id in touched_interviewers:
-                    # Получаем все слоты этого собеседующего
-                    slots_stmt = select(TimeSlotModel).where(
-                        TimeSlotModel.interviewer_id == interviewer_id
-                    )
-                    all_slots_res = await session.execute(slots_stmt)
-                    all_slots = all_slots_res.scalars().all()
-                    
-                    for slot in all_slots:
-                        key = (interviewer_id, slot.date, slot.time_start)
-                        if key not in valid_slot_keys:
-                            # Слот отсутствует в актуальном листе
-                            if slot.is_available:
-                                # Проверяем отсутствие активной записи
-                                existing_booking_stmt = select(BookingModel).where(
-                                    BookingModel.time_slot_id == slot.id,
-                                    BookingModel.status == 'confirmed'
-                                )
-                                existing_booking_res = await session.execute(existing_booking_stmt)
-                                existing_booking = existing_booking_res.scalars().first()
-                                
-                                if not existing_booking:
-                                    await session.delete(slot)
-                                    stale_deleted += 1
+                if current_part.strip():
+                    parts.append(current_part)
                 
-                if stale_deleted > 0:
-                    await session.commit()
-            
-            except Exception as e:
-                print(f"⚠️ Ошибка очистки устаревших слотов: {e}")
-            
-            # Формируем сообщение со статистикой
-            stats_message = (
-                f"✅ Парсинг завершен!\n\n"
-                f"📊 Общая статистика:\n"
-                f"• Добавлено новых слотов: {added}\n"
-                f"• Обновлено существующих: {updated}\n"
-                f"• Пропущено (занято или нет в системе): {skipped}\n"
-            )
-            
-            if stale_deleted > 0:
-                stats_message += f"• Удалено устаревших: {stale_deleted}\n"
-            
-            if errors > 0:
-                stats_message += f"• ⚠️ Ошибок: {errors}\n"
-            
-            stats_message += f"\n📋 Всего обработано: {len(slots_data)} слотов из Google Sheets\n"
-            
-            await message.answer(stats_message)
-            
-            # Отправляем детальную статистику по собеседующим
-            if interviewer_stats:
-                detailed_stats = format_stats_message(interviewer_stats)
-                
-                # Разбиваем на части если сообщение слишком длинное
-                max_length = 4000
-                if len(detailed_stats) <= max_length:
-                    await message.answer(detailed_stats)
-                else:
-                    # Отправляем по частям
-                    parts = []
-                    current_part = "📊 СТАТИСТИКА ПО СОБЕСЕДУЮЩИМ\n\n"
-                    
-                    for line in detailed_stats.split('\n')[2:]:  # Пропускаем заголовок
-                        if len(current_part + line + '\n') > max_length:
-                            parts.append(current_part)
-                            current_part = line + '\n'
-                        else:
-                            current_part += line + '\n'
-                    
-                    if current_part.strip():
-                        parts.append(current_part)
-                    
-                    for i, part in enumerate(parts, 1):
-                        header = f"📊 СТАТИСТИКА (часть {i}/{len(parts)})\n\n" if len(parts) > 1 else ""
-                        await message.answer(header + part)
+                for i, part in enumerate(parts, 1):
+                    header = f"📊 СТАТИСТИКА (часть {i}/{len(parts)})\n\n" if len(parts) > 1 else ""
+                    await message.answer(header + part)
     
     except Exception as e:
         print(f"Ошибка парсинга: {e}")
@@ -248,33 +123,35 @@ async def _parse_sheet_common(message: types.Message, sheet_name: str):
 
 
 @reserv_router.message(Command('parse_reserv'))
-async def parse_reserv_command(message: types.Message):
+async def parse_reserv_command(message: types.Message, command: CommandObject):
     """
     Команда для парсинга листа 'резерв' из Google Sheets.
     Доступна только администратору.
     
     Выводит детальную информацию о процессе парсинга и статистику.
+    Применяются только изменения с прошлого парсинга; /parse_reserv force — всё заново.
     """
     if message.from_user.id != ADMIN_ID:
         await message.answer("⛔ Нет доступа. Команда только для администратора.")
         return
     
-    await _parse_sheet_common(message, "резерв")
+    await _parse_sheet_common(message, "резерв", force=bool(command.args and command.args.strip() == 'force'))
 
 
 @reserv_router.message(Command('parse_finfak'))
-async def parse_finfak_command(message: types.Message):
+async def parse_finfak_command(message: types.Message, command: CommandObject):
     """
     Команда для парсинга листа 'финфак' из Google Sheets.
     Доступна только администратору.
     
     Выводит детальную информацию о процессе парсинга и статистику.
+    Применяются только изменения с прошлого парсинга; /parse_finfak force — всё заново.
     """
     if message.from_user.id != ADMIN_ID:
         await message.answer("⛔ Нет доступа. Команда только для администратора.")
         return
     
-    await _parse_sheet_common(message, "финфак")
+    await _parse_sheet_common(message, "финфак", force=bool(command.args and command.args.strip() == 'force'))
 
 
 # ========================================
@@ -290,27 +167,18 @@ async def finfak_booking_start(message: types.Message, state: FSMContext):
     tg_id = message.from_user.id
     
     async with async_session_maker() as session:
-        # Получаем BotUser
-        stmt = select(BotUser).where(BotUser.tg_id == tg_id)
-        result = await session.execute(stmt)
-        bot_user = result.scalars().first()
+        # Получаем BotUser и Person (через кэш идентификации)
+        identity = await identity_cache.get(session, tg_id)
         
-        if not bot_user:
+        if not identity:
             await message.answer(
                 "❌ Вы не зарегистрированы в системе. \n\n"
                 "Используйте /start для регистрации или напишите @yanejettt"
             )
             return
         
-        # Получаем Person для проверки факультета
-        person = None
-        if bot_user.person_id:
-            person_stmt = select(Person).where(Person.id == bot_user.person_id)
-            person_result = await session.execute(person_stmt)
-            person = person_result.scalars().first()
-        
         # Проверяем факультет
-        if not person or not person.faculty or person.faculty.strip() != "Финфак":
+        if not identity.person_id or not identity.faculty or identity.faculty.strip() != "Финфак":
             await message.answer(
                 "❌ Запись на собеседование доступна только для студентов факультета \"Финфак\".\n\n"
                 "Если это ошибка, обратитесь к администратору @yanejettt"
@@ -319,7 +187,7 @@ async def finfak_booking_start(message: types.Message, state: FSMContext):
         
         # Проверяем, есть ли уже запись
         existing_stmt = select(FinfakBooking).where(
-            FinfakBooking.bot_user_id == bot_user.id,
+            FinfakBooking.bot_user_id == identity.bot_user_id,
             FinfakBooking.status == 'confirmed'
         )
         existing_result = await session.execute(existing_stmt)
@@ -344,10 +212,10 @@ async def finfak_booking_start(message: types.Message, state: FSMContext):
             return
         
         # Показываем доступные слоты
-        await show_finfak_slots(message, session, bot_user, person, state)
+        await show_finfak_slots(message, session, identity, state)
 
 
-async def show_finfak_slots(message: types.Message, session, bot_user: BotUser, person: Person, state: FSMContext):
+async def show_finfak_slots(message: types.Message, session, identity: UserIdentity, state: FSMContext):
     """Показывает доступные временные слоты для записи на Финфак."""
     
     # Получаем текущее время в Москве
@@ -407,8 +275,8 @@ async def show_finfak_slots(message: types.Message, session, bot_user: BotUser,
     # Сохраняем данные в state
     await state.update_data(
         time_slots_ids=time_slots_ids,
-        person_id=person.id,
-        bot_user_id=bot_user.id
+        person_id=identity.person_id,
+        bot_user_id=identity.bot_user_id
     )
     
     # Формируем кнопки (вертикально, одна под другой)
@@ -535,16 +403,6 @@ async def finfak_confirm_callback(callback: types.CallbackQuery, state: FSMConte
                 await state.clear()
                 return
             
-            # Получаем собеседующего
-            interviewer_stmt = select(Interviewer).where(Interviewer.id == slot.interviewer_id)
-            interviewer_result = await session.execute(interviewer_stmt)
-            interviewer = interviewer_result.scalars().first()
-            
-            # Получаем данные кандидата
-            person_stmt = select(Person).where(Person.id == person_id)
-            person_result = await session.execute(person_stmt)
-            person = person_result.scalars().first()
-            
             # Создаем запись
             booking = FinfakBooking(
                 time_slot_id=slot.id,
@@ -558,14 +416,18 @@ async def finfak_confirm_callback(callback: types.CallbackQuery, state: FSMConte
             # Помечаем слот как занятый
             slot.is_available = False
             session.add(slot)
+            await session.flush()
             
-            await session.commit()
+            # Строка витрины: кандидат, слот и собеседующий одним запросом, в той же транзакции
+            booking_row = await sync_booking_view(session, KIND_FINFAK, booking.id)
+            # Экспорт в Google Sheets — через очередь sheet_outbox, в той же транзакции
+            if booking_row:
+                payload = booking_payload(booking_row)
+                await enqueue_sheet_export(session, FINFAK_MATRIX, f'finfak:{booking.id}:matrix', payload)
+                await enqueue_sheet_export(session, FINFAK_ALL, f'finfak:{booking.id}:all', payload)
             
-            # Refresh объектов для использования вне сессии
-            await session.refresh(booking)
-            await session.refresh(slot)
-            await session.refresh(interviewer)
-            await session.refresh(person)
+            await session.commit()
+            sheet_outbox_relay.wake()
             
             # Отправляем подтверждение кандидату
             await callback.message.edit_text(
@@ -577,34 +439,26 @@ async def finfak_confirm_callback(callback: types.CallbackQuery, state: FSMConte
             )
             
             # Отправляем уведомление собеседующему
-            if interviewer and interviewer.telegram_id:
+            if booking_row and booking_row.interviewer_tg_id:
                 try:
                     # Получаем бота из callback
                     bot = callback.bot
                     
-                    candidate_username = person.telegram_username if person and person.telegram_username else "не указан"
-                    if candidate_username and not candidate_username.startswith('@'):
-                        candidate_username = f"@{candidate_username}"
+                    candidate_username = f"@{booking_row.candidate_username}" if booking_row.candidate_username else "не указан"
                     
                     notification_text = (
                         f"📌 Новая запись на собеседование!\n\n"
-                        f"👤 Кандидат: {person.full_name if person else 'Неизвестен'}\n"
+                        f"👤 Кандидат: {booking_row.candidate_name}\n"
                         f"📱 Telegram: {candidate_username}\n"
                         f"🎓 Факультет: Финфак\n"
                         f"📅 Дата: 07.11.2025\n"
                         f"⏰ Время: {slot.time_start} - {slot.time_end}\n"
                     )
                     
-                    await bot.send_message(interviewer.telegram_id, notification_text)
+                    await bot.send_message(booking_row.interviewer_tg_id, notification_text)
                 except Exception as e:
                     print(f"Ошибка отправки уведомления собеседующему: {e}")
         
-            # Экспорт в Google Sheets (асинхронно, с задержкой)
-            # Запускаем ВНЕ сессии, чтобы не было проблем с detached объектами
-            asyncio.create_task(
-                export_finfak_booking_to_sheets(booking, slot, interviewer, person)
-            )
-            
             await state.clear()
             try:
                 await callback.answer("✅ Запись создана!")
@@ -633,26 +487,18 @@ async def reserv_booking_start(message: types.Message, state: FSMContext):
     tg_id = message.from_user.id
     
     async with async_session_maker() as session:
-        # Получаем BotUser
-        stmt = select(BotUser).where(BotUser.tg_id == tg_id)
-        result = await session.execute(stmt)
-        bot_user = result.scalars().first()
+        # Получаем BotUser и Person (через кэш идентификации)
+        identity = await identity_cache.get(session, tg_id)
         
-        if not bot_user:
+        if not identity:
             await message.answer(
                 "❌ Вы не зарегистрированы в системе.\n\n"
                 "Используйте /start для регистрации."
             )
             return
         
-        # Получаем Person (для ФИО)
-        person = None
-        if bot_user.person_id:
-            person_stmt = select(Person).where(Person.id == bot_user.person_id)
-            person_result = await session.execute(person_stmt)
-            person = person_result.scalars().first()
-        
-        if not person:
+        # Нужна связь с Person (для ФИО)
+        if not identity.person_id:
             await message.answer(
                 "❌ Ваши данные не найдены в системе.\n\n"
                 "Обратитесь к администратору @yanejettt"
@@ -661,7 +507,7 @@ async def reserv_booking_start(message: types.Message, state: FSMContext):
         
         # Проверяем, есть ли уже запись
         existing_stmt = select(ReservBooking).where(
-            ReservBooking.bot_user_id == bot_user.id,
+            ReservBooking.bot_user_id == identity.bot_user_id,
             ReservBooking.status == 'confirmed'
         )
         existing_result = await session.execute(existing_stmt)
@@ -686,10 +532,10 @@ async def reserv_booking_start(message: types.Message, state: FSMContext):
             return
         
         # Показываем доступные слоты
-        await show_reserv_slots(message, session, bot_user, person, state)
+        await show_reserv_slots(message, session, identity, state)
 
 
-async def show_reserv_slots(message: types.Message, session, bot_user: BotUser, person: Person, state: FSMContext):
+async def show_reserv_slots(message: types.Message, session, identity: UserIdentity, state: FSMContext):
     """Показывает доступные временные слоты для записи на резерв."""
     
     # Получаем текущее время в Москве
@@ -749,8 +595,8 @@ async def show_reserv_slots(message: types.Message, session, bot_user: BotUser,
     # Сохраняем данные в state
     await state.update_data(
         time_slots_ids=time_slots_ids,
-        person_id=person.id,
-        bot_user_id=bot_user.id
+        person_id=identity.person_id,
+        bot_user_id=identity.bot_user_id
     )
     
     # Формируем кнопки (вертикально, одна под другой)
@@ -877,16 +723,6 @@ async def reserv_confirm_callback(callback: types.CallbackQuery, state: FSMConte
                 await state.clear()
                 return
             
-            # Получаем собеседующего
-            interviewer_stmt = select(Interviewer).where(Interviewer.id == slot.interviewer_id)
-            interviewer_result = await session.execute(interviewer_stmt)
-            interviewer = interviewer_result.scalars().first()
-            
-            # Получаем данные кандидата
-            person_stmt = select(Person).where(Person.id == person_id)
-            person_result = await session.execute(person_stmt)
-            person = person_result.scalars().first()
-            
             # Создаем запись
             booking = ReservBooking(
                 time_slot_id=slot.id,
@@ -900,14 +736,18 @@ async def reserv_confirm_callback(callback: types.CallbackQuery, state: FSMConte
             # Помечаем слот как занятый
             slot.is_available = False
             session.add(slot)
+            await session.flush()
             
-            await session.commit()
+            # Строка витрины: кандидат, слот и собеседующий одним запросом, в той же транзакции
+            booking_row = await sync_booking_view(session, KIND_RESERV, booking.id)
+            # Экспорт в Google Sheets — через очередь sheet_outbox, в той же транзакции
+            if booking_row:
+                payload = booking_payload(booking_row)
+                await enqueue_sheet_export(session, RESERV_MATRIX, f'reserv:{booking.id}:matrix', payload)
+                await enqueue_sheet_export(session, RESERV_ALL, f'reserv:{booking.id}:all', payload)
             
-            # Refresh объектов для использования вне сессии
-            await session.refresh(booking)
-            await session.refresh(slot)
-            await session.refresh(interviewer)
-            await session.refresh(person)
+            await session.commit()
+            sheet_outbox_relay.wake()
             
             # Отправляем подтверждение кандидату
             await callback.message.edit_text(
@@ -919,34 +759,26 @@ async def reserv_confirm_callback(callback: types.CallbackQuery, state: FSMConte
             )
             
             # Отправляем уведомление собеседующему
-            if interviewer and interviewer.telegram_id:
+            if booking_row and booking_row.interviewer_tg_id:
                 try:
                     # Получаем бота из callback
                     bot = callback.bot
                     
-                    candidate_username = person.telegram_username if person and person.telegram_username else "не указан"
-                    if candidate_username and not candidate_username.startswith('@'):
-                        candidate_username = f"@{candidate_username}"
+                    candidate_username = f"@{booking_row.candidate_username}" if booking_row.candidate_username else "не указан"
                     
                     notification_text = (
                         f"📌 Новая запись на собеседование!\n\n"
-                        f"👤 Кандидат: {person.full_name if person else 'Неизвестен'}\n"
+                        f"👤 Кандидат: {booking_row.candidate_name}\n"
                         f"📱 Telegram: {candidate_username}\n"
                         f"📋 Тип: Резерв\n"
                         f"📅 Дата: 08.11.2025\n"
                         f"⏰ Время: {slot.time_start} - {slot.time_end}\n"
                     )
                     
-                    await bot.send_message(interviewer.telegram_id, notification_text)
+                    await bot.send_message(booking_row.interviewer_tg_id, notification_text)
                 except Exception as e:
                     print(f"Ошибка отправки уведомления собеседующему: {e}")
         
-            # Экспорт в Google Sheets (асинхронно, с задержкой)
-            # Запускаем ВНЕ сессии, чтобы не было проблем с detached объектами
-            asyncio.create_task(
-                export_reserv_booking_to_sheets(booking, slot, interviewer, person)
-            )
-            
             await state.clear()
             try:
                 await callback.answer("✅ Запись создана!")
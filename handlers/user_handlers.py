@@ -2,8 +2,12 @@ from aiogram import Router, types
 from aiogram.filters import CommandStart, Command
 from aiogram.types import Message
 from db.engine import async_session_maker
-from db.models import Person, BotUser
-from sqlalchemy import select, func
+from db.routing import report_session
+from db.queries import list_people_with_bot_status, list_linked_bot_users
+from db.stats_views import stats_refresher, CAMPAIGN_STATS
+from db.registration import register_bot_user
+from utils.person_search import search_people
+from utils.identity_cache import identity_cache
 
 
 user_router = Router()
@@ -15,57 +19,21 @@ async def user_start(message: types.Message):
 
     Логика:
     - взять message.from_user.id и username (если есть)
-    - поискать в таблице Person запись с таким telegram_username (внутри БД предполагается формат с @, но проверим оба варианта)
-    - если найдена запись Person — создать или обновить BotUser, связать person_id
+    - одним запросом (db.registration) найти Person по нормализованному username,
+      создать или обновить BotUser и связать person_id
     - вернуть пользователю короткое подтверждение
     """
-    tg_user = message.from_user
-    tg_id = tg_user.id
-    raw_username = tg_user.username
-
-    # Нормализуем username: удаляем ведущий @ (если есть) и приводим к нижнему регистру
-    if raw_username:
-        username = str(raw_username).strip().lstrip('@').lower()
-        username_with_at = f"@{username}"
-    else:
-        username = None
-        username_with_at = None
+    tg_id = message.from_user.id
 
     async with async_session_maker() as session:
-        # Попытаемся найти Person по username с @ или без
-        person_stmt = None
-        if username_with_at:
-            person_stmt = select(Person).where(
-                (Person.telegram_username == username_with_at) | (Person.telegram_username == username)
-            )
-        else:
-            person_stmt = select(Person).where(Person.telegram_username == None)
-
-        result = await session.execute(person_stmt)
-        person = result.scalars().first()
-
-        # Создаём или обновляем BotUser
-        stmt = select(BotUser).where(BotUser.tg_id == tg_id)
-        res = await session.execute(stmt)
-        bot_user = res.scalars().first()
+        # Один запрос: поиск Person по username + INSERT ... ON CONFLICT (tg_id) DO UPDATE
+        registration = await register_bot_user(session, tg_id, message.from_user.username)
+        await session.commit()
 
-        if bot_user:
-            # Обновляем username (храним в БД нормализованный вариант без @) и связь на Person при необходимости
-            changed = False
-            # bot_user.telegram_username в базе ожидается без @ и в нижнем регистре
-            if username and bot_user.telegram_username != username:
-                bot_user.telegram_username = username
-                changed = True
-            if person and bot_user.person_id != person.id:
-                bot_user.person_id = person.id
-                changed = True
-            if changed:
-                session.add(bot_user)
-                await session.commit()
-        else:
-            bot_user = BotUser(tg_id=tg_id, telegram_username=username, person_id=person.id if person else None)
-            session.add(bot_user)
-            await session.commit()
+    if registration.changed:
+        # Связь могла измениться — сбрасываем кэш идентификации и статистику получателей
+        identity_cache.invalidate(tg_id)
+        stats_refresher.mark_dirty(CAMPAIGN_STATS)
 
     START_MESSAGE = (
         "Привет!\n\n"
@@ -76,8 +44,8 @@ async def user_start(message: types.Message):
     await message.answer(text=START_MESSAGE)
 
     # Если найдена запись в базе — дополнительно подтверждаем связь
-    if person:
-        await message.answer(text=f"{person.full_name}, твоя анкета найдена !")
+    if registration.full_name:
+        await message.answer(text=f"{registration.full_name}, твоя анкета найдена !")
     else:
         await message.answer(text=(
             "Если у вас скрыт или отсутствует Telegram‑username, либо мы не нашли вашу запись в базе,\n"
@@ -93,19 +61,9 @@ async def get_people_by_faculty(message: types.Message):
     1. Людей, которые добавились в бота (есть в BotUser)
     2. Людей, которых нет в боте (есть в Person, но нет в BotUser) с их телеграмами
     """
-    async with async_session_maker() as session:
-        # Получаем всех людей с их факультетами
-        people_stmt = select(Person).where(Person.faculty.isnot(None)).order_by(Person.faculty, Person.full_name)
-        people_result = await session.execute(people_stmt)
-        all_people = people_result.scalars().all()
-        
-        # Получаем всех пользователей бота с их связанными Person
-        bot_users_stmt = select(BotUser).where(BotUser.person_id.isnot(None))
-        bot_users_result = await session.execute(bot_users_stmt)
-        bot_users = bot_users_result.scalars().all()
-        
-        # Создаем множество ID людей, которые есть в боте
-        people_in_bot_ids = {bu.person_id for bu in bot_users}
+    async with report_session() as session:
+        # Все люди с факультетами и признаком «есть в боте» (одним запросом)
+        all_people = await list_people_with_bot_status(session)
         
         # Группируем людей по факультетам
         faculty_groups = {}
@@ -114,7 +72,7 @@ async def get_people_by_faculty(message: types.Message):
             if faculty not in faculty_groups:
                 faculty_groups[faculty] = {"in_bot": [], "not_in_bot": []}
             
-            if person.id in people_in_bot_ids:
+            if person.in_bot:
                 faculty_groups[faculty]["in_bot"].append(person)
             else:
                 faculty_groups[faculty]["not_in_bot"].append(person)
@@ -169,47 +127,23 @@ async def user_co(message: types.Message):
     
     Логика:
     - Проверяем, есть ли пользователь уже в BotUser
-    - Если НЕТ - выполняем логику /start (поиск в Person и создание BotUser)
+    - Если НЕТ - выполняем логику /start (db.registration, один запрос)
     - Если ЕСТЬ - показываем сообщение о том, что пользователь уже зарегистрирован
     """
-    tg_user = message.from_user
-    tg_id = tg_user.id
-    raw_username = tg_user.username
-
-    # Нормализуем username: удаляем ведущий @ (если есть) и приводим к нижнему регистру
-    if raw_username:
-        username = str(raw_username).strip().lstrip('@').lower()
-        username_with_at = f"@{username}"
-    else:
-        username = None
-        username_with_at = None
+    tg_id = message.from_user.id
 
     async with async_session_maker() as session:
-        # Сначала проверяем, есть ли пользователь уже в BotUser
-        existing_bot_user_stmt = select(BotUser).where(BotUser.tg_id == tg_id)
-        existing_result = await session.execute(existing_bot_user_stmt)
-        existing_bot_user = existing_result.scalars().first()
+        # Сначала проверяем, есть ли пользователь уже в BotUser (вместе с Person, через кэш)
+        existing_identity = await identity_cache.get(session, tg_id)
 
         # Если пользователь уже есть в BotUser - показываем сообщение
-        if existing_bot_user:
-            # Загружаем связанную Person явно в рамках сессии
-            if existing_bot_user.person_id:
-                person_stmt = select(Person).where(Person.id == existing_bot_user.person_id)
-                person_result = await session.execute(person_stmt)
-                linked_person = person_result.scalars().first()
-                
-                if linked_person:
-                    await message.answer(
-                        f"Привет, {linked_person.full_name}!\n\n"
-                        "Ты уже зарегистрирован в боте. Здесь будет приходить рассылка важной информации, "
-                        "поэтому не ставь его в мьют и следи за новостями. 🤍"
-                    )
-                else:
-                    await message.answer(
-                        "Ты уже зарегистрирован в боте!\n\n"
-                        "Здесь будет приходить рассылка важной информации, "
-                        "поэтому не ставь его в мьют и следи за новостями. 🤍"
-                    )
+        if existing_identity:
+            if existing_identity.full_name:
+                await message.answer(
+                    f"Привет, {existing_identity.full_name}!\n\n"
+                    "Ты уже зарегистрирован в боте. Здесь будет приходить рассылка важной информации, "
+                    "поэтому не ставь его в мьют и следи за новостями. 🤍"
+                )
             else:
                 await message.answer(
                     "Ты уже зарегистрирован в боте!\n\n"
@@ -218,24 +152,14 @@ async def user_co(message: types.Message):
                 )
             return
 
-        # Если пользователя нет в BotUser - выполняем логику /start
-        # Попытаемся найти Person по username с @ или без
-        person_stmt = None
-        if username_with_at:
-            person_stmt = select(Person).where(
-                (Person.telegram_username == username_with_at) | (Person.telegram_username == username)
-            )
-        else:
-            person_stmt = select(Person).where(Person.telegram_username == None)
-
-        result = await session.execute(person_stmt)
-        person = result.scalars().first()
-
-        # Создаём BotUser (так как мы уже проверили, что его нет)
-        bot_user = BotUser(tg_id=tg_id, telegram_username=username, person_id=person.id if person else None)
-        session.add(bot_user)
+        # Если пользователя нет в BotUser - выполняем логику /start (один запрос)
+        registration = await register_bot_user(session, tg_id, message.from_user.username)
         await session.commit()
 
+    if registration.changed:
+        identity_cache.invalidate(tg_id)
+        stats_refresher.mark_dirty(CAMPAIGN_STATS)
+
     CO_MESSAGE = (
         "Привет!\n\n"
         "Это бот «Школы Актива», здесь будет приходить рассылка важной информации, поэтому не ставь его в мьют и следи за новостями. 🤍"
@@ -245,8 +169,8 @@ async def user_co(message: types.Message):
     await message.answer(text=CO_MESSAGE)
 
     # Если найдена запись в базе — дополнительно подтверждаем связь
-    if person:
-        await message.answer(text=f"{person.full_name}, твоя анкета найдена!")
+    if registration.full_name:
+        await message.answer(text=f"{registration.full_name}, твоя анкета найдена!")
     else:
         await message.answer(text=(
             "Если у вас скрыт или отсутствует Telegram‑username, либо мы не нашли вашу запись в базе,\n"
@@ -257,34 +181,21 @@ async def user_co(message: types.Message):
 @user_router.message(Command('get_all_users'))
 async def get_all_users(message: types.Message):
     """Команда для получения списка всех пользователей с их юзернеймами."""
-    async with async_session_maker() as session:
-        # Получаем всех пользователей бота с их связанными Person
-        bot_users_stmt = select(BotUser).where(BotUser.person_id.isnot(None))
-        bot_users_result = await session.execute(bot_users_stmt)
-        bot_users = bot_users_result.scalars().all()
+    async with report_session() as session:
+        # Пользователи бота, связанные с Person (только нужные поля)
+        bot_users = await list_linked_bot_users(session)
         
         if not bot_users:
             await message.answer("В боте пока нет зарегистрированных пользователей.")
             return
         
-        # Загружаем связанные Person для всех пользователей
-        person_ids = [bu.person_id for bu in bot_users]
-        people_stmt = select(Person).where(Person.id.in_(person_ids)).order_by(Person.full_name)
-        people_result = await session.execute(people_stmt)
-        people = people_result.scalars().all()
-        
-        # Создаем словарь для быстрого поиска Person по ID
-        people_dict = {person.id: person for person in people}
-        
         # Формируем сообщения
         response_text = f"👥 Все пользователи бота ({len(bot_users)} чел.):\n\n"
         
         for bot_user in bot_users:
-            person = people_dict.get(bot_user.person_id)
-            if person:
-                telegram_info = f"@{bot_user.telegram_username}" if bot_user.telegram_username else "нет юзернейма"
-                faculty_info = f" ({person.faculty})" if person.faculty else ""
-                response_text += f"• {person.full_name}{faculty_info} - {telegram_info}\n"
+            telegram_info = f"@{bot_user.telegram_username}" if bot_user.telegram_username else "нет юзернейма"
+            faculty_info = f" ({bot_user.faculty})" if bot_user.faculty else ""
+            response_text += f"• {bot_user.full_name}{faculty_info} - {telegram_info}\n"
         
         # Разбиваем на части, если сообщение слишком длинное
         max_length = 4000
@@ -319,18 +230,16 @@ async def search_by_name(message: types.Message):
         return
     
     async with async_session_maker() as session:
-        # Ищем по полному имени (точное совпадение)
-        exact_stmt = select(Person).where(Person.full_name.ilike(f"%{search_query}%"))
-        exact_result = await session.execute(exact_stmt)
-        exact_matches = exact_result.scalars().all()
+        # Нечёткий поиск по нормализованному ФИО (триграммный индекс, топ по похожести)
+        matches, has_more = await search_people(session, search_query)
         
-        if not exact_matches:
+        if not matches:
             await message.answer(f"❌ Участник с именем '{search_query}' не найден.")
             return
         
         # Формируем ответ
-        if len(exact_matches) == 1:
-            person = exact_matches[0]
+        if len(matches) == 1:
+            person = matches[0]
             response_text = f"👤 **{person.full_name}**\n\n"
             
             if person.faculty:
@@ -347,17 +256,15 @@ async def search_by_name(message: types.Message):
             await message.answer(response_text, parse_mode="Markdown")
             
         else:
-            # Если найдено несколько совпадений
-            response_text = f"🔍 Найдено {len(exact_matches)} совпадений для '{search_query}':\n\n"
+            # Если найдено несколько совпадений (уже отсортированы по похожести)
+            response_text = f"🔍 Найдено {len(matches)}{'+' if has_more else ''} совпадений для '{search_query}':\n\n"
             
-            for person in exact_matches[:10]:  # Ограничиваем до 10 результатов
+            for person in matches:
                 telegram_info = f"@{person.telegram_username}" if person.telegram_username else "нет телеграма"
                 faculty_info = f" ({person.faculty})" if person.faculty else ""
                 response_text += f"• {person.full_name}{faculty_info} - {telegram_info}\n"
             
-            if len(exact_matches) > 10:
-                response_text += f"\n... и еще {len(exact_matches) - 10} результатов"
+            if has_more:
+                response_text += f"\n... показаны {len(matches)} наиболее похожих, уточните запрос"
             
             await message.answer(response_text)
-
-
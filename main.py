@@ -6,6 +6,13 @@ from handlers.user_handlers import user_router
 from handlers.admin_handlers import admin_router
 from handlers.interview_handlers import interview_router
 from handlers.reserv_handlers import reserv_router
+from db.engine import async_session_maker
+from db.middleware import DbSessionMiddleware, HandlerContextMiddleware
+from db.partitions import partition_keeper
+from utils.sheets_client import shutdown_sheets_executor
+from utils.sheets_writer import sheets_writer
+from utils.sheet_outbox import sheet_outbox_relay
+from utils.slot_autosync import slot_autosync
 
 
 from dotenv import load_dotenv
@@ -15,12 +22,32 @@ bot = Bot(os.getenv('TOKEN'))
 storage = MemoryStorage()
 dp = Dispatcher(storage=storage)
 
+# Одна ленивая сессия БД на апдейт (аргумент session в хендлерах)
+dp.update.outer_middleware(DbSessionMiddleware(async_session_maker))
+# Имя хендлера для статистики SQL (/db_stats)
+dp.message.middleware(HandlerContextMiddleware())
+dp.callback_query.middleware(HandlerContextMiddleware())
+
 
 dp.include_router(user_router)
 dp.include_router(admin_router)
 dp.include_router(interview_router)
 dp.include_router(reserv_router)
 
+# Партиции co_responses/interview_messages на ближайшие месяцы: сразу и раз в сутки
+dp.startup.register(partition_keeper.start)
+# Фоновая отправка заданий из sheet_outbox
+dp.startup.register(sheet_outbox_relay.start)
+# Периодическая синхронизация слотов из Google Sheets
+dp.startup.register(slot_autosync.start)
+
+# Перед остановкой: останавливаем автосинхронизацию и relay, отправляем накопленные изменения Google Sheets, затем гасим пул потоков
+dp.shutdown.register(slot_autosync.stop)
+dp.shutdown.register(partition_keeper.stop)
+dp.shutdown.register(sheet_outbox_relay.stop)
+dp.shutdown.register(sheets_writer.stop)
+dp.shutdown.register(shutdown_sheets_executor)
+
 
 async def main():
     print('Бот работает !')
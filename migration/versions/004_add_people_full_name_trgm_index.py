@@ -0,0 +1,40 @@
+"""add trigram index on normalized people.full_name
+
+Revision ID: 004
+Revises: 003
+Create Date: 2025-11-10
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Расширение для триграммного поиска (similarity, операторы % и <%)
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    # Нормализация ФИО: ё -> е, нижний регистр, схлопывание пробелов.
+    # Должна совпадать с utils.person_search.normalize_full_name
+    op.execute(r"""
+        CREATE OR REPLACE FUNCTION normalize_full_name(value text) RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+            SELECT btrim(regexp_replace(lower(translate(coalesce(value, ''), 'Ёё', 'Ее')), '\s+', ' ', 'g'))
+        $$
+    """)
+
+    # GIN-индекс по нормализованному ФИО (используется и для %, и для LIKE '%...%')
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_people_full_name_trgm "
+        "ON people USING gin (normalize_full_name(full_name) gin_trgm_ops)"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_people_full_name_trgm")
+    op.execute("DROP FUNCTION IF EXISTS normalize_full_name(text)")
@@ -0,0 +1,31 @@
+"""create cache_versions table
+
+Revision ID: 005
+Revises: 004
+Create Date: 2025-11-10
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Версии справочных данных: бот сверяет их и сбрасывает свои кэши
+    op.create_table('cache_versions',
+        sa.Column('name', sa.String(length=64), nullable=False),
+        sa.Column('version', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('name')
+    )
+    op.execute("INSERT INTO cache_versions (name, version) VALUES ('people', 1), ('reserv', 1)")
+
+
+def downgrade() -> None:
+    op.drop_table('cache_versions')
@@ -0,0 +1,55 @@
+"""add foreign-key and lookup indexes
+
+Revision ID: 006
+Revises: 005
+Create Date: 2025-11-10
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+
+# (имя индекса, таблица, колонки) — составные индексы повторяют фильтры хендлеров
+INDEXES = [
+    # /my_interviews, /sobes: записи пользователя с нужным статусом
+    ('ix_interviews_bot_user_id_status', 'interviews', ['bot_user_id', 'status']),
+    # /podrobno, /sobeser_stats: записи собеседующего
+    ('ix_interviews_interviewer_id_status', 'interviews', ['interviewer_id', 'status']),
+    ('ix_interviews_status', 'interviews', ['status']),
+    # Ответ на рассылку: есть ли уже ответ пользователя в кампании
+    ('ix_co_responses_campaign_id_bot_user_id', 'co_responses', ['campaign_id', 'bot_user_id']),
+    ('ix_co_responses_bot_user_id', 'co_responses', ['bot_user_id']),
+    ('ix_co_campaigns_faculty', 'co_campaigns', ['faculty']),
+    # Статистика резерва: факультет + ответ
+    ('ix_reserv_faculty_last_answer', 'reserv', ['faculty', 'last_answer']),
+    ('ix_reserv_bookings_bot_user_id_status', 'reserv_bookings', ['bot_user_id', 'status']),
+    ('ix_finfak_bookings_bot_user_id_status', 'finfak_bookings', ['bot_user_id', 'status']),
+    ('ix_interview_messages_interview_id', 'interview_messages', ['interview_id']),
+    ('ix_interview_messages_to_user_id', 'interview_messages', ['to_user_id']),
+    # Слоты собеседующего по дате/времени
+    ('ix_time_slots_interviewer_id_date_time_start', 'time_slots', ['interviewer_id', 'date', 'time_start']),
+    ('ix_reserv_time_slots_date_time_start', 'reserv_time_slots', ['date', 'time_start']),
+    ('ix_finfak_time_slots_date_time_start', 'finfak_time_slots', ['date', 'time_start']),
+]
+
+
+def upgrade() -> None:
+    # CONCURRENTLY не блокирует запись в таблицы работающим ботом,
+    # но не может выполняться внутри транзакции
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False,
+                            postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table,
+                          postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,92 @@
+"""create faculty stats materialized views
+
+Revision ID: 007
+Revises: 006
+Create Date: 2025-11-11
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Статистика рассылок CO по факультету и кампании (campaign_id = 0 — все кампании факультета)
+    op.execute("""
+        CREATE MATERIALIZED VIEW faculty_campaign_stats AS
+        WITH faculties AS (
+            SELECT DISTINCT faculty FROM people
+            WHERE faculty IS NOT NULL AND faculty <> ''
+        ),
+        recipients AS (
+            SELECT p.faculty, count(b.id) AS recipients
+            FROM people p
+            JOIN bot_users b ON b.person_id = p.id
+            GROUP BY p.faculty
+        ),
+        answers AS (
+            SELECT c.faculty, c.id AS campaign_id, r.bot_user_id, r.answer, p.full_name
+            FROM co_responses r
+            JOIN co_campaigns c ON c.id = r.campaign_id
+            LEFT JOIN bot_users b ON b.id = r.bot_user_id
+            LEFT JOIN people p ON p.id = b.person_id
+        ),
+        scoped AS (
+            SELECT faculty, 0 AS campaign_id, bot_user_id, answer, full_name FROM answers
+            UNION ALL
+            SELECT faculty, campaign_id, bot_user_id, answer, full_name FROM answers
+        ),
+        agg AS (
+            SELECT
+                faculty,
+                campaign_id,
+                count(DISTINCT bot_user_id) FILTER (WHERE answer = 'yes') AS yes_count,
+                count(DISTINCT bot_user_id) FILTER (WHERE answer = 'no') AS no_count,
+                count(DISTINCT bot_user_id) AS answered_count,
+                coalesce(array_agg(DISTINCT full_name) FILTER (WHERE answer = 'yes' AND full_name IS NOT NULL), '{}') AS yes_names,
+                coalesce(array_agg(DISTINCT full_name) FILTER (WHERE answer = 'no' AND full_name IS NOT NULL), '{}') AS no_names
+            FROM scoped
+            GROUP BY faculty, campaign_id
+        )
+        SELECT
+            f.faculty,
+            coalesce(a.campaign_id, 0) AS campaign_id,
+            coalesce(r.recipients, 0) AS recipients,
+            coalesce(a.yes_count, 0) AS yes_count,
+            coalesce(a.no_count, 0) AS no_count,
+            coalesce(a.answered_count, 0) AS answered_count,
+            coalesce(a.yes_names, '{}') AS yes_names,
+            coalesce(a.no_names, '{}') AS no_names
+        FROM faculties f
+        LEFT JOIN recipients r ON r.faculty = f.faculty
+        LEFT JOIN agg a ON a.faculty = f.faculty
+    """)
+    # Уникальный индекс обязателен для REFRESH MATERIALIZED VIEW CONCURRENTLY
+    op.execute("CREATE UNIQUE INDEX ux_faculty_campaign_stats ON faculty_campaign_stats (faculty, campaign_id)")
+
+    # Статистика рассылок Reserv по факультету
+    op.execute("""
+        CREATE MATERIALIZED VIEW faculty_reserv_stats AS
+        SELECT
+            faculty,
+            count(*) AS total,
+            count(*) FILTER (WHERE message_sent) AS sent,
+            count(*) FILTER (WHERE last_answer = 'yes') AS yes_count,
+            count(*) FILTER (WHERE last_answer = 'no') AS no_count,
+            coalesce(array_agg(full_name ORDER BY full_name) FILTER (WHERE last_answer = 'yes'), '{}') AS yes_names,
+            coalesce(array_agg(full_name ORDER BY full_name) FILTER (WHERE last_answer = 'no'), '{}') AS no_names
+        FROM reserv
+        WHERE faculty IS NOT NULL AND faculty <> ''
+        GROUP BY faculty
+    """)
+    op.execute("CREATE UNIQUE INDEX ux_faculty_reserv_stats ON faculty_reserv_stats (faculty)")
+
+
+def downgrade() -> None:
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS faculty_reserv_stats")
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS faculty_campaign_stats")
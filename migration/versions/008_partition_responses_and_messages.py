@@ -0,0 +1,191 @@
+"""partition co_responses and interview_messages by month
+
+Revision ID: 008
+Revises: 007
+Create Date: 2025-11-11
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+
+# Сколько месяцев вперёд создавать партиции сразу (дальше — db.partitions.ensure_partitions)
+MONTHS_AHEAD = 2
+
+# Представление из миграции 007 зависит от co_responses — пересоздаём его
+FACULTY_CAMPAIGN_STATS_SQL = """
+    CREATE MATERIALIZED VIEW faculty_campaign_stats AS
+    WITH faculties AS (
+        SELECT DISTINCT faculty FROM people
+        WHERE faculty IS NOT NULL AND faculty <> ''
+    ),
+    recipients AS (
+        SELECT p.faculty, count(b.id) AS recipients
+        FROM people p
+        JOIN bot_users b ON b.person_id = p.id
+        GROUP BY p.faculty
+    ),
+    answers AS (
+        SELECT c.faculty, c.id AS campaign_id, r.bot_user_id, r.answer, p.full_name
+        FROM co_responses r
+        JOIN co_campaigns c ON c.id = r.campaign_id
+        LEFT JOIN bot_users b ON b.id = r.bot_user_id
+        LEFT JOIN people p ON p.id = b.person_id
+    ),
+    scoped AS (
+        SELECT faculty, 0 AS campaign_id, bot_user_id, answer, full_name FROM answers
+        UNION ALL
+        SELECT faculty, campaign_id, bot_user_id, answer, full_name FROM answers
+    ),
+    agg AS (
+        SELECT
+            faculty,
+            campaign_id,
+            count(DISTINCT bot_user_id) FILTER (WHERE answer = 'yes') AS yes_count,
+            count(DISTINCT bot_user_id) FILTER (WHERE answer = 'no') AS no_count,
+            count(DISTINCT bot_user_id) AS answered_count,
+            coalesce(array_agg(DISTINCT full_name) FILTER (WHERE answer = 'yes' AND full_name IS NOT NULL), '{}') AS yes_names,
+            coalesce(array_agg(DISTINCT full_name) FILTER (WHERE answer = 'no' AND full_name IS NOT NULL), '{}') AS no_names
+        FROM scoped
+        GROUP BY faculty, campaign_id
+    )
+    SELECT
+        f.faculty,
+        coalesce(a.campaign_id, 0) AS campaign_id,
+        coalesce(r.recipients, 0) AS recipients,
+        coalesce(a.yes_count, 0) AS yes_count,
+        coalesce(a.no_count, 0) AS no_count,
+        coalesce(a.answered_count, 0) AS answered_count,
+        coalesce(a.yes_names, '{}') AS yes_names,
+        coalesce(a.no_names, '{}') AS no_names
+    FROM faculties f
+    LEFT JOIN recipients r ON r.faculty = f.faculty
+    LEFT JOIN agg a ON a.faculty = f.faculty
+"""
+
+# Пересоздаваемые таблицы: ключ партиционирования, колонки, выражение копирования, индексы
+TABLES = {
+    'co_responses': {
+        'key': 'responded_at',
+        'columns': """
+            id integer NOT NULL DEFAULT nextval('co_responses_id_seq'),
+            campaign_id integer NOT NULL REFERENCES co_campaigns (id),
+            bot_user_id integer NOT NULL REFERENCES bot_users (id),
+            answer varchar(16) NOT NULL,
+            responded_at timestamptz NOT NULL DEFAULT now()
+        """,
+        'copy': "id, campaign_id, bot_user_id, answer, coalesce(responded_at, now())",
+        'indexes': [
+            ('ix_co_responses_id', ['id']),
+            ('ix_co_responses_campaign_id_bot_user_id', ['campaign_id', 'bot_user_id']),
+            ('ix_co_responses_bot_user_id', ['bot_user_id']),
+        ],
+    },
+    'interview_messages': {
+        'key': 'created_at',
+        'columns': """
+            id integer NOT NULL DEFAULT nextval('interview_messages_id_seq'),
+            interview_id integer NOT NULL REFERENCES interviews (id),
+            from_user_id bigint NOT NULL,
+            to_user_id bigint NOT NULL,
+            message_text varchar(4000) NOT NULL,
+            message_id bigint,
+            is_read boolean,
+            created_at timestamptz NOT NULL DEFAULT now()
+        """,
+        'copy': "id, interview_id, from_user_id, to_user_id, message_text, message_id, is_read, coalesce(created_at, now())",
+        'indexes': [
+            ('ix_interview_messages_id', ['id']),
+            ('ix_interview_messages_interview_id', ['interview_id']),
+            ('ix_interview_messages_to_user_id', ['to_user_id']),
+        ],
+    },
+}
+
+
+def upgrade() -> None:
+    # Создаёт (если нет) партицию родительской таблицы за месяц, содержащий month
+    op.execute("""
+        CREATE OR REPLACE FUNCTION ensure_monthly_partition(parent text, month date) RETURNS text AS $$
+        DECLARE
+            start_date date := date_trunc('month', month)::date;
+            end_date date := (date_trunc('month', month) + interval '1 month')::date;
+            part_name text := format('%s_%s', parent, to_char(start_date, 'YYYY_MM'));
+        BEGIN
+            EXECUTE format(
+                'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                part_name, parent, start_date, end_date
+            );
+            RETURN part_name;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS faculty_campaign_stats")
+
+    for table, spec in TABLES.items():
+        key = spec['key']
+        old = f'{table}_old'
+
+        # Последовательность id переживает пересоздание таблицы
+        op.execute(f"ALTER TABLE {table} RENAME TO {old}")
+        op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+
+        op.execute(f"CREATE TABLE {table} ({spec['columns']}) PARTITION BY RANGE ({key})")
+        op.execute(f"""
+            SELECT ensure_monthly_partition('{table}', m::date)
+            FROM generate_series(
+                date_trunc('month', coalesce((SELECT min({key}) FROM {old}), now())),
+                date_trunc('month', now()) + interval '{MONTHS_AHEAD} months',
+                interval '1 month'
+            ) AS m
+        """)
+        # Строки вне созданных месяцев не теряются
+        op.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+
+        op.execute(f"INSERT INTO {table} SELECT {spec['copy']} FROM {old}")
+        op.execute(f"DROP TABLE {old}")
+
+        # Ключ партиционирования обязан входить в первичный ключ
+        op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (id, {key})")
+        op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+        for name, columns in spec['indexes']:
+            op.create_index(name, table, columns, unique=False)
+
+    op.execute(FACULTY_CAMPAIGN_STATS_SQL)
+    op.execute("CREATE UNIQUE INDEX ux_faculty_campaign_stats ON faculty_campaign_stats (faculty, campaign_id)")
+
+
+def downgrade() -> None:
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS faculty_campaign_stats")
+
+    for table, spec in TABLES.items():
+        key = spec['key']
+        partitioned = f'{table}_partitioned'
+
+        op.execute(f"ALTER TABLE {table} RENAME TO {partitioned}")
+        op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+        op.execute(f"ALTER TABLE {partitioned} DROP CONSTRAINT {table}_pkey")
+        for name, _ in spec['indexes']:
+            op.drop_index(name, table_name=partitioned)
+
+        op.execute(f"CREATE TABLE {table} ({spec['columns']})")
+        op.execute(f"ALTER TABLE {table} ALTER COLUMN {key} DROP NOT NULL")
+        op.execute(f"INSERT INTO {table} SELECT * FROM {partitioned}")
+        op.execute(f"DROP TABLE {partitioned}")
+
+        op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (id)")
+        op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+        for name, columns in spec['indexes']:
+            op.create_index(name, table, columns, unique=False)
+
+    op.execute("DROP FUNCTION IF EXISTS ensure_monthly_partition(text, date)")
+
+    op.execute(FACULTY_CAMPAIGN_STATS_SQL)
+    op.execute("CREATE UNIQUE INDEX ux_faculty_campaign_stats ON faculty_campaign_stats (faculty, campaign_id)")
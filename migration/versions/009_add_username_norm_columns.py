@@ -0,0 +1,56 @@
+"""add generated username_norm columns with unique indexes
+
+Revision ID: 009
+Revises: 008
+Create Date: 2025-11-12
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '009'
+down_revision = '008'
+branch_labels = None
+depends_on = None
+
+
+TABLES = ['people', 'reserv', 'uchastniki']
+
+USERNAME_NORM = "lower(ltrim(telegram_username, '@'))"
+
+
+def upgrade() -> None:
+    # Уникальный индекс не создастся, если уже есть записи, отличающиеся только регистром или '@'
+    bind = op.get_bind()
+    duplicates = []
+    for table in TABLES:
+        rows = bind.execute(sa.text(f"""
+            SELECT {USERNAME_NORM} AS username_norm, count(*), string_agg(id::text, ', ' ORDER BY id)
+            FROM {table}
+            WHERE telegram_username IS NOT NULL
+            GROUP BY 1
+            HAVING count(*) > 1
+        """)).fetchall()
+        for username_norm, count, ids in rows:
+            duplicates.append(f"{table}: @{username_norm} — {count} записей (id: {ids})")
+    if duplicates:
+        raise RuntimeError(
+            "Найдены дубликаты telegram_username без учёта регистра и '@'. "
+            "Удалите или исправьте их и повторите миграцию:\n" + '\n'.join(duplicates)
+        )
+
+    for table in TABLES:
+        op.add_column(table, sa.Column(
+            'username_norm', sa.String(length=64),
+            sa.Computed(USERNAME_NORM, persisted=True), nullable=True
+        ))
+        # Ключ слияния для db.bulk_load (INSERT ... ON CONFLICT (username_norm))
+        op.create_index(f'ux_{table}_username_norm', table, ['username_norm'], unique=True)
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.drop_index(f'ux_{table}_username_norm', table_name=table)
+        op.drop_column(table, 'username_norm')
@@ -0,0 +1,106 @@
+"""create booking_view read model
+
+Revision ID: 010
+Revises: 009
+Create Date: 2025-11-12
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '010'
+down_revision = '009'
+branch_labels = None
+depends_on = None
+
+
+# Заполнение витрины из существующих записей (правила — как в db/booking_view.py на момент миграции)
+BACKFILL_SQL = """
+    INSERT INTO booking_view (
+        kind, booking_id, status, candidate_name, candidate_username, faculty,
+        date, time_start, time_end, interviewer_id, interviewer_name,
+        interviewer_username, interviewer_sheet_id, interviewer_tg_id, created_at
+    )
+    SELECT '{kind}', bk.id, coalesce(bk.status, 'confirmed'), {candidate_name}, {candidate_username}, {faculty},
+           s.date, s.time_start, s.time_end, iv.id, iv.full_name, iv.telegram_username,
+           iv.interviewer_sheet_id, iv.telegram_id, bk.created_at
+    FROM {booking_table} bk
+    JOIN {slot_table} s ON s.id = bk.time_slot_id
+    JOIN interviewers iv ON iv.id = bk.interviewer_id
+    LEFT JOIN bot_users b ON b.id = bk.bot_user_id
+    LEFT JOIN people p ON p.id = bk.person_id
+"""
+
+SOURCES = [
+    {
+        'kind': 'sobes',
+        'booking_table': 'interviews',
+        'slot_table': 'time_slots',
+        'candidate_name': """CASE
+            WHEN bk.person_id IS NOT NULL THEN coalesce(p.full_name, 'Не указано')
+            WHEN b.telegram_username IS NOT NULL THEN '@' || b.telegram_username
+            ELSE 'Не указано' END""",
+        'candidate_username': "b.telegram_username",
+        'faculty': "bk.faculty",
+    },
+    {
+        'kind': 'reserv',
+        'booking_table': 'reserv_bookings',
+        'slot_table': 'reserv_time_slots',
+        'candidate_name': "coalesce(p.full_name, 'Неизвестен')",
+        'candidate_username': "ltrim(coalesce(p.telegram_username, b.telegram_username), '@')",
+        'faculty': "p.faculty",
+    },
+    {
+        'kind': 'finfak',
+        'booking_table': 'finfak_bookings',
+        'slot_table': 'finfak_time_slots',
+        'candidate_name': "coalesce(p.full_name, 'Неизвестен')",
+        'candidate_username': "ltrim(coalesce(p.telegram_username, b.telegram_username), '@')",
+        'faculty': "'Финфак'",
+    },
+]
+
+
+def upgrade() -> None:
+    # Денормализованные записи на собеседования для экспорта и /my_interviews
+    op.create_table('booking_view',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=16), nullable=False),
+        sa.Column('booking_id', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('candidate_name', sa.String(length=255), nullable=False),
+        sa.Column('candidate_username', sa.String(length=64), nullable=True),
+        sa.Column('faculty', sa.String(length=255), nullable=True),
+        sa.Column('date', sa.String(length=10), nullable=True),
+        sa.Column('time_start', sa.String(length=5), nullable=True),
+        sa.Column('time_end', sa.String(length=5), nullable=True),
+        sa.Column('interviewer_id', sa.Integer(), nullable=False),
+        sa.Column('interviewer_name', sa.String(length=255), nullable=True),
+        sa.Column('interviewer_username', sa.String(length=64), nullable=True),
+        sa.Column('interviewer_sheet_id', sa.String(length=64), nullable=True),
+        sa.Column('interviewer_tg_id', sa.BigInteger(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('kind', 'booking_id', name='uq_booking_view_kind_booking_id')
+    )
+    op.create_index(
+        'ix_booking_view_kind_status_created_at', 'booking_view', ['kind', 'status', 'created_at'],
+        postgresql_include=['candidate_name', 'faculty', 'date', 'time_start', 'time_end', 'interviewer_name', 'interviewer_sheet_id'],
+    )
+    op.create_index(
+        'ix_booking_view_interviewer_id_status_date', 'booking_view', ['interviewer_id', 'status', 'date', 'time_start'],
+        postgresql_include=['kind', 'candidate_name', 'candidate_username', 'faculty', 'time_end'],
+    )
+
+    for source in SOURCES:
+        op.execute(BACKFILL_SQL.format(**source))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_booking_view_interviewer_id_status_date', table_name='booking_view')
+    op.drop_index('ix_booking_view_kind_status_created_at', table_name='booking_view')
+    op.drop_table('booking_view')
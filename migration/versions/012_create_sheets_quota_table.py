@@ -0,0 +1,30 @@
+"""create sheets_quota table
+
+Revision ID: 012
+Revises: 011
+Create Date: 2025-11-13
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '012'
+down_revision = '011'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Общие ведра квоты Google Sheets (utils/sheets_quota.py, SHEETS_QUOTA_DB=1)
+    op.create_table('sheets_quota',
+        sa.Column('bucket', sa.String(length=16), nullable=False),
+        sa.Column('tokens', sa.Float(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('bucket')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('sheets_quota')
@@ -0,0 +1,32 @@
+"""create sheet_sync_state table
+
+Revision ID: 013
+Revises: 012
+Create Date: 2025-11-13
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '013'
+down_revision = '012'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Состояние листов с прошлой синхронизации слотов (utils/slot_sync.py)
+    op.create_table('sheet_sync_state',
+        sa.Column('source', sa.String(length=32), nullable=False),
+        sa.Column('sheet_name', sa.String(length=64), nullable=False),
+        sa.Column('content_hash', sa.String(length=40), nullable=False),
+        sa.Column('row_hashes', sa.JSON(), nullable=False),
+        sa.Column('synced_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('source', 'sheet_name')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('sheet_sync_state')
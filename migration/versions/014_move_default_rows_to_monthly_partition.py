@@ -0,0 +1,92 @@
+"""ensure_monthly_partition moves matching rows out of the default partition
+
+Revision ID: 014
+Revises: 013
+Create Date: 2025-11-14
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '014'
+down_revision = '013'
+branch_labels = None
+depends_on = None
+
+
+# Функция из миграции 008: падает, если в {parent}_default уже есть строки за этот месяц
+OLD_FUNCTION_SQL = """
+    CREATE OR REPLACE FUNCTION ensure_monthly_partition(parent text, month date) RETURNS text AS $$
+    DECLARE
+        start_date date := date_trunc('month', month)::date;
+        end_date date := (date_trunc('month', month) + interval '1 month')::date;
+        part_name text := format('%s_%s', parent, to_char(start_date, 'YYYY_MM'));
+    BEGIN
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+            part_name, parent, start_date, end_date
+        );
+        RETURN part_name;
+    END
+    $$ LANGUAGE plpgsql
+"""
+
+
+def upgrade() -> None:
+    # Если бот долго не перезапускался, строки месяца без партиции легли в {parent}_default,
+    # и CREATE TABLE ... PARTITION OF за этот месяц падал. Теперь такие строки переносятся:
+    # default отсоединяется, создаётся партиция месяца, строки переносятся, default присоединяется обратно.
+    op.execute("""
+        CREATE OR REPLACE FUNCTION ensure_monthly_partition(parent text, month date) RETURNS text AS $$
+        DECLARE
+            start_date date := date_trunc('month', month)::date;
+            end_date date := (date_trunc('month', month) + interval '1 month')::date;
+            part_name text := format('%s_%s', parent, to_char(start_date, 'YYYY_MM'));
+            default_name text := format('%s_default', parent);
+            key_column text;
+            has_rows boolean := false;
+        BEGIN
+            IF to_regclass(part_name) IS NOT NULL THEN
+                RETURN part_name;
+            END IF;
+
+            IF to_regclass(default_name) IS NOT NULL THEN
+                SELECT a.attname INTO key_column
+                FROM pg_partitioned_table pt
+                JOIN pg_attribute a ON a.attrelid = pt.partrelid AND a.attnum = pt.partattrs[0]
+                WHERE pt.partrelid = parent::regclass;
+
+                EXECUTE format(
+                    'SELECT EXISTS (SELECT 1 FROM %I WHERE %I >= %L AND %I < %L)',
+                    default_name, key_column, start_date, key_column, end_date
+                ) INTO has_rows;
+            END IF;
+
+            IF NOT has_rows THEN
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                    part_name, parent, start_date, end_date
+                );
+                RETURN part_name;
+            END IF;
+
+            EXECUTE format('ALTER TABLE %I DETACH PARTITION %I', parent, default_name);
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                part_name, parent, start_date, end_date
+            );
+            EXECUTE format(
+                'WITH moved AS (DELETE FROM %I WHERE %I >= %L AND %I < %L RETURNING *) INSERT INTO %I SELECT * FROM moved',
+                default_name, key_column, start_date, key_column, end_date, part_name
+            );
+            EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I DEFAULT', parent, default_name);
+            RAISE NOTICE 'Строки % за % перенесены из % в %', parent, start_date, default_name, part_name;
+            RETURN part_name;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+
+
+def downgrade() -> None:
+    op.execute(OLD_FUNCTION_SQL)
@@ -0,0 +1,51 @@
+"""split reserv/finfak export jobs in sheet_outbox into matrix and all
+
+Revision ID: 015
+Revises: 014
+Create Date: 2025-11-14
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '015'
+down_revision = '014'
+branch_labels = None
+depends_on = None
+
+
+# Старый вид задания -> (вид, суффикс ключа) новых заданий
+SPLIT = {
+    'reserv_export': [('reserv_matrix', 'matrix'), ('reserv_all', 'all')],
+    'finfak_export': [('finfak_matrix', 'matrix'), ('finfak_all', 'all')],
+}
+
+
+def upgrade() -> None:
+    # Неотправленные задания «матрица + всеобщая» превращаются в два независимых
+    # (utils/sheet_outbox.py); отправленные остаются как есть
+    for old_kind, parts in SPLIT.items():
+        for kind, suffix in parts:
+            op.execute(f"""
+                INSERT INTO sheet_outbox (idempotency_key, kind, payload, status, attempts, next_attempt_at, last_error, created_at)
+                SELECT idempotency_key || ':{suffix}', '{kind}', payload, 'pending', 0, now(), NULL, created_at
+                FROM sheet_outbox
+                WHERE kind = '{old_kind}' AND status <> 'done'
+                ON CONFLICT (idempotency_key) DO NOTHING
+            """)
+        op.execute(f"DELETE FROM sheet_outbox WHERE kind = '{old_kind}' AND status <> 'done'")
+
+
+def downgrade() -> None:
+    for old_kind, parts in SPLIT.items():
+        (matrix_kind, matrix_suffix), (all_kind, _) = parts
+        op.execute(f"""
+            INSERT INTO sheet_outbox (idempotency_key, kind, payload, status, attempts, next_attempt_at, last_error, created_at)
+            SELECT left(idempotency_key, length(idempotency_key) - length(':{matrix_suffix}')), '{old_kind}',
+                   payload, 'pending', 0, now(), NULL, created_at
+            FROM sheet_outbox
+            WHERE kind = '{matrix_kind}' AND status <> 'done'
+            ON CONFLICT (idempotency_key) DO NOTHING
+        """)
+        op.execute(f"DELETE FROM sheet_outbox WHERE kind IN ('{matrix_kind}', '{all_kind}') AND status <> 'done'")
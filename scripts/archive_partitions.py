@@ -0,0 +1,107 @@
+"""
+Архивация закрытых сезонов: помесячные партиции co_responses и interview_messages
+старше указанного месяца выгружаются в archive/<таблица>/<ГГГГ_ММ>.csv.gz,
+после чего партиция отсоединяется и удаляется.
+
+Заодно создаются партиции на ближайшие месяцы (как при старте бота).
+
+Usage:
+    python scripts/archive_partitions.py [--before 2025-09] [--dry-run]
+
+    --before: архивировать месяцы строго раньше указанного (по умолчанию — месяц SEASON_START,
+              а если он не задан — начало текущего сезона из db.partitions)
+    --dry-run: только показать, что будет заархивировано
+"""
+import argparse
+import asyncio
+import csv
+import gzip
+import os
+import sys
+from datetime import date, datetime
+from pathlib import Path
+
+# Добавляем корневую директорию проекта в sys.path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from sqlalchemy import text
+from db.engine import async_session_maker
+from db.partitions import PARTITIONED_TABLES, ensure_partitions, list_monthly_partitions, season_start
+from db.stats_views import refresh_stats_view, CAMPAIGN_STATS
+
+
+ARCHIVE_DIR = project_root / 'archive'
+
+
+async def export_partition(session, table: str, partition: str, month: date) -> int:
+    """Выгружает партицию в gzip CSV; возвращает число строк."""
+    target_dir = ARCHIVE_DIR / table
+    target_dir.mkdir(parents=True, exist_ok=True)
+    target = target_dir / f"{month.strftime('%Y_%m')}.csv.gz"
+    tmp_target = target.with_suffix('.gz.tmp')
+
+    rows = 0
+    result = await session.stream(text(f'SELECT * FROM "{partition}" ORDER BY id'))
+    with gzip.open(tmp_target, 'wt', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(result.keys())
+        async for row in result:
+            writer.writerow(row)
+            rows += 1
+
+    # Файл появляется под итоговым именем только целиком
+    os.replace(tmp_target, target)
+    print(f"   💾 {partition}: {rows} строк → {target.relative_to(project_root)}")
+    return rows
+
+
+async def archive_partitions(before: date, dry_run: bool = False):
+    async with async_session_maker() as session:
+        await ensure_partitions(session)
+
+        archived_responses = False
+        for table in PARTITIONED_TABLES:
+            partitions = [(name, month) for name, month in await list_monthly_partitions(session, table) if month < before]
+            print(f"📦 {table}: к архивации {len(partitions)} партиций (раньше {before.strftime('%Y-%m')})")
+
+            for partition, month in partitions:
+                if dry_run:
+                    print(f"   • {partition}")
+                    continue
+
+                rows = await export_partition(session, table, partition, month)
+                count = (await session.execute(text(f'SELECT count(*) FROM "{partition}"'))).scalar()
+                if count != rows:
+                    print(f"   ❌ {partition}: в архиве {rows} строк, в таблице {count} — партиция не удалена")
+                    await session.rollback()
+                    continue
+
+                await session.execute(text(f'ALTER TABLE "{table}" DETACH PARTITION "{partition}"'))
+                await session.execute(text(f'DROP TABLE "{partition}"'))
+                await session.commit()
+                print(f"   🗑 {partition} отсоединена и удалена")
+                if table == 'co_responses':
+                    archived_responses = True
+
+    if archived_responses:
+        # Статистика рассылок больше не включает архивные ответы
+        await refresh_stats_view(CAMPAIGN_STATS)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--before', help='Архивировать месяцы раньше этого (ГГГГ-ММ)')
+    parser.add_argument('--dry-run', action='store_true', help='Не вносить изменений, только показать, что будет сделано')
+    args = parser.parse_args()
+
+    if args.before:
+        before = datetime.strptime(args.before, '%Y-%m').date()
+    else:
+        before = season_start().date().replace(day=1)
+
+    asyncio.run(archive_partitions(before, dry_run=args.dry_run))
+
+
+if __name__ == '__main__':
+    main()
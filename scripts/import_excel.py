@@ -16,8 +16,9 @@ Usage:
   - username нормализуется (удаляется ведущий @) и приводится к нижнему регистру.
   - Если username уже есть в БД — запись пропускается.
   - Если username пустой, используется комбинация (full_name, faculty, course) для определения дублей внутри БД и в файле; дубликаты в файле пропускаются (берём первое вхождение).
+  - После импорта пользователи бота без связи связываются с новыми Person (db.linking, один UPDATE).
 
-Скрипт использует асинхронный sessionmaker из `db.engine` и модель `Person` из `db.models`.
+Скрипт использует асинхронный sessionmaker из `db.engine` и массовую загрузку `db.bulk_load` (COPY + INSERT ... ON CONFLICT).
 """
 
 import sys
@@ -32,8 +33,10 @@ except Exception as e:
     raise
 
 from db.engine import async_session_maker
-from db.models import Person
-from sqlalchemy import text
+from db.bulk_load import bulk_upsert
+from db.linking import link_bot_users
+from utils.cache_versions import bump_cache_version, PEOPLE
+from db.stats_views import refresh_stats_view, CAMPAIGN_STATS
 
 
 def detect_columns(header_row):
@@ -76,28 +79,7 @@ async def import_excel(file_path: str):
         print('Файл пустой')
         return
 
-    # Подгружаем существующие значения из БД для ускорения проверок
-    async with async_session_maker() as session:
-        res = await session.execute(text("SELECT telegram_username, lower(full_name), lower(coalesce(faculty, '')), lower(coalesce(course, '')) FROM people"))
-        rows_db = res.fetchall()
-
-    existing_usernames = set()
-    existing_composites = set()
-    for r in rows_db:
-        db_username = r[0]
-        if db_username:
-            existing_usernames.add(str(db_username).lstrip('@').lower())
-        fn = r[1] or ''
-        fac = r[2] or ''
-        co = r[3] or ''
-        existing_composites.add((fn, fac, co))
-
-    to_add = []
-    seen_in_file = set()
-    skipped_existing_db = 0
-    skipped_duplicates_in_file = 0
-
-
+    records = []
     for r in rows:
         # r is a tuple of cell values; fixed positions
         full_name = r[0] if len(r) >= 1 else None
@@ -115,40 +97,35 @@ async def import_excel(file_path: str):
         tg_raw = r[3] if len(r) >= 4 else None
         tg_norm = normalize_username(tg_raw)
 
-        key = tg_norm if tg_norm else (full_name_s.lower(), faculty_s.lower(), course_s.lower())
-        if key in seen_in_file:
-            skipped_duplicates_in_file += 1
-            continue
-        seen_in_file.add(key)
-
-        # Пропускаем, если username уже в БД
-        if tg_norm and tg_norm in existing_usernames:
-            skipped_existing_db += 1
-            continue
+        records.append((full_name_s, course_s or None, faculty_s or None, tg_norm))
 
-        # Пропускаем если composite уже в БД
-        composite = (full_name_s.lower(), faculty_s.lower(), course_s.lower())
-        if composite in existing_composites:
-            skipped_existing_db += 1
-            continue
-
-        p = Person(full_name=full_name_s, course=course_s or None, faculty=faculty_s or None, telegram_username=tg_norm)
-        to_add.append(p)
-
-        # пометим как существующее, чтобы предотвратить дубликаты следующими строками
-        if tg_norm:
-            existing_usernames.add(tg_norm)
-        existing_composites.add(composite)
-
-    if not to_add:
-        print(f'Ничего не добавлено. Пропущено по базе: {skipped_existing_db}, дубликаты в файле: {skipped_duplicates_in_file}')
+    if not records:
+        print('Ничего не добавлено: в файле нет строк с ФИО')
         return
 
+    # Дубликаты (в файле и в базе) отсекаются при слиянии: по username,
+    # а для строк без username — по (ФИО, факультет, курс)
     async with async_session_maker() as session:
-        session.add_all(to_add)
+        result = await bulk_upsert(
+            session, 'people',
+            ['full_name', 'course', 'faculty', 'telegram_username'],
+            records,
+            name_key=('full_name', 'faculty', 'course'),
+        )
+        # Новые люди могли уже писать боту — связываем их одним UPDATE
+        links = await link_bot_users(session) if result.inserted else []
+        if result.inserted:
+            # Сбрасываем кэши бота, зависящие от people
+            await bump_cache_version(session, PEOPLE)
         await session.commit()
 
-    print(f'Импорт завершён. Добавлено: {len(to_add)}. Пропущено по базе: {skipped_existing_db}. Дубликатов в файле: {skipped_duplicates_in_file}')
+    if result.inserted:
+        # Новые факультеты/люди — обновляем статистику рассылок
+        await refresh_stats_view(CAMPAIGN_STATS)
+
+    print(f'Импорт завершён. Добавлено: {result.inserted}. Пропущено (уже в базе или дубликаты в файле): {result.skipped}')
+    if links:
+        print(f'Связано с пользователями бота: {len(links)}')
 
 
 def main():
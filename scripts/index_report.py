@@ -0,0 +1,35 @@
+"""
+Отчёт об использовании индексов: неиспользуемые индексы, таблицы
+с последовательными сканированиями, тяжёлые запросы (pg_stat_statements).
+
+Usage:
+    python scripts/index_report.py [--limit N]
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+# Добавляем корневую директорию проекта в sys.path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from db.engine import async_session_maker
+from utils.db_report import build_index_report
+
+
+async def index_report(limit: int):
+    async with async_session_maker() as session:
+        print(await build_index_report(session, limit))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--limit', type=int, default=10, help='Сколько таблиц/запросов показывать')
+    args = parser.parse_args()
+
+    asyncio.run(index_report(args.limit))
+
+
+if __name__ == '__main__':
+    main()
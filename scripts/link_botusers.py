@@ -3,58 +3,53 @@
 Usage:
   python -m scripts.link_botusers [--dry-run]
 
-This script scans `bot_users` where `person_id` is NULL, normalizes `telegram_username`
-(strip leading @ and lower-case), searches `people` for the same username (case-insensitive)
-and sets `bot_user.person_id = person.id` when match is found.
+This script links every `bot_users` row where `person_id` is NULL to the `people` row
+with the same normalized username (strip leading @, lower-case) using a single
+`UPDATE ... FROM people` statement (see db/linking.py).
 
-By default the script performs changes; pass --dry-run to only report what would be linked.
+By default the script performs changes; pass --dry-run to only report what would be linked
+(the same UPDATE is executed and rolled back).
 """
 
 import asyncio
 import argparse
 from sqlalchemy import select, func
 from db.engine import async_session_maker
-from db.models import BotUser, Person
+from db.models import BotUser
+from db.linking import link_bot_users
+from utils.cache_versions import bump_cache_version, PEOPLE
+from db.stats_views import refresh_stats_view, CAMPAIGN_STATS
 
 
 async def link_botusers(dry_run: bool = False):
-    linked = 0
-    skipped_no_username = 0
-    not_found = 0
-
     async with async_session_maker() as session:
-        stmt = select(BotUser).where(BotUser.person_id == None)
-        res = await session.execute(stmt)
-        bots = res.scalars().all()
-
-        print(f'Найдено BotUser без связи: {len(bots)}')
-
-        for bu in bots:
-            uname = bu.telegram_username
-            if not uname:
-                skipped_no_username += 1
-                continue
-
-            norm = str(uname).strip().lstrip('@').lower()
-
-            person_stmt = select(Person).where(func.lower(func.coalesce(Person.telegram_username, '')) == norm)
-            person_res = await session.execute(person_stmt)
-            person = person_res.scalars().first()
-
-            if person:
-                print(f'Будет связана запись BotUser(id={bu.id}, tg="{uname}") -> Person(id={person.id}, name="{person.full_name}")')
-                if not dry_run:
-                    bu.person_id = person.id
-                    session.add(bu)
-                    await session.commit()
-                linked += 1
-            else:
-                not_found += 1
+        unlinked_stmt = select(
+            func.count(BotUser.id),
+            func.count(BotUser.id).filter(func.coalesce(BotUser.telegram_username, '') == ''),
+        ).where(BotUser.person_id == None)
+        unlinked, skipped_no_username = (await session.execute(unlinked_stmt)).one()
+
+        print(f'Найдено BotUser без связи: {unlinked}')
+
+        links = await link_bot_users(session)
+        for link in links:
+            print(f'Будет связана запись BotUser(id={link.bot_user_id}, tg="{link.telegram_username}") -> Person(id={link.person_id}, name="{link.full_name}")')
+
+        if dry_run:
+            await session.rollback()
+        elif links:
+            # Связи изменились — бот должен перечитать кэш идентификации
+            await bump_cache_version(session, PEOPLE)
+            await session.commit()
+
+    if links and not dry_run:
+        # Изменилось число получателей по факультетам
+        await refresh_stats_view(CAMPAIGN_STATS)
 
     print('--- Резюме ---')
-    print(f'Связано: {linked}')
+    print(f'Связано: {len(links)}')
     print(f'Нет username: {skipped_no_username}')
-    print(f'Не найдено соответствий: {not_found}')
+    print(f'Не найдено соответствий: {unlinked - skipped_no_username - len(links)}')
 
 
 def main():
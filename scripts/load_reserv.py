@@ -3,9 +3,10 @@
 """
 import asyncio
 import pandas as pd
-from sqlalchemy import select
 from db.engine import async_session_maker
-from db.models import Reserv
+from db.bulk_load import bulk_upsert
+from utils.cache_versions import bump_cache_version, RESERV
+from db.stats_views import refresh_stats_view, RESERV_STATS
 
 
 async def load_reserv_from_excel(update_existing=False):
@@ -44,100 +45,52 @@ async def load_reserv_from_excel(update_existing=False):
         print(f"Доступные колонки: {df.columns.tolist()}")
         return
     
-    async with async_session_maker() as session:
-        # Очищаем таблицу перед загрузкой (опционально)
-        # await session.execute(delete(Reserv))
-        # await session.commit()
+    records = []
+    skipped = 0
+    for index, row in df.iterrows():
+        # Нормализуем telegram_username - приводим к lowercase и убираем @
+        telegram_username = row.get('telegram_username')
+        if pd.notna(telegram_username):
+            telegram_username = str(telegram_username).strip().lstrip('@').lower() or None
+        else:
+            telegram_username = None
         
-        added = 0
-        skipped = 0
-        errors = 0
+        # Используем колонку 'ФИО'
+        full_name = row.get('ФИО')
+        if pd.isna(full_name):
+            print(f"⚠️ Строка {index + 2}: отсутствует ФИО, пропускаем")
+            skipped += 1
+            continue
         
-        for index, row in df.iterrows():
-            try:
-                # Нормализуем telegram_username - приводим к lowercase и убираем @
-                telegram_username = row.get('telegram_username')
-                if pd.notna(telegram_username):
-                    telegram_username = str(telegram_username).strip().lstrip('@').lower()
-                else:
-                    telegram_username = None
-                
-                # Используем колонку 'ФИО'
-                full_name = row.get('ФИО')
-                if pd.isna(full_name):
-                    print(f"⚠️ Строка {index + 2}: отсутствует ФИО, пропускаем")
-                    skipped += 1
-                    continue
-                
-                # Используем колонку 'Факультет'
-                faculty = row.get('Факультет')
-                if pd.isna(faculty):
-                    faculty = None
-                
-                # Курс - опциональная колонка (может не быть)
-                course = None  # В res.xlsx нет колонки курс
-                
-                # Проверяем, есть ли уже такая запись по telegram_username ИЛИ по ФИО
-                existing = None
-                
-                # Проверка по telegram_username (если есть)
-                if telegram_username:
-                    stmt = select(Reserv).where(Reserv.telegram_username == telegram_username)
-                    result = await session.execute(stmt)
-                    existing = result.scalars().first()
-                    
-                    if existing:
-                        print(f"⚠️ Строка {index + 2}: пользователь с telegram @{telegram_username} уже существует, пропускаем")
-                        skipped += 1
-                        continue
-                
-                # Проверка по ФИО (если username не было или не нашли)
-                if not existing:
-                    stmt_name = select(Reserv).where(Reserv.full_name == str(full_name).strip())
-                    result_name = await session.execute(stmt_name)
-                    existing = result_name.scalars().first()
-                    
-                    if existing:
-                        if update_existing:
-                            # Обновляем существующую запись
-                            print(f"🔄 Строка {index + 2}: обновляю существующую запись для '{full_name}'")
-                            existing.faculty = str(faculty).strip() if faculty else None
-                            existing.telegram_username = telegram_username
-                            existing.course = str(course).strip() if course else None
-                            session.add(existing)
-                            added += 1
-                            continue
-                        else:
-                            print(f"⚠️ Строка {index + 2}: пользователь с ФИО '{full_name}' уже существует, пропускаем")
-                            skipped += 1
-                            continue
-                
-                # Создаём новую запись
-                reserv = Reserv(
-                    full_name=str(full_name).strip(),
-                    telegram_username=telegram_username,
-                    faculty=str(faculty).strip() if faculty else None,
-                    course=str(course).strip() if course else None,
-                    message_sent=False
-                )
-                
-                session.add(reserv)
-                added += 1
-                
-            except Exception as e:
-                print(f"❌ Ошибка при обработке строки {index + 2}: {e}")
-                errors += 1
+        # Используем колонку 'Факультет'
+        faculty = row.get('Факультет')
+        faculty = str(faculty).strip() if pd.notna(faculty) and str(faculty).strip() else None
         
-        # Сохраняем все изменения
+        # В res.xlsx нет колонки курс
+        records.append((str(full_name).strip(), faculty, telegram_username))
+    
+    async with async_session_maker() as session:
+        # Существующие записи ищутся по telegram_username, а без него — по ФИО
         try:
+            result = await bulk_upsert(
+                session, 'reserv',
+                ['full_name', 'faculty', 'telegram_username'],
+                records,
+                name_key=('full_name',),
+                update=update_existing,
+            )
+            await bump_cache_version(session, RESERV)
             await session.commit()
-            print(f"\n✅ Загрузка завершена!")
-            print(f"   Добавлено: {added}")
-            print(f"   Пропущено: {skipped}")
-            print(f"   Ошибок: {errors}")
         except Exception as e:
             await session.rollback()
             print(f"❌ Ошибка при сохранении в БД: {e}")
+            return
+    
+    await refresh_stats_view(RESERV_STATS)
+    print(f"\n✅ Загрузка завершена!")
+    print(f"   Добавлено: {result.inserted}")
+    print(f"   Обновлено: {result.updated}")
+    print(f"   Пропущено: {skipped + result.skipped}")
 
 
 if __name__ == '__main__':
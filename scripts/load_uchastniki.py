@@ -24,9 +24,10 @@ project_root = script_dir.parent
 sys.path.insert(0, str(project_root))
 
 import pandas as pd
-from sqlalchemy import select, func
+from sqlalchemy import select
 from db.engine import async_session_maker
-from db.models import Uchastnik, BotUser
+from db.models import BotUser
+from db.bulk_load import bulk_upsert
 
 
 def normalize_username(raw):
@@ -84,191 +85,75 @@ async def load_uchastniki_from_excel(update_existing=False):
         return
     
     async with async_session_maker() as session:
-        # Получаем все существующие BotUser для быстрой проверки
-        bot_users_stmt = select(BotUser).where(BotUser.telegram_username.isnot(None))
+        # username -> tg_id из BotUser для быстрой проверки (только нужные колонки)
+        bot_users_stmt = select(BotUser.telegram_username, BotUser.tg_id).where(BotUser.telegram_username.isnot(None))
         bot_users_result = await session.execute(bot_users_stmt)
-        bot_users = bot_users_result.scalars().all()
         
-        # Создаём словарь для быстрого поиска: username -> tg_id
         username_to_tg_id = {}
-        for bu in bot_users:
-            if bu.telegram_username:
-                norm_username = normalize_username(bu.telegram_username)
-                if norm_username:
-                    username_to_tg_id[norm_username] = bu.tg_id
+        for bot_username, tg_id in bot_users_result.all():
+            norm_username = normalize_username(bot_username)
+            if norm_username:
+                username_to_tg_id[norm_username] = tg_id
         
         print(f"📊 Найдено {len(username_to_tg_id)} пользователей в BotUser для сопоставления")
         
-        added = 0
-        updated = 0
+        records = []
         skipped = 0
-        errors = 0
         linked_with_bot = 0  # Сколько участников связано с BotUser
         
         for index, row in df.iterrows():
-            try:
-                # Получаем ФИО (обязательное поле)
-                full_name = row.get('ФИО')
-                if pd.isna(full_name):
-                    print(f"⚠️ Строка {index + 2}: отсутствует ФИО, пропускаем")
-                    skipped += 1
-                    continue
-                
-                full_name = str(full_name).strip()
-                
-                # Получаем опциональные поля
-                course = row.get('Курс') if 'Курс' in df.columns else None
-                if pd.isna(course):
-                    course = None
-                else:
-                    course = str(course).strip()
-                
-                faculty = row.get('Факультет') if 'Факультет' in df.columns else None
-                if pd.isna(faculty):
-                    faculty = None
-                else:
-                    faculty = str(faculty).strip()
-                
-                telegram_username = row.get('telegram_username') if 'telegram_username' in df.columns else None
-                telegram_username_norm = normalize_username(telegram_username)
-                
-                # Проверяем, есть ли уже такая запись
-                existing = None
-                
-                # Проверка по telegram_username (если есть)
-                if telegram_username_norm:
-                    try:
-                        stmt = select(Uchastnik).where(
-                            func.lower(Uchastnik.telegram_username) == telegram_username_norm
-                        )
-                        result = await session.execute(stmt)
-                        existing = result.scalars().first()
-                    except Exception as e:
-                        # Если ошибка в транзакции, делаем rollback и продолжаем
-                        await session.rollback()
-                        print(f"⚠️ Строка {index + 2}: ошибка при проверке username для '{full_name}': {e}")
-                        errors += 1
-                        continue
-                    
-                    if existing:
-                        if update_existing:
-                            # Обновляем существующую запись
-                            print(f"🔄 Строка {index + 2}: обновляю существующую запись для '{full_name}'")
-                            existing.full_name = full_name
-                            existing.course = course or None
-                            existing.faculty = faculty or None
-                            existing.telegram_username = telegram_username_norm
-                            
-                            # Проверяем, есть ли в BotUser
-                            if telegram_username_norm in username_to_tg_id:
-                                existing.tg_id = username_to_tg_id[telegram_username_norm]
-                                linked_with_bot += 1
-                            
-                            session.add(existing)
-                            try:
-                                await session.commit()
-                                updated += 1
-                            except Exception as e:
-                                await session.rollback()
-                                print(f"❌ Строка {index + 2}: ошибка при обновлении '{full_name}': {e}")
-                                errors += 1
-                            continue
-                        else:
-                            print(f"⚠️ Строка {index + 2}: пользователь с telegram @{telegram_username_norm} уже существует, пропускаем")
-                            skipped += 1
-                            continue
-                
-                # Проверка по ФИО (если username не было или не нашли)
-                if not existing:
-                    try:
-                        stmt_name = select(Uchastnik).where(Uchastnik.full_name == full_name)
-                        result_name = await session.execute(stmt_name)
-                        existing = result_name.scalars().first()
-                    except Exception as e:
-                        # Если ошибка в транзакции, делаем rollback и продолжаем
-                        await session.rollback()
-                        print(f"⚠️ Строка {index + 2}: ошибка при проверке ФИО для '{full_name}': {e}")
-                        errors += 1
-                        continue
-                    
-                    if existing:
-                        if update_existing:
-                            # Обновляем существующую запись
-                            print(f"🔄 Строка {index + 2}: обновляю существующую запись для '{full_name}'")
-                            existing.course = course or None
-                            existing.faculty = faculty or None
-                            existing.telegram_username = telegram_username_norm
-                            
-                            # Проверяем, есть ли в BotUser
-                            if telegram_username_norm and telegram_username_norm in username_to_tg_id:
-                                existing.tg_id = username_to_tg_id[telegram_username_norm]
-                                linked_with_bot += 1
-                            
-                            session.add(existing)
-                            try:
-                                await session.commit()
-                                updated += 1
-                            except Exception as e:
-                                await session.rollback()
-                                print(f"❌ Строка {index + 2}: ошибка при обновлении '{full_name}': {e}")
-                                errors += 1
-                            continue
-                        else:
-                            print(f"⚠️ Строка {index + 2}: пользователь с ФИО '{full_name}' уже существует, пропускаем")
-                            skipped += 1
-                            continue
-                
-                # Создаём новую запись
-                tg_id = None
-                if telegram_username_norm and telegram_username_norm in username_to_tg_id:
-                    tg_id = username_to_tg_id[telegram_username_norm]
-                    linked_with_bot += 1
-                
-                uchastnik = Uchastnik(
-                    full_name=full_name,
-                    telegram_username=telegram_username_norm,
-                    faculty=faculty or None,
-                    course=course or None,
-                    tg_id=tg_id
-                )
-                
-                session.add(uchastnik)
-                try:
-                    await session.commit()
-                    added += 1
-                    if tg_id:
-                        print(f"✅ Строка {index + 2}: добавлен '{full_name}' с tg_id={tg_id}")
-                    else:
-                        print(f"✅ Строка {index + 2}: добавлен '{full_name}' (без tg_id)")
-                except Exception as e:
-                    await session.rollback()
-                    print(f"❌ Строка {index + 2}: ошибка при добавлении '{full_name}': {e}")
-                    errors += 1
-                
-            except Exception as e:
-                # Общая обработка ошибок - делаем rollback и продолжаем
-                try:
-                    await session.rollback()
-                except:
-                    pass
-                print(f"❌ Ошибка при обработке строки {index + 2}: {e}")
-                errors += 1
+            # Получаем ФИО (обязательное поле)
+            full_name = row.get('ФИО')
+            if pd.isna(full_name):
+                print(f"⚠️ Строка {index + 2}: отсутствует ФИО, пропускаем")
+                skipped += 1
+                continue
+            
+            full_name = str(full_name).strip()
+            
+            # Получаем опциональные поля
+            course = row.get('Курс') if 'Курс' in df.columns else None
+            course = None if pd.isna(course) else (str(course).strip() or None)
+            
+            faculty = row.get('Факультет') if 'Факультет' in df.columns else None
+            faculty = None if pd.isna(faculty) else (str(faculty).strip() or None)
+            
+            telegram_username = row.get('telegram_username') if 'telegram_username' in df.columns else None
+            telegram_username_norm = normalize_username(telegram_username)
+            
+            # Проверяем, есть ли в BotUser
+            tg_id = username_to_tg_id.get(telegram_username_norm) if telegram_username_norm else None
+            if tg_id:
+                linked_with_bot += 1
+            
+            records.append((full_name, course, faculty, telegram_username_norm, tg_id))
+        
+        # Существующие записи ищутся по telegram_username, а без него — по ФИО
+        try:
+            result = await bulk_upsert(
+                session, 'uchastniki',
+                ['full_name', 'course', 'faculty', 'telegram_username', 'tg_id'],
+                records,
+                name_key=('full_name',),
+                update=update_existing,
+            )
+            await session.commit()
+        except Exception as e:
+            await session.rollback()
+            print(f"❌ Ошибка при сохранении в БД: {e}")
+            return
         
-        # Все изменения уже сохранены (коммиты делались после каждой записи)
-        # Просто выводим статистику
         print(f"\n{'='*50}")
         print(f"✅ Загрузка завершена!")
         print(f"{'='*50}")
         print(f"📊 Статистика:")
-        print(f"   ✅ Добавлено новых: {added}")
-        print(f"   🔄 Обновлено: {updated}")
-        print(f"   ⏭️  Пропущено: {skipped}")
+        print(f"   ✅ Добавлено новых: {result.inserted}")
+        print(f"   🔄 Обновлено: {result.updated}")
+        print(f"   ⏭️  Пропущено: {skipped + result.skipped}")
         print(f"   🔗 Связано с BotUser: {linked_with_bot}")
-        print(f"   ❌ Ошибок: {errors}")
-        print(f"   📈 Всего обработано: {added + updated + skipped + errors}")
+        print(f"   📈 Всего обработано: {skipped + len(records)}")
         print(f"{'='*50}")
 
-
 if __name__ == '__main__':
     import argparse
     
@@ -0,0 +1,93 @@
+"""
+id в партиционированных таблицах co_responses и interview_messages (миграция 008).
+
+Первичный ключ там составной (id + ключ партиционирования), поэтому id должен
+браться из последовательности явно и возвращаться после INSERT — иначе
+обработчик вопроса кандидата не получает new_message.id.
+
+Проверка компиляции INSERT не требует БД. Вставка в живую базу выполняется,
+только если задан TEST_DB_URL (PostgreSQL с применёнными миграциями);
+изменения откатываются.
+"""
+import asyncio
+import os
+import random
+
+import pytest
+
+pytest.importorskip('sqlalchemy')
+pytest.importorskip('asyncpg')
+
+# db.engine создаёт движок при импорте
+os.environ['DB_URL'] = os.getenv('TEST_DB_URL', 'postgresql+asyncpg://localhost/test')
+os.environ.setdefault('DB_ECHO', '0')
+
+from sqlalchemy import insert  # noqa: E402
+from sqlalchemy.dialects import postgresql  # noqa: E402
+
+from db.models import (  # noqa: E402
+    BotUser, CO, COResponse, Interview, InterviewMessage, Interviewer, TimeSlot,
+)
+
+
+def _compiled_insert(model, values):
+    stmt = insert(model).values(**values).returning(model.id)
+    return str(stmt.compile(dialect=postgresql.asyncpg.dialect()))
+
+
+@pytest.mark.parametrize('model, sequence', [
+    (COResponse, 'co_responses_id_seq'),
+    (InterviewMessage, 'interview_messages_id_seq'),
+])
+def test_id_comes_from_sequence(model, sequence):
+    assert model.__table__.c.id.default is not None
+    assert model.__table__.c.id.default.name == sequence
+
+
+def test_orm_insert_returns_id():
+    # Так же, как flush() ORM: id не передан, ждём nextval и RETURNING id
+    sql = _compiled_insert(InterviewMessage, {
+        'interview_id': 1, 'from_user_id': 1, 'to_user_id': 2, 'message_text': 'x',
+    })
+    assert "nextval('interview_messages_id_seq')" in sql
+    assert 'RETURNING interview_messages.id' in sql
+
+    sql = _compiled_insert(COResponse, {'campaign_id': 1, 'bot_user_id': 1, 'answer': 'yes'})
+    assert "nextval('co_responses_id_seq')" in sql
+    assert 'RETURNING co_responses.id' in sql
+
+
+@pytest.mark.skipif(not os.getenv('TEST_DB_URL'), reason='нужен TEST_DB_URL с применёнными миграциями')
+def test_insert_reads_id_back():
+    from db.engine import async_session_maker
+
+    async def scenario():
+        async with async_session_maker() as session:
+            tg_id = random.randint(10 ** 12, 10 ** 13)
+            bot_user = BotUser(tg_id=tg_id)
+            campaign = CO(admin_id=1, faculty='test', text='test')
+            interviewer = Interviewer(full_name='Test', telegram_id=tg_id)
+            session.add_all([bot_user, campaign, interviewer])
+            await session.flush()
+
+            slot = TimeSlot(interviewer_id=interviewer.id, date='2025-01-01', time_start='09:00', time_end='09:45')
+            session.add(slot)
+            await session.flush()
+            interview = Interview(time_slot_id=slot.id, interviewer_id=interviewer.id, bot_user_id=bot_user.id)
+            session.add(interview)
+            await session.flush()
+
+            response = COResponse(campaign_id=campaign.id, bot_user_id=bot_user.id, answer='yes')
+            message = InterviewMessage(interview_id=interview.id, from_user_id=tg_id, to_user_id=1, message_text='?')
+            session.add_all([response, message])
+            await session.flush()
+
+            assert response.id is not None
+            assert message.id is not None
+            # Как в обработчике вопроса кандидата
+            await session.refresh(message)
+            assert message.id is not None
+
+            await session.rollback()
+
+    asyncio.run(scenario())
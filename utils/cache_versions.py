@@ -0,0 +1,67 @@
+"""
+Версии справочных данных для инвалидации in-process кэшей.
+
+Скрипты импорта работают в отдельном процессе и не могут сбросить кэш бота
+напрямую, поэтому после изменения данных они увеличивают версию в таблице
+cache_versions. Бот перечитывает версии не чаще раза в POLL_INTERVAL секунд,
+так что обычный запрос к кэшу обходится без обращения к БД.
+"""
+import asyncio
+import os
+import time
+from typing import Dict
+
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import CacheVersion
+
+
+# Имена версий
+PEOPLE = 'people'  # people + связи bot_users -> people
+RESERV = 'reserv'  # таблица reserv
+
+# Как часто перечитывать версии из БД (секунды)
+POLL_INTERVAL = float(os.getenv('CACHE_VERSION_POLL_SECONDS', '5'))
+
+
+async def bump_cache_version(session: AsyncSession, *names: str) -> None:
+    """Увеличивает версии (в текущей транзакции — коммит за вызывающим)."""
+    for name in names:
+        stmt = insert(CacheVersion).values(name=name, version=1)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[CacheVersion.name],
+            set_={'version': CacheVersion.version + 1, 'updated_at': func.now()},
+        )
+        await session.execute(stmt)
+
+
+class CacheVersions:
+    """Локальная копия таблицы cache_versions с периодическим обновлением."""
+
+    def __init__(self, poll_interval: float = POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self._versions: Dict[str, int] = {}
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _is_fresh(self) -> bool:
+        return time.monotonic() - self._checked_at < self.poll_interval
+
+    async def get(self, session: AsyncSession, name: str) -> int:
+        """Текущая версия; обращается к БД, только если локальная копия устарела."""
+        if not self._is_fresh():
+            async with self._lock:
+                if not self._is_fresh():
+                    result = await session.execute(select(CacheVersion.name, CacheVersion.version))
+                    self._versions = {row_name: version for row_name, version in result.all()}
+                    self._checked_at = time.monotonic()
+        return self._versions.get(name, 0)
+
+    def expire(self) -> None:
+        """Заставляет перечитать версии при следующем обращении."""
+        self._checked_at = 0.0
+
+
+cache_versions = CacheVersions()
@@ -0,0 +1,125 @@
+"""
+Отчёт об использовании индексов PostgreSQL.
+
+Показывает неиспользуемые индексы (pg_stat_user_indexes), таблицы с наибольшим
+числом последовательных сканирований (pg_stat_user_tables) и, если установлено
+расширение pg_stat_statements, самые тяжёлые запросы.
+Используется командой /db_indexes и скриптом scripts/index_report.py.
+"""
+from typing import List, NamedTuple, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+class UnusedIndex(NamedTuple):
+    table: str
+    index: str
+    size: str
+    scans: int
+
+
+class SeqScanTable(NamedTuple):
+    table: str
+    seq_scan: int
+    seq_tup_read: int
+    idx_scan: int
+    live_rows: int
+
+
+class StatementStat(NamedTuple):
+    query: str
+    calls: int
+    total_ms: float
+    mean_ms: float
+    rows: int
+
+
+async def get_unused_indexes(session: AsyncSession) -> List[UnusedIndex]:
+    """Индексы без сканирований с момента сброса статистики (кроме PK и UNIQUE)."""
+    result = await session.execute(text("""
+        SELECT s.relname, s.indexrelname,
+               pg_size_pretty(pg_relation_size(s.indexrelid)), s.idx_scan
+        FROM pg_stat_user_indexes s
+        JOIN pg_index i ON i.indexrelid = s.indexrelid
+        WHERE s.idx_scan = 0
+          AND NOT i.indisunique
+          AND NOT i.indisprimary
+        ORDER BY pg_relation_size(s.indexrelid) DESC, s.relname
+    """))
+    return [UnusedIndex(*row) for row in result.all()]
+
+
+async def get_seq_scan_tables(session: AsyncSession, limit: int = 10) -> List[SeqScanTable]:
+    """Таблицы, которые чаще всего читаются последовательным сканированием."""
+    result = await session.execute(text("""
+        SELECT relname, seq_scan, seq_tup_read, coalesce(idx_scan, 0), n_live_tup
+        FROM pg_stat_user_tables
+        WHERE seq_scan > 0
+        ORDER BY seq_tup_read DESC
+        LIMIT :limit
+    """), {'limit': limit})
+    return [SeqScanTable(*row) for row in result.all()]
+
+
+async def get_top_statements(session: AsyncSession, limit: int = 10) -> Optional[List[StatementStat]]:
+    """Самые дорогие запросы по суммарному времени; None, если pg_stat_statements не установлен."""
+    installed = await session.execute(text(
+        "SELECT 1 FROM pg_extension WHERE extname = 'pg_stat_statements'"
+    ))
+    if installed.scalar() is None:
+        return None
+
+    result = await session.execute(text("""
+        SELECT query, calls, total_exec_time, mean_exec_time, rows
+        FROM pg_stat_statements
+        WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+        ORDER BY total_exec_time DESC
+        LIMIT :limit
+    """), {'limit': limit})
+    return [StatementStat(*row) for row in result.all()]
+
+
+def format_index_report(unused: List[UnusedIndex], seq_tables: List[SeqScanTable],
+                        statements: Optional[List[StatementStat]]) -> str:
+    """Текст отчёта для Telegram/консоли."""
+    lines = ['📊 Отчёт по индексам', '']
+
+    lines.append('🗑 Неиспользуемые индексы:')
+    if unused:
+        for row in unused:
+            lines.append(f'  • {row.table}.{row.index} ({row.size})')
+    else:
+        lines.append('  нет')
+    lines.append('')
+
+    lines.append('🐢 Последовательные сканирования (топ):')
+    if seq_tables:
+        for row in seq_tables:
+            lines.append(
+                f'  • {row.table}: seq_scan={row.seq_scan}, прочитано строк={row.seq_tup_read}, '
+                f'idx_scan={row.idx_scan}, строк в таблице={row.live_rows}'
+            )
+    else:
+        lines.append('  нет')
+    lines.append('')
+
+    if statements is None:
+        lines.append('ℹ️ pg_stat_statements не установлен — статистика запросов недоступна.')
+    else:
+        lines.append('⏱ Самые дорогие запросы:')
+        for row in statements:
+            query = ' '.join(row.query.split())
+            if len(query) > 150:
+                query = query[:150] + '…'
+            lines.append(f'  • {row.total_ms:.0f} мс всего, {row.mean_ms:.1f} мс в среднем, {row.calls} вызовов')
+            lines.append(f'    {query}')
+
+    return '\n'.join(lines)
+
+
+async def build_index_report(session: AsyncSession, limit: int = 10) -> str:
+    unused = await get_unused_indexes(session)
+    seq_tables = await get_seq_scan_tables(session, limit)
+    statements = await get_top_statements(session, limit)
+    return format_index_report(unused, seq_tables, statements)
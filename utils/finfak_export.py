@@ -1,10 +1,13 @@
 """
 Экспорт записей на собеседования в Google Sheets для финфака
 """
-import asyncio
 from typing import Optional
-from utils.google_sheets import get_google_sheets_client, _with_retries
-from db.models import FinfakBooking, FinfakTimeSlot, Interviewer, Person
+from utils.google_sheets import open_spreadsheet, open_worksheet, sheets_holder
+from utils.sheets_client import sheets_call
+from utils.sheets_writer import sheets_writer
+from utils.sheet_row_index import matrix_row_index
+from utils.sheet_outbox import PermanentExportError
+from db.booking_view import BookingRow
 
 
 # ID таблицы для финфака (та же таблица что и для резерва)
@@ -33,67 +36,40 @@ TIME_TO_COLUMN = {
 }
 
 
-async def export_finfak_booking_to_sheets(
-    booking: FinfakBooking,
-    slot: FinfakTimeSlot,
-    interviewer: Interviewer,
-    person: Person
-) -> bool:
+async def export_finfak_matrix(booking: BookingRow) -> bool:
     """
-    Экспортирует запись на собеседование в Google Sheets.
-    
-    Выполняется асинхронно с задержкой для защиты от rate limiting.
-    При ошибке не падает, а логирует проблему.
-    
-    Args:
-        booking: Запись на собеседование
-        slot: Временной слот
-        interviewer: Собеседующий
-        person: Кандидат
-    
-    Returns:
-        bool: True если успешно, False при ошибке
+    Записывает ФИО кандидата в лист "финфак_записи" (задание sheet_outbox 'finfak:<id>:matrix').
+
+    Изменение ставится в очередь utils.sheets_writer и уходит в таблицу пачкой
+    вместе с другими записями. Временные ошибки логируются (False — повторить позже).
+
+    Raises:
+        PermanentExportError: собеседующего нет в листе или время неизвестно — повтор не поможет
     """
-    # Задержка для защиты от rate limiting (2 секунды)
-    await asyncio.sleep(2)
-    
-    try:
-        print(f"\n📤 Начинаю экспорт записи в Google Sheets...")
-        print(f"   Кандидат: {person.full_name}")
-        print(f"   Собеседующий: {interviewer.full_name} (ID: {interviewer.interviewer_sheet_id})")
-        print(f"   Время: {slot.time_start}")
-        
-        # 1. Экспорт в лист "финфак_записи" (матричная запись)
-        success_matrix = await _export_to_finfak_matrix(
-            interviewer_sheet_id=interviewer.interviewer_sheet_id,
-            time_start=slot.time_start,
-            candidate_name=person.full_name
-        )
-        
-        # Небольшая задержка между запросами
-        await asyncio.sleep(1)
-        
-        # 2. Экспорт в лист "всеобщая" (построчная запись)
-        success_all = await _export_to_all_sheet(
-            candidate_name=person.full_name,
-            sheet_type="финфак",
-            interviewer_id=interviewer.interviewer_sheet_id,
-            interviewer_username=interviewer.telegram_username,
-            candidate_username=person.telegram_username,
-            time=slot.time_start
-        )
-        
-        if success_matrix and success_all:
-            print(f"   ✅ Экспорт успешно завершен!")
-            return True
-        else:
-            print(f"   ⚠️ Экспорт завершен с ошибками")
-            return False
-    
-    except Exception as e:
-        print(f"   ❌ Ошибка экспорта: {e}")
-        # Не падаем, просто логируем
-        return False
+    print(f"\n📤 Экспорт записи в 'финфак_записи': {booking.candidate_name}, "
+          f"собеседующий {booking.interviewer_name} (ID: {booking.interviewer_sheet_id}), время {booking.time_start}")
+    return await _export_to_finfak_matrix(
+        interviewer_sheet_id=booking.interviewer_sheet_id,
+        time_start=booking.time_start,
+        candidate_name=booking.candidate_name
+    )
+
+
+async def export_finfak_all(booking: BookingRow) -> bool:
+    """
+    Добавляет строку записи в лист "всеобщая" (задание sheet_outbox 'finfak:<id>:all').
+
+    Отдельное от матрицы задание: строка не дублируется, если повторяется только запись в матрицу.
+    """
+    print(f"\n📤 Экспорт записи в 'всеобщая' (финфак): {booking.candidate_name}, время {booking.time_start}")
+    return await _export_to_all_sheet(
+        candidate_name=booking.candidate_name,
+        sheet_type="финфак",
+        interviewer_id=booking.interviewer_sheet_id,
+        interviewer_username=booking.interviewer_username,
+        candidate_username=booking.candidate_username,
+        time=booking.time_start
+    )
 
 
 async def _export_to_finfak_matrix(
@@ -104,49 +80,26 @@ async def _export_to_finfak_matrix(
     """
     Экспортирует запись в лист "финфак_записи" (матричная таблица).
     
-    Находит строку по ID собеседующего (колонка T),
+    Находит строку по ID собеседующего (колонка T, индекс utils.sheet_row_index),
     находит столбец по времени (B-S),
     записывает ФИО кандидата.
     """
+    # Находим столбец по времени
+    column_index = TIME_TO_COLUMN.get(time_start)
+    if not column_index:
+        raise PermanentExportError(f"Неизвестное время: {time_start}")
+    
+    try:
+        # Строка собеседующего — из общего кэша индекса, без скачивания листа
+        target_row = await matrix_row_index.find_row(FINFAK_SHEET_ID, "финфак_записи", interviewer_sheet_id)
+    except Exception as e:
+        print(f"      ❌ Не удалось прочитать ID собеседующих из 'финфак_записи': {e}")
+        return False
+    
+    if not target_row:
+        raise PermanentExportError(f"Собеседующий с ID '{interviewer_sheet_id}' не найден в 'финфак_записи'")
+    
     try:
-        # Получаем клиента и открываем таблицу
-        client = get_google_sheets_client()
-        spreadsheet = _with_retries(client.open_by_key, FINFAK_SHEET_ID)
-        
-        # Открываем лист "финфак_записи"
-        try:
-            worksheet = _with_retries(spreadsheet.worksheet, "финфак_записи")
-        except Exception as e:
-            print(f"      ⚠️ Лист 'финфак_записи' не найден: {e}")
-            return False
-        
-        # Получаем все значения листа
-        all_values = _with_retries(worksheet.get_all_values)
-        
-        if not all_values or len(all_values) < 2:
-            print(f"      ⚠️ Лист 'финфак_записи' пустой")
-            return False
-        
-        # Ищем строку с нужным собеседующим (по колонке T, индекс 19)
-        target_row = None
-        for row_idx, row in enumerate(all_values):
-            if len(row) > 19:
-                cell_value = row[19].strip()
-                if cell_value == interviewer_sheet_id:
-                    target_row = row_idx + 1  # +1 потому что нумерация с 1
-                    break
-        
-        if not target_row:
-            print(f"      ⚠️ Собеседующий с ID '{interviewer_sheet_id}' не найден в таблице")
-            return False
-        
-        # Находим столбец по времени
-        column_index = TIME_TO_COLUMN.get(time_start)
-        
-        if not column_index:
-            print(f"      ⚠️ Неизвестное время: {time_start}")
-            return False
-        
         # Преобразуем индекс столбца в букву (1=B, 2=C, ...)
         # A=0, B=1, C=2, но нам нужно B=1 в нашем маппинге
         # Значит column_index уже правильный для формулы (B=1)
@@ -155,15 +108,20 @@ async def _export_to_finfak_matrix(
         # Формируем адрес ячейки (например, "B5")
         cell_address = f"{column_letter}{target_row}"
         
-        print(f"      📍 Записываю в ячейку {cell_address}")
+        print(f"      📍 Ставлю в очередь запись в ячейку {cell_address}")
         
-        # Записываем ФИО кандидата
-        _with_retries(worksheet.update, cell_address, [[candidate_name]])
+        # Записываем ФИО кандидата (пакетом с другими изменениями таблицы)
+        success = await sheets_writer.update_cells(FINFAK_SHEET_ID, "финфак_записи", cell_address, [[candidate_name]])
         
-        print(f"      ✅ Запись в 'финфак_записи' успешна")
-        return True
+        if success:
+            print(f"      ✅ Запись в 'финфак_записи' успешна")
+        else:
+            # sheets_writer не бросает исключений: строка могла сместиться — перечитаем индекс
+            matrix_row_index.invalidate(FINFAK_SHEET_ID, "финфак_записи")
+        return success
     
     except Exception as e:
+        matrix_row_index.invalidate(FINFAK_SHEET_ID, "финфак_записи")
         print(f"      ❌ Ошибка записи в 'финфак_записи': {e}")
         import traceback
         traceback.print_exc()
@@ -185,16 +143,15 @@ async def _export_to_all_sheet(
     """
     try:
         # Получаем клиента и открываем таблицу
-        client = get_google_sheets_client()
-        spreadsheet = _with_retries(client.open_by_key, FINFAK_SHEET_ID)
-        
         # Открываем лист "всеобщая"
         try:
-            worksheet = _with_retries(spreadsheet.worksheet, "всеобщая")
+            worksheet = await open_worksheet(FINFAK_SHEET_ID, "всеобщая")
         except Exception:
             # Если листа нет - создаем
             print(f"      📋 Создаю лист 'всеобщая'...")
-            worksheet = _with_retries(spreadsheet.add_worksheet, title="всеобщая", rows=1000, cols=10)
+            spreadsheet = await open_spreadsheet(FINFAK_SHEET_ID)
+            worksheet = await sheets_call(spreadsheet.add_worksheet, title="всеобщая", rows=1000, cols=10)
+            sheets_holder.remember(FINFAK_SHEET_ID, "всеобщая", worksheet)
             
             # Добавляем заголовки
             headers = [
@@ -205,10 +162,10 @@ async def _export_to_all_sheet(
                 "Username кандидата",
                 "Время"
             ]
-            _with_retries(worksheet.update, 'A1', [headers])
+            await sheets_call(worksheet.update, 'A1', [headers])
             
             # Форматируем заголовок
-            _with_retries(worksheet.format, 'A1:F1', {
+            await sheets_call(worksheet.format, 'A1:F1', {
                 'textFormat': {'bold': True},
                 'backgroundColor': {'red': 0.9, 'green': 0.9, 'blue': 0.9}
             })
@@ -232,15 +189,17 @@ async def _export_to_all_sheet(
             time
         ]
         
-        print(f"      📍 Добавляю строку в 'всеобщая'")
+        print(f"      📍 Ставлю в очередь строку для 'всеобщая'")
         
-        # Добавляем строку
-        _with_retries(worksheet.append_row, row_data, value_input_option='RAW')
+        # Добавляем строку (пакетом с другими строками листа)
+        success = await sheets_writer.append_row(FINFAK_SHEET_ID, "всеобщая", row_data)
         
-        print(f"      ✅ Запись в 'всеобщая' успешна")
-        return True
+        if success:
+            print(f"      ✅ Запись в 'всеобщая' успешна")
+        return success
     
     except Exception as e:
+        sheets_holder.invalidate(FINFAK_SHEET_ID, "всеобщая")
         print(f"      ❌ Ошибка записи в 'всеобщая': {e}")
         import traceback
         traceback.print_exc()
@@ -1,12 +1,19 @@
 """
-Модуль для работы с Google Sheets
+Модуль для работы с Google Sheets.
+
+Все функции, обращающиеся к таблицам, асинхронные: вызовы gspread идут
+через utils.sheets_client (пул потоков, таймауты, повторы без блокировки бота).
 """
+import os
 import gspread
+from gspread.exceptions import WorksheetNotFound
+from google.auth.transport.requests import Request as GoogleAuthRequest
 from google.oauth2.service_account import Credentials
-from typing import List, Dict, Optional
-import time
-import random
-from gspread.exceptions import APIError
+from typing import List, Dict, Optional, Set, Tuple
+from datetime import datetime, timedelta
+import asyncio
+from utils.sheets_client import run_sheets, sheets_call
+from utils.sheets_quota import with_sheets_priority, PRIORITY_LOW
 
 
 # URL таблицы с собеседующими
@@ -14,8 +21,8 @@ INTERVIEWERS_SHEET_URL = "https://docs.google.com/spreadsheets/d/132W-Q8bZhyPbfO
 INTERVIEWERS_SHEET_ID = "132W-Q8bZhyPbfOmJkXpfRLsOZ3l-pqHpO8vmy8hxGec"
 
 
-def get_google_sheets_client():
-    """Создаёт клиента для работы с Google Sheets."""
+def load_credentials() -> Credentials:
+    """Читает service account credentials из JSON-файла."""
     scope = [
         'https://spreadsheets.google.com/feeds',
         'https://www.googleapis.com/auth/drive'
@@ -23,7 +30,6 @@ def get_google_sheets_client():
     
     # Используем JSON файл с credentials
     # Проверяем оба возможных имени файла
-    import os
     if os.path.exists('sha-otbor-476513-9c6d0a1d252c.json'):
         credentials_file = 'sha-otbor-476513-9c6d0a1d252c.json'
     elif os.path.exists('credentials.json'):
@@ -31,38 +37,165 @@ def get_google_sheets_client():
     else:
         raise FileNotFoundError("Не найден файл credentials (sha-otbor-476513-9c6d0a1d252c.json или credentials.json)")
     
-    creds = Credentials.from_service_account_file(
+    return Credentials.from_service_account_file(
         credentials_file,
         scopes=scope
     )
-    
-    client = gspread.authorize(creds)
-    return client
-def _with_retries(callable_fn, *args, max_attempts: int = 5, base_delay: float = 0.8, **kwargs):
-    """Выполняет вызов Google Sheets API с экспоненциальным бэкоффом и джиттером."""
-    attempt = 0
-    while True:
-        try:
-            return callable_fn(*args, **kwargs)
-        except Exception as e:
-            # Определяем, имеет ли смысл ретраить
-            is_api_error = isinstance(e, APIError)
-            msg = str(e).lower()
-            retriable = is_api_error or any(s in msg for s in [
-                'rate limit', 'rate_limit', 'quota', '429', 'backendError', 'internal error', 'deadline', 'unavailable'
-            ])
 
-            attempt += 1
-            if not retriable or attempt >= max_attempts:
+
+def get_google_sheets_client():
+    """Создаёт нового клиента для работы с Google Sheets (бот использует общий sheets_holder)."""
+    return gspread.authorize(load_credentials())
+
+
+class SheetsClientHolder:
+    """
+    Один авторизованный клиент gspread на процесс и кэш открытых таблиц/листов.
+
+    Credentials читаются один раз, токен обновляется заранее (за TOKEN_REFRESH_MARGIN
+    до истечения), а не посреди запроса. Spreadsheet и Worksheet кэшируются по ID
+    и названию: повторные экспорты не тратят запросы на open_by_key/worksheet.
+    Если лист не найден или запрос к нему упал — запись кэша сбрасывается (invalidate).
+    """
+
+    TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+
+    def __init__(self):
+        self._credentials: Optional[Credentials] = None
+        self._client: Optional[gspread.Client] = None
+        self._spreadsheets: Dict[str, gspread.Spreadsheet] = {}
+        self._worksheets: Dict[Tuple[str, str], gspread.Worksheet] = {}
+        self._lock = asyncio.Lock()
+
+    def _token_expiring(self) -> bool:
+        expiry = self._credentials.expiry  # naive UTC
+        return expiry is None or expiry - datetime.utcnow() < self.TOKEN_REFRESH_MARGIN
+
+    async def client(self) -> gspread.Client:
+        async with self._lock:
+            if self._client is None:
+                self._credentials = await run_sheets(load_credentials)
+                self._client = gspread.authorize(self._credentials)
+            if self._token_expiring():
+                await sheets_call(self._credentials.refresh, GoogleAuthRequest())
+            return self._client
+
+    async def spreadsheet(self, sheet_id: str) -> gspread.Spreadsheet:
+        client = await self.client()
+        spreadsheet = self._spreadsheets.get(sheet_id)
+        if spreadsheet is None:
+            spreadsheet = await sheets_call(client.open_by_key, sheet_id)
+            self._spreadsheets[sheet_id] = spreadsheet
+        return spreadsheet
+
+    async def worksheet(self, sheet_id: str, title: str) -> gspread.Worksheet:
+        # Токен обновляем и для листа из кэша
+        await self.client()
+        key = (sheet_id, title)
+        worksheet = self._worksheets.get(key)
+        if worksheet is None:
+            spreadsheet = await self.spreadsheet(sheet_id)
+            try:
+                worksheet = await sheets_call(spreadsheet.worksheet, title)
+            except WorksheetNotFound:
+                self.invalidate(sheet_id, title)
                 raise
+            self._worksheets[key] = worksheet
+        return worksheet
+
+    def remember(self, sheet_id: str, title: str, worksheet: gspread.Worksheet) -> None:
+        """Кладёт в кэш только что созданный лист."""
+        self._worksheets[(sheet_id, title)] = worksheet
+
+    def invalidate(self, sheet_id: str, title: Optional[str] = None) -> None:
+        """Сбрасывает кэш листа (или всей таблицы, если title не указан)."""
+        if title is None:
+            self._spreadsheets.pop(sheet_id, None)
+            for key in [key for key in self._worksheets if key[0] == sheet_id]:
+                del self._worksheets[key]
+        else:
+            self._worksheets.pop((sheet_id, title), None)
+
+
+sheets_holder = SheetsClientHolder()
+
+
+async def open_spreadsheet(sheet_id: str) -> gspread.Spreadsheet:
+    """Таблица по ID (из кэша sheets_holder)."""
+    return await sheets_holder.spreadsheet(sheet_id)
+
+
+async def open_worksheet(sheet_id: str, title: str) -> gspread.Worksheet:
+    """Лист таблицы по названию (из кэша sheets_holder). WorksheetNotFound — если листа нет."""
+    return await sheets_holder.worksheet(sheet_id, title)
 
-            # Экспоненциальный бэкофф с джиттером
-            delay = base_delay * (2 ** (attempt - 1))
-            delay = delay + random.uniform(0, 0.25)
-            time.sleep(delay)
 
+def _cell_text(value) -> str:
+    """Значение ячейки (UNFORMATTED_VALUE) в виде строки, как в get_all_values: 1.0 -> '1'."""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
 
-def get_interviewers_data() -> List[Dict[str, str]]:
+
+def _is_unparsable_range(error: Exception) -> bool:
+    """400 "Unable to parse range": в запросе лист, которого нет (удалён или переименован)."""
+    return 'unable to parse range' in str(error).lower()
+
+
+async def batch_get_values(sheet_id: str, titles: List[str], cells: str = 'A1:T', width: int = 20) -> Dict[str, List[List[str]]]:
+    """
+    Читает диапазон cells со всех листов titles одним запросом values_batch_get.
+
+    Возвращает {название листа: строки}; строки дополняются пустыми ячейками
+    до width колонок (API обрезает пустой хвост). Листа, которого нет в таблице,
+    в результате нет: он пишется в лог, остальные листы перечитываются без него.
+
+    Значения читаются без форматирования (UNFORMATTED_VALUE) и приводятся к строкам,
+    поэтому это НЕ то же, что get_all_values():
+    - даты приходят серийным номером дня ('45658', а не '01.01.2025');
+    - флажки и логические значения — 'True' / 'False', а не 'TRUE' / 'FALSE';
+    - числа теряют ведущие нули и формат: ID '001' превращается в '1', '1,5' — в '1.5'.
+    Текстовые ячейки (в т.ч. ID, набранные как текст) не меняются.
+    """
+    spreadsheet = await open_spreadsheet(sheet_id)
+    try:
+        return await _batch_get_values(spreadsheet, titles, cells, width)
+    except Exception as e:
+        if not _is_unparsable_range(e):
+            sheets_holder.invalidate(sheet_id)
+            raise
+        print(f"⚠️ Не удалось прочитать листы одним запросом: {e}")
+
+    # Какой-то лист удалён или переименован - ищем его по списку листов таблицы
+    sheets_holder.invalidate(sheet_id)
+    spreadsheet = await open_spreadsheet(sheet_id)
+    existing = {worksheet.title for worksheet in await sheets_call(spreadsheet.worksheets)}
+    missing = [title for title in titles if title not in existing]
+    if not missing:
+        raise RuntimeError(f"Google Sheets не принял диапазон '{cells}' для листов {titles}")
+    print(f"⚠️ Листы не найдены в таблице, читаю без них: {', '.join(missing)}")
+    titles = [title for title in titles if title in existing]
+    return await _batch_get_values(spreadsheet, titles, cells, width) if titles else {}
+
+
+async def _batch_get_values(spreadsheet, titles: List[str], cells: str, width: int) -> Dict[str, List[List[str]]]:
+    ranges = ["'{}'!{}".format(title.replace("'", "''"), cells) for title in titles]
+    response = await sheets_call(
+        spreadsheet.values_batch_get, ranges, params={'valueRenderOption': 'UNFORMATTED_VALUE'}
+    )
+
+    result = {}
+    # valueRanges приходят в порядке запрошенных диапазонов
+    for title, value_range in zip(titles, response.get('valueRanges', [])):
+        rows = []
+        for row in value_range.get('values', []):
+            row = [_cell_text(value) for value in row]
+            rows.append(row + [''] * (width - len(row)))
+        result[title] = rows
+    return result
+
+
+async def get_interviewers_data() -> List[Dict[str, str]]:
     """
     Читает данные собеседующих из Google Sheets.
     
@@ -78,12 +211,10 @@ def get_interviewers_data() -> List[Dict[str, str]]:
         ]
     """
     try:
-        client = get_google_sheets_client()
-        sheet = client.open_by_key(INTERVIEWERS_SHEET_ID)
-        worksheet = sheet.worksheet('лист')
+        worksheet = await open_worksheet(INTERVIEWERS_SHEET_ID, 'лист')
         
         # Получаем все значения (начиная с A1)
-        all_values = worksheet.get_all_values()
+        all_values = await sheets_call(worksheet.get_all_values)
         
         interviewers = []
         for row in all_values:
@@ -101,11 +232,12 @@ def get_interviewers_data() -> List[Dict[str, str]]:
         return interviewers
     
     except Exception as e:
+        sheets_holder.invalidate(INTERVIEWERS_SHEET_ID, 'лист')
         print(f"Ошибка при чтении Google Sheets: {e}")
         return []
 
 
-def find_interviewer_by_code(access_code: str) -> Optional[Dict[str, str]]:
+async def find_interviewer_by_code(access_code: str) -> Optional[Dict[str, str]]:
     """
     Находит собеседующего по коду доступа.
     
@@ -115,7 +247,7 @@ def find_interviewer_by_code(access_code: str) -> Optional[Dict[str, str]]:
     Returns:
         Dict или None: Данные собеседующего или None если не найден
     """
-    interviewers = get_interviewers_data()
+    interviewers = await get_interviewers_data()
     
     for interviewer in interviewers:
         if interviewer['access_code'] == access_code:
@@ -193,9 +325,12 @@ def get_time_end(time_start: str) -> str:
     return f"{end_hours:02d}:{end_minutes:02d}"
 
 
-def get_schedules_data() -> tuple[List[Dict[str, any]], Dict[str, int]]:
+@with_sheets_priority(PRIORITY_LOW)
+async def get_schedules_data(unread_sheets: Optional[Set[str]] = None) -> tuple[List[Dict[str, any]], Dict[str, int]]:
     """
     Читает расписание слотов из Google Sheets (листы "1"-"6").
+
+    unread_sheets — если передан, сюда добавляются листы, которых нет в таблице.
     
     Формат каждого листа:
     - Столбец A: Имя и фамилия собеседующего
@@ -211,11 +346,11 @@ def get_schedules_data() -> tuple[List[Dict[str, any]], Dict[str, int]]:
     interviewer_stats = {}  # Статистика по собеседующим
     
     try:
-        client = get_google_sheets_client()
-        sheet = _with_retries(client.open_by_key, SCHEDULE_SHEET_ID)
-        
         print("🔄 Начинаю парсинг расписания из Google Sheets...")
         
+        # Все листы — одним запросом, дальше разбираем локально
+        sheets_values = await batch_get_values(SCHEDULE_SHEET_ID, list(SCHEDULE_SHEETS))
+        
         # Проходим по всем листам
         for sheet_name, info in SCHEDULE_SHEETS.items():
             date = info['date']
@@ -224,11 +359,12 @@ def get_schedules_data() -> tuple[List[Dict[str, any]], Dict[str, int]]:
             
             try:
                 print(f"\n📋 Обрабатываю лист '{sheet_name}': {faculties_str}")
-                worksheet = sheet.worksheet(sheet_name)
-                time.sleep(1)  # Защита от rate limit Google API
-                
-                # Получаем все значения листа
-                all_values = worksheet.get_all_values()
+                if sheet_name not in sheets_values:
+                    print(f"⚠️ Лист '{sheet_name}' не прочитан (нет в таблице), пропускаю")
+                    if unread_sheets is not None:
+                        unread_sheets.add(sheet_name)
+                    continue
+                all_values = sheets_values[sheet_name]
                 
                 # Проходим по всем строкам (пропускаем заголовок если есть)
                 for row_idx, row in enumerate(all_values):
@@ -269,6 +405,7 @@ def get_schedules_data() -> tuple[List[Dict[str, any]], Dict[str, int]]:
                             all_slots.append({
                                 'interviewer_sheet_id': interviewer_sheet_id,
                                 'interviewer_name': interviewer_name,
+                                'sheet_name': sheet_name,
                                 'date': date,
                                 'time_start': time_start,
                                 'time_end': time_end,
@@ -283,8 +420,6 @@ def get_schedules_data() -> tuple[List[Dict[str, any]], Dict[str, int]]:
                         interviewer_stats[key] = interviewer_stats.get(key, 0) + slots_count
                         print(f"    ✅ {interviewer_name}: {slots_count} слотов")
                 
-                time.sleep(0.5)  # Небольшая задержка между листами
-                
             except Exception as e:
                 print(f"⚠️ Ошибка при чтении листа '{sheet_name}': {e}")
                 continue
@@ -299,7 +434,8 @@ def get_schedules_data() -> tuple[List[Dict[str, any]], Dict[str, int]]:
         return [], {}
 
 
-def export_interviews_to_sheet(interviews_data: List[Dict[str, str]]) -> bool:
+@with_sheets_priority(PRIORITY_LOW)
+async def export_interviews_to_sheet(interviews_data: List[Dict[str, str]]) -> bool:
     """
     Экспортирует записи на собеседования в лист WORK таблицы с расписанием.
     
@@ -322,18 +458,18 @@ def export_interviews_to_sheet(interviews_data: List[Dict[str, str]]) -> bool:
         bool: True если успешно, False если ошибка
     """
     try:
-        client = get_google_sheets_client()
-        sheet = client.open_by_key(SCHEDULE_SHEET_ID)
-        
         # Пытаемся получить лист WORK
         try:
-            worksheet = _with_retries(sheet.worksheet, 'WORK')
+            worksheet = await open_worksheet(SCHEDULE_SHEET_ID, 'WORK')
             print("📋 Лист WORK найден, очищаю...")
-            _with_retries(worksheet.clear)
+            await sheets_call(worksheet.clear)
         except Exception:
             # Если листа нет - создаём
             print("📋 Лист WORK не найден, создаю...")
-            worksheet = _with_retries(sheet.add_worksheet, title='WORK', rows=1000, cols=10)
+            sheets_holder.invalidate(SCHEDULE_SHEET_ID, 'WORK')
+            sheet = await open_spreadsheet(SCHEDULE_SHEET_ID)
+            worksheet = await sheets_call(sheet.add_worksheet, title='WORK', rows=1000, cols=10)
+            sheets_holder.remember(SCHEDULE_SHEET_ID, 'WORK', worksheet)
         
         # Заголовки
         headers = [
@@ -362,10 +498,10 @@ def export_interviews_to_sheet(interviews_data: List[Dict[str, str]]) -> bool:
             ])
         
         # Записываем данные
-        _with_retries(worksheet.update, 'A1', rows)
+        await sheets_call(worksheet.update, 'A1', rows)
         
         # Форматируем заголовок (жирный шрифт)
-        _with_retries(worksheet.format, 'A1:H1', {
+        await sheets_call(worksheet.format, 'A1:H1', {
             'textFormat': {'bold': True},
             'backgroundColor': {'red': 0.9, 'green': 0.9, 'blue': 0.9}
         })
@@ -374,14 +510,18 @@ def export_interviews_to_sheet(interviews_data: List[Dict[str, str]]) -> bool:
         return True
     
     except Exception as e:
+        sheets_holder.invalidate(SCHEDULE_SHEET_ID, 'WORK')
         print(f"❌ Ошибка экспорта в Google Sheets: {e}")
         return False
 
 
-def append_interview_to_work(row: Dict[str, str]) -> bool:
+async def append_interview_to_work(row: Dict[str, str]) -> bool:
     """
     Добавляет одну запись в лист WORK. Создаёт лист и заголовки при отсутствии.
 
+    Строка ставится в очередь utils.sheets_writer; функция возвращает результат
+    после отправки пачки.
+
     Ожидаемые ключи row:
       - candidate_name
       - interviewer_name
@@ -390,14 +530,13 @@ def append_interview_to_work(row: Dict[str, str]) -> bool:
       - date (необязательно)
     """
     try:
-        client = get_google_sheets_client()
-        sheet = _with_retries(client.open_by_key, SCHEDULE_SHEET_ID)
-
         # Пытаемся получить лист WORK
         try:
-            worksheet = _with_retries(sheet.worksheet, 'WORK')
+            worksheet = await open_worksheet(SCHEDULE_SHEET_ID, 'WORK')
         except Exception:
-            worksheet = _with_retries(sheet.add_worksheet, title='WORK', rows=1000, cols=10)
+            sheet = await open_spreadsheet(SCHEDULE_SHEET_ID)
+            worksheet = await sheets_call(sheet.add_worksheet, title='WORK', rows=1000, cols=10)
+            sheets_holder.remember(SCHEDULE_SHEET_ID, 'WORK', worksheet)
             # Поставим заголовки при создании
             headers = [
                 'Кандидат',
@@ -409,8 +548,8 @@ def append_interview_to_work(row: Dict[str, str]) -> bool:
                 'Статус',
                 'Дата записи'
             ]
-            _with_retries(worksheet.update, 'A1', [headers])
-            _with_retries(worksheet.format, 'A1:H1', {
+            await sheets_call(worksheet.update, 'A1', [headers])
+            await sheets_call(worksheet.format, 'A1:H1', {
                 'textFormat': {'bold': True},
                 'backgroundColor': {'red': 0.9, 'green': 0.9, 'blue': 0.9}
             })
@@ -427,8 +566,10 @@ def append_interview_to_work(row: Dict[str, str]) -> bool:
             row.get('created_at', '')
         ]
 
-        _with_retries(worksheet.append_row, values, value_input_option='RAW')
-        return True
+        # Строка уходит пачкой с другими (utils.sheets_writer)
+        from utils.sheets_writer import sheets_writer
+        return await sheets_writer.append_row(SCHEDULE_SHEET_ID, 'WORK', values)
     except Exception as e:
+        sheets_holder.invalidate(SCHEDULE_SHEET_ID, 'WORK')
         print(f"❌ Ошибка добавления строки в WORK: {e}")
         return False
@@ -0,0 +1,89 @@
+"""
+In-process кэш «кто это»: tg_id -> BotUser + Person.
+
+Почти каждый пользовательский хендлер начинается с поиска BotUser по tg_id
+и затем Person. Кэш хранит нужные поля в LRU с TTL, поэтому повторные
+обращения пользователя не ходят в БД.
+
+Инвалидация:
+- /start и /CO сбрасывают запись конкретного tg_id (identity_cache.invalidate);
+- скрипты импорта/связывания увеличивают версию 'people' (utils.cache_versions),
+  после чего все записи считаются устаревшими.
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import BotUser, Person
+from utils.cache_versions import cache_versions, PEOPLE
+
+
+IDENTITY_CACHE_SIZE = int(os.getenv('IDENTITY_CACHE_SIZE', '20000'))
+IDENTITY_CACHE_TTL = float(os.getenv('IDENTITY_CACHE_TTL', '600'))
+
+
+class UserIdentity(NamedTuple):
+    """Минимальный набор полей пользователя, нужный хендлерам."""
+    bot_user_id: int
+    person_id: Optional[int]
+    full_name: Optional[str]
+    faculty: Optional[str]
+    username: Optional[str]
+
+
+class IdentityCache:
+    """Ограниченный LRU-кэш с TTL и привязкой к версии данных people."""
+
+    def __init__(self, maxsize: int = IDENTITY_CACHE_SIZE, ttl: float = IDENTITY_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # tg_id -> (identity, версия people, момент истечения)
+        self._entries: 'OrderedDict[int, Tuple[UserIdentity, int, float]]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, session: AsyncSession, tg_id: int) -> Optional[UserIdentity]:
+        """
+        Возвращает данные пользователя по tg_id или None, если BotUser нет.
+
+        Отсутствие пользователя не кэшируется: он может зарегистрироваться через /start.
+        """
+        version = await cache_versions.get(session, PEOPLE)
+        entry = self._entries.get(tg_id)
+        if entry is not None:
+            identity, entry_version, expires_at = entry
+            if entry_version == version and expires_at > time.monotonic():
+                self._entries.move_to_end(tg_id)
+                self.hits += 1
+                return identity
+            del self._entries[tg_id]
+
+        self.misses += 1
+        stmt = (
+            select(BotUser.id, BotUser.person_id, Person.full_name, Person.faculty, BotUser.telegram_username)
+            .outerjoin(Person, BotUser.person_id == Person.id)
+            .where(BotUser.tg_id == tg_id)
+        )
+        row = (await session.execute(stmt)).first()
+        if row is None:
+            return None
+
+        identity = UserIdentity(*row)
+        self._entries[tg_id] = (identity, version, time.monotonic() + self.ttl)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return identity
+
+    def invalidate(self, tg_id: int) -> None:
+        """Сбрасывает запись пользователя (после регистрации/перепривязки)."""
+        self._entries.pop(tg_id, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+identity_cache = IdentityCache()
@@ -0,0 +1,74 @@
+"""
+Нечёткий поиск участников по ФИО (pg_trgm)
+"""
+import re
+from typing import List, Tuple
+
+from sqlalchemy import select, func, or_, literal
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import Person
+
+
+# Минимальная похожесть для попадания в выдачу.
+# Не ниже pg_trgm.similarity_threshold (0.3 по умолчанию), иначе индекс отсечёт раньше.
+SEARCH_THRESHOLD = 0.35
+
+# Сколько результатов показываем пользователю
+SEARCH_LIMIT = 10
+
+_SPACES_RE = re.compile(r'\s+')
+
+
+def normalize_full_name(value: str) -> str:
+    """Нормализует ФИО так же, как SQL-функция normalize_full_name (миграция 004)."""
+    if not value:
+        return ''
+    value = value.replace('Ё', 'Е').replace('ё', 'е').lower()
+    return _SPACES_RE.sub(' ', value).strip()
+
+
+def _escape_like(value: str) -> str:
+    """Экранирует спецсимволы LIKE."""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+async def search_people(session: AsyncSession, query: str, limit: int = SEARCH_LIMIT) -> Tuple[List[Person], bool]:
+    """
+    Ищет людей по ФИО с учётом опечаток и перестановки частей имени.
+
+    Совпадением считается подстрока нормализованного ФИО или триграммная похожесть
+    (similarity для полного ФИО, word_similarity для части — например, только фамилии).
+    Результаты отсортированы по похожести.
+
+    Returns:
+        Tuple[List[Person], bool]: (не более limit найденных, есть ли ещё совпадения)
+    """
+    normalized = normalize_full_name(query)
+    if not normalized:
+        return [], False
+
+    name_norm = func.normalize_full_name(Person.full_name)
+    score = func.greatest(
+        func.similarity(name_norm, normalized),
+        func.word_similarity(normalized, name_norm),
+    ).label('score')
+    is_substring = name_norm.like(f"%{_escape_like(normalized)}%", escape='\\')
+
+    stmt = (
+        select(Person)
+        .where(
+            or_(
+                is_substring,
+                # Операторы pg_trgm используют GIN-индекс ix_people_full_name_trgm
+                name_norm.op('%')(normalized),
+                literal(normalized).op('<%')(name_norm),
+            ),
+            or_(is_substring, score >= SEARCH_THRESHOLD),
+        )
+        .order_by(is_substring.desc(), score.desc(), Person.full_name)
+        .limit(limit + 1)
+    )
+    result = await session.execute(stmt)
+    people = list(result.scalars().all())
+    return people[:limit], len(people) > limit
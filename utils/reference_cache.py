@@ -0,0 +1,84 @@
+"""
+Кэш справочных данных: списки факультетов people и reserv.
+
+Клавиатуры рассылок и отчёты строятся по спискам факультетов. Раньше каждая
+команда делала SELECT DISTINCT faculty по всей таблице; теперь список считается
+один раз и живёт до смены версии данных (utils.cache_versions), которую
+увеличивают скрипты импорта и миграции.
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import Person, Reserv
+from utils.cache_versions import cache_versions, PEOPLE, RESERV
+
+
+async def _load_faculty_counts(session: AsyncSession, model) -> Dict[str, int]:
+    """Факультет -> количество записей (пустые факультеты пропускаются)."""
+    stmt = (
+        select(model.faculty, func.count(model.id))
+        .where(model.faculty.isnot(None), model.faculty != '')
+        .group_by(model.faculty)
+        .order_by(model.faculty)
+    )
+    result = await session.execute(stmt)
+    return {faculty: count for faculty, count in result.all()}
+
+
+class ReferenceCache:
+    """Значения, пересчитываемые только при изменении версии источника."""
+
+    def __init__(self):
+        # ключ -> (версия, значение)
+        self._values: Dict[str, Tuple[int, object]] = {}
+        self._lock = asyncio.Lock()
+
+    async def get(self, session: AsyncSession, key: str, version_name: str,
+                  loader: Callable[[AsyncSession], Awaitable[object]]):
+        version = await cache_versions.get(session, version_name)
+        cached = self._values.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        async with self._lock:
+            cached = self._values.get(key)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+            value = await loader(session)
+            self._values[key] = (version, value)
+            return value
+
+    def clear(self) -> None:
+        self._values.clear()
+
+
+reference_cache = ReferenceCache()
+
+
+async def get_faculty_person_counts(session: AsyncSession) -> Dict[str, int]:
+    """Факультет -> число людей в people (для предпросмотра аудитории рассылки)."""
+    return await reference_cache.get(
+        session, 'people_faculty_counts', PEOPLE,
+        lambda s: _load_faculty_counts(s, Person),
+    )
+
+
+async def get_person_faculties(session: AsyncSession) -> List[str]:
+    """Отсортированный список факультетов из people."""
+    return list(await get_faculty_person_counts(session))
+
+
+async def get_reserv_faculty_counts(session: AsyncSession) -> Dict[str, int]:
+    """Факультет -> число записей в reserv."""
+    return await reference_cache.get(
+        session, 'reserv_faculty_counts', RESERV,
+        lambda s: _load_faculty_counts(s, Reserv),
+    )
+
+
+async def get_reserv_faculties(session: AsyncSession) -> List[str]:
+    """Отсортированный список факультетов из reserv."""
+    return list(await get_reserv_faculty_counts(session))
@@ -2,10 +2,10 @@
 Парсер для новой системы резерва - листы 'резерв' и 'финфак'
 """
 import gspread
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Set, Tuple
 from datetime import datetime
-import time
-from utils.google_sheets import get_google_sheets_client, _with_retries
+from utils.google_sheets import batch_get_values
+from utils.sheets_quota import with_sheets_priority, PRIORITY_LOW
 
 
 # URL таблицы с расписанием резерва
@@ -60,12 +60,14 @@ def get_time_end(time_start: str) -> str:
     return f"{end_hours:02d}:{end_minutes:02d}"
 
 
-def parse_reserv_sheets(sheet_names: List[str] = None) -> Tuple[List[Dict], Dict[str, Dict]]:
+@with_sheets_priority(PRIORITY_LOW)
+async def parse_reserv_sheets(sheet_names: List[str] = None, unread_sheets: Optional[Set[str]] = None) -> Tuple[List[Dict], Dict[str, Dict]]:
     """
     Парсит листы резерва из Google Sheets.
     
     Args:
         sheet_names: Список имен листов для парсинга. Если None - парсятся все.
+        unread_sheets: Если передан, сюда добавляются листы, которых нет в таблице.
     
     Returns:
         Tuple[List[Dict], Dict]: (список слотов, статистика по собеседующим)
@@ -100,17 +102,18 @@ def parse_reserv_sheets(sheet_names: List[str] = None) -> Tuple[List[Dict], Dict
     interviewer_stats = {}  # {interviewer_id: {name, sheets: {sheet_name: {slots, times}}, total}}
     
     try:
-        client = get_google_sheets_client()
-        spreadsheet = _with_retries(client.open_by_key, RESERV_SHEET_ID)
-        
         print(f"\n🔄 Начинаю парсинг резерва из таблицы...")
         print(f"📋 Таблица: {RESERV_SHEET_URL}\n")
         
         for sheet_name in sheet_names:
             if sheet_name not in RESERV_SHEETS:
                 print(f"⚠️ Неизвестный лист: {sheet_name}, пропускаю")
-                continue
-            
+        sheet_names = [name for name in sheet_names if name in RESERV_SHEETS]
+        
+        # Все листы — одним запросом, дальше разбираем локально
+        sheets_values = await batch_get_values(RESERV_SHEET_ID, sheet_names) if sheet_names else {}
+        
+        for sheet_name in sheet_names:
             config = RESERV_SHEETS[sheet_name]
             date = config['date']
             for_faculty = config['for_faculty']
@@ -122,11 +125,12 @@ def parse_reserv_sheets(sheet_names: List[str] = None) -> Tuple[List[Dict], Dict
             print(f"{'='*60}\n")
             
             try:
-                worksheet = _with_retries(spreadsheet.worksheet, sheet_name)
-                time.sleep(0.5)  # Защита от rate limit
-                
-                # Получаем все значения листа
-                all_values = _with_retries(worksheet.get_all_values)
+                if sheet_name not in sheets_values:
+                    print(f"⚠️ Лист '{sheet_name}' не прочитан (нет в таблице), пропускаю\n")
+                    if unread_sheets is not None:
+                        unread_sheets.add(sheet_name)
+                    continue
+                all_values = sheets_values[sheet_name]
                 
                 if not all_values or len(all_values) < 2:
                     print(f"⚠️ Лист '{sheet_name}' пустой или содержит только заголовок\n")
@@ -243,8 +247,6 @@ def parse_reserv_sheets(sheet_names: List[str] = None) -> Tuple[List[Dict], Dict
                 print(f"   ⚠️ Пропущено: {rows_skipped} строк")
                 print(f"   📦 Создано слотов: {sum(1 for s in all_slots if s['sheet_name'] == sheet_name)}\n")
                 
-                time.sleep(0.5)  # Задержка между листами
-                
             except Exception as e:
                 print(f"❌ Ошибка при парсинге листа '{sheet_name}': {e}\n")
                 import traceback
@@ -0,0 +1,300 @@
+"""
+Надёжный экспорт записей в Google Sheets через таблицу sheet_outbox (миграция 011).
+
+Хендлер подтверждения записи не ходит в Google Sheets: он добавляет строку
+в sheet_outbox в той же транзакции, что и саму запись. Запись есть — значит,
+есть и задание на экспорт; перезапуск бота или недоступность Sheets его
+не теряют.
+
+Фоновый sheet_outbox_relay раз в OUTBOX_POLL_INTERVAL секунд (или сразу после
+wake()) забирает пачку заданий: короткой транзакцией (FOR UPDATE SKIP LOCKED —
+несколько процессов не возьмут одно задание) помечает их processing с арендой
+на OUTBOX_LEASE_SECONDS и коммитит. Затем отправляет их вне транзакции (в Sheets
+они уходят одной пачкой utils.sheets_writer) и второй транзакцией помечает done.
+Если процесс упал посреди отправки, задания забираются снова, когда истечёт
+аренда. Неудачные повторяются с растущей паузой, после OUTBOX_MAX_ATTEMPTS
+попыток получают статус failed (/outbox retry возвращает их в очередь);
+задание, которое не удастся и при повторе (PermanentExportError), получает
+failed сразу.
+Пока Google Sheets недоступен (автомат utils.sheets_client.sheets_breaker
+разомкнут), очередь не разбирается, а попытки, сорвавшиеся из-за
+недоступности, не засчитываются.
+
+idempotency_key (например 'sobes:15:work', 'finfak:7:matrix', 'finfak:7:all')
+уникален: повторная постановка того же экспорта ничего не добавит.
+"""
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional
+
+from sqlalchemy import select, update, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.engine import async_session_maker
+from db.models import SheetOutbox
+from db.booking_view import BookingRow
+from utils.sheets_client import sheets_breaker
+from utils.sheets_quota import sheets_priority, PRIORITY_HIGH
+
+
+# Виды заданий. Запись в матрицу и строка во «всеобщей» — отдельные задания:
+# повтор одного не дублирует другое
+WORK_APPEND = 'work_append'  # строка в лист WORK (собеседования)
+RESERV_MATRIX = 'reserv_matrix'  # ячейка в «резерв_записи»
+RESERV_ALL = 'reserv_all'  # строка в «всеобщая»
+FINFAK_MATRIX = 'finfak_matrix'  # ячейка в «финфак_записи»
+FINFAK_ALL = 'finfak_all'  # строка в «всеобщая»
+
+# Период опроса очереди (секунды)
+OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', '5'))
+# Заданий за один проход
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '50'))
+# Аренда забранной пачки (секунды): после неё задания со статусом processing забираются снова
+OUTBOX_LEASE_SECONDS = float(os.getenv('OUTBOX_LEASE_SECONDS', '300'))
+# Попыток до статуса failed
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '10'))
+# Пауза перед повтором: 30 с, 60 с, 120 с, ... но не больше 30 минут
+OUTBOX_RETRY_BASE = 30
+OUTBOX_RETRY_MAX = 30 * 60
+
+
+class PermanentExportError(Exception):
+    """Экспорт не удастся и при повторе (собеседующего нет в таблице, неизвестное время): задание сразу failed."""
+
+
+def booking_payload(row: BookingRow) -> Dict:
+    """Строка витрины в виде, пригодном для JSON."""
+    payload = row._asdict()
+    payload['created_at'] = row.created_at.isoformat() if row.created_at else None
+    return payload
+
+
+def _booking_from_payload(payload: Dict) -> BookingRow:
+    created_at = payload.get('created_at')
+    return BookingRow(**{**payload, 'created_at': datetime.fromisoformat(created_at) if created_at else None})
+
+
+async def enqueue_sheet_export(session: AsyncSession, kind: str, idempotency_key: str, payload: Dict) -> None:
+    """Ставит экспорт в очередь в текущей транзакции (коммит — за вызывающим)."""
+    stmt = (
+        insert(SheetOutbox)
+        .values(idempotency_key=idempotency_key, kind=kind, payload=payload, status='pending', attempts=0)
+        .on_conflict_do_nothing(index_elements=['idempotency_key'])
+    )
+    await session.execute(stmt)
+
+
+async def _deliver(kind: str, payload: Dict) -> bool:
+    # Импорт здесь: модули экспорта тянут gspread и клиента таблиц
+    if kind == WORK_APPEND:
+        from utils.google_sheets import append_interview_to_work
+        return await append_interview_to_work(payload)
+    if kind == RESERV_MATRIX:
+        from utils.reserv_export import export_reserv_matrix
+        return await export_reserv_matrix(_booking_from_payload(payload))
+    if kind == RESERV_ALL:
+        from utils.reserv_export import export_reserv_all
+        return await export_reserv_all(_booking_from_payload(payload))
+    if kind == FINFAK_MATRIX:
+        from utils.finfak_export import export_finfak_matrix
+        return await export_finfak_matrix(_booking_from_payload(payload))
+    if kind == FINFAK_ALL:
+        from utils.finfak_export import export_finfak_all
+        return await export_finfak_all(_booking_from_payload(payload))
+    raise ValueError(f'Неизвестный вид экспорта: {kind}')
+
+
+class _Claim(NamedTuple):
+    """Забранное задание: поля, нужные для отправки и записи итога."""
+    id: int
+    key: str
+    kind: str
+    payload: Dict
+    attempts: int
+
+
+class SheetOutboxRelay:
+    """Фоновая отправка заданий из sheet_outbox."""
+
+    def __init__(self, interval: float = OUTBOX_POLL_INTERVAL, batch_size: int = OUTBOX_BATCH_SIZE):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+    def wake(self) -> None:
+        """Новое задание закоммичено — обработать, не дожидаясь таймера."""
+        self._wakeup.set()
+
+    async def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        sheets_priority.set(PRIORITY_HIGH)
+        while True:
+            try:
+                # Пока очередь не пуста — забираем пачку за пачкой (если Sheets доступен)
+                while not sheets_breaker.is_open and await self.drain_once() >= self.batch_size:
+                    pass
+            except Exception as e:
+                print(f"⚠️ Ошибка обработки sheet_outbox: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def drain_once(self) -> int:
+        """Обрабатывает одну пачку заданий. Возвращает число взятых заданий."""
+        claims = await self._claim()
+        if not claims:
+            return 0
+
+        # Отправка — вне транзакции: строки уже помечены processing и не держат блокировок.
+        # Все задания пачки отправляются одновременно — sheets_writer объединит их в один запрос
+        results = await asyncio.gather(
+            *(_deliver(claim.kind, claim.payload) for claim in claims),
+            return_exceptions=True,
+        )
+
+        await self._record(claims, results)
+        done = sum(1 for result in results if result is True)
+        print(f"📤 sheet_outbox: отправлено {done} из {len(claims)}")
+        return len(claims)
+
+    async def _claim(self) -> List[_Claim]:
+        """
+        Забирает пачку короткой транзакцией: status='processing' и аренда на OUTBOX_LEASE_SECONDS.
+
+        Задание, аренда которого истекла (процесс упал посреди отправки), забирается снова.
+        """
+        async with async_session_maker() as session:
+            stmt = (
+                select(SheetOutbox)
+                .where(SheetOutbox.status.in_(('pending', 'processing')), SheetOutbox.next_attempt_at <= func.now())
+                .order_by(SheetOutbox.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            items = (await session.execute(stmt)).scalars().all()
+            if not items:
+                return []
+            lease_until = datetime.now().astimezone() + timedelta(seconds=OUTBOX_LEASE_SECONDS)
+            claims = []
+            for item in items:
+                if item.status == 'processing':
+                    print(f"⚠️ sheet_outbox: аренда задания {item.idempotency_key} истекла, забираю снова")
+                item.status = 'processing'
+                item.next_attempt_at = lease_until
+                claims.append(_Claim(item.id, item.idempotency_key, item.kind, item.payload, item.attempts))
+            await session.commit()
+        return claims
+
+    async def _record(self, claims: List[_Claim], results: List) -> None:
+        """Записывает итоги отправки второй короткой транзакцией."""
+        now = datetime.now().astimezone()
+        # Сбои при разомкнутом автомате — недоступность Sheets, а не ошибка задания
+        unavailable = sheets_breaker.is_open
+        async with async_session_maker() as session:
+            for claim, result in zip(claims, results):
+                if result is True:
+                    values = {'status': 'done', 'processed_at': now, 'last_error': None}
+                elif isinstance(result, PermanentExportError):
+                    values = {'status': 'failed', 'attempts': claim.attempts + 1, 'last_error': str(result)}
+                    print(f"❌ sheet_outbox: задание {claim.key} не может быть отправлено: {result}")
+                elif unavailable:
+                    values = {
+                        'status': 'pending',
+                        'last_error': 'Google Sheets недоступен',
+                        'next_attempt_at': now + timedelta(seconds=sheets_breaker.open_seconds),
+                    }
+                else:
+                    attempts = claim.attempts + 1
+                    values = {
+                        'attempts': attempts,
+                        'last_error': str(result) if isinstance(result, Exception) else 'экспорт вернул ошибку (см. лог)',
+                    }
+                    if attempts >= OUTBOX_MAX_ATTEMPTS:
+                        values['status'] = 'failed'
+                        print(f"❌ sheet_outbox: задание {claim.key} не отправлено после {attempts} попыток")
+                    else:
+                        delay = min(OUTBOX_RETRY_BASE * (2 ** (attempts - 1)), OUTBOX_RETRY_MAX)
+                        values['status'] = 'pending'
+                        values['next_attempt_at'] = now + timedelta(seconds=delay)
+                # Аренду могли перехватить, если отправка шла дольше OUTBOX_LEASE_SECONDS — тогда итог запишет другой
+                await session.execute(
+                    update(SheetOutbox)
+                    .where(SheetOutbox.id == claim.id, SheetOutbox.status == 'processing')
+                    .values(**values)
+                )
+            await session.commit()
+
+
+sheet_outbox_relay = SheetOutboxRelay()
+
+
+class OutboxSummary(NamedTuple):
+    counts: Dict[str, int]  # status -> число заданий
+    oldest_pending: Optional[datetime]
+    failed: List[SheetOutbox]  # последние проваленные
+
+
+async def get_outbox_summary(session: AsyncSession, failed_limit: int = 5) -> OutboxSummary:
+    """Сводка очереди для /outbox."""
+    counts_result = await session.execute(
+        select(SheetOutbox.status, func.count()).group_by(SheetOutbox.status)
+    )
+    oldest_result = await session.execute(
+        select(func.min(SheetOutbox.created_at)).where(SheetOutbox.status == 'pending')
+    )
+    failed_result = await session.execute(
+        select(SheetOutbox)
+        .where(SheetOutbox.status == 'failed')
+        .order_by(SheetOutbox.id.desc())
+        .limit(failed_limit)
+    )
+    return OutboxSummary(dict(counts_result.all()), oldest_result.scalar(), failed_result.scalars().all())
+
+
+async def retry_failed(session: AsyncSession) -> int:
+    """Возвращает проваленные задания в очередь. Коммит — за вызывающим."""
+    result = await session.execute(
+        update(SheetOutbox)
+        .where(SheetOutbox.status == 'failed')
+        .values(status='pending', attempts=0, next_attempt_at=func.now())
+    )
+    return result.rowcount or 0
+
+
+def format_outbox_summary(summary: OutboxSummary) -> str:
+    counts = summary.counts
+    lines = [
+        '📤 Очередь экспорта в Google Sheets',
+        f"⏳ Ожидают: {counts.get('pending', 0)}",
+        f"🔄 Отправляются: {counts.get('processing', 0)}",
+        f"✅ Отправлено: {counts.get('done', 0)}",
+        f"❌ Не отправлено: {counts.get('failed', 0)}",
+    ]
+    if summary.oldest_pending:
+        age = datetime.now().astimezone() - summary.oldest_pending
+        lines.append(f'🕐 Самое старое ожидающее: {int(age.total_seconds() // 60)} мин назад')
+    if summary.failed:
+        lines.append('')
+        lines.append('Последние ошибки:')
+        for item in summary.failed:
+            lines.append(f'  • {item.idempotency_key} ({item.attempts} попыток): {(item.last_error or "")[:200]}')
+        lines.append('')
+        lines.append('/outbox retry — вернуть неотправленные в очередь')
+    return '\n'.join(lines)
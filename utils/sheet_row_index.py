@@ -0,0 +1,94 @@
+"""
+Кэш номеров строк собеседующих в матричных листах ("финфак_записи", "резерв_записи").
+
+Чтобы записать ФИО кандидата в одну ячейку, нужно знать строку собеседующего:
+его ID стоит в колонке T. Раньше каждый экспорт скачивал весь лист
+(get_all_values) и искал ID заново. Теперь индекс ID -> номер строки
+строится одним узким запросом диапазона T:T и переиспользуется всеми
+экспортами. Индекс перечитывается по истечении SHEETS_ROW_INDEX_TTL или
+если ID в нём не нашёлся (собеседующего добавили в таблицу), но не чаще
+раза в SHEETS_ROW_INDEX_MIN_REFRESH секунд.
+
+    row = await matrix_row_index.find_row(SHEET_ID, 'финфак_записи', '17')
+"""
+import asyncio
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+from utils.google_sheets import open_spreadsheet, sheets_holder
+from utils.sheets_client import sheets_call
+
+
+# Время жизни индекса (секунды)
+SHEETS_ROW_INDEX_TTL = float(os.getenv('SHEETS_ROW_INDEX_TTL', '600'))
+# Минимальный интервал между перечитываниями при промахе (секунды)
+SHEETS_ROW_INDEX_MIN_REFRESH = float(os.getenv('SHEETS_ROW_INDEX_MIN_REFRESH', '15'))
+
+# Колонка с ID собеседующего
+ID_COLUMN = 'T'
+
+
+class MatrixRowIndex:
+    """ID собеседующего -> номер строки (с 1) для каждого матричного листа."""
+
+    def __init__(self, ttl: float = SHEETS_ROW_INDEX_TTL, min_refresh: float = SHEETS_ROW_INDEX_MIN_REFRESH):
+        self.ttl = ttl
+        self.min_refresh = min_refresh
+        # (sheet_id, title) -> (индекс, время загрузки)
+        self._indexes: Dict[Tuple[str, str], Tuple[Dict[str, int], float]] = {}
+        self._locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+
+    async def _load(self, sheet_id: str, title: str) -> Dict[str, int]:
+        spreadsheet = await open_spreadsheet(sheet_id)
+        a1_range = "'{}'!{col}:{col}".format(title.replace("'", "''"), col=ID_COLUMN)
+        response = await sheets_call(spreadsheet.values_get, a1_range)
+        index = {}
+        for row_idx, row in enumerate(response.get('values', [])):
+            value = str(row[0]).strip() if row else ''
+            # Как и раньше, при повторе ID берётся первая строка
+            if value and value not in index:
+                index[value] = row_idx + 1
+        print(f"📇 Индекс строк '{title}': {len(index)} собеседующих")
+        return index
+
+    def _lookup(self, key: Tuple[str, str], interviewer_sheet_id: str) -> Tuple[bool, Optional[int]]:
+        """(индекс годится, номер строки) по закэшированному индексу."""
+        cached = self._indexes.get(key)
+        if cached is None:
+            return False, None
+        index, loaded_at = cached
+        age = time.monotonic() - loaded_at
+        # Промах в свежем индексе не перечитываем: собеседующего действительно нет
+        fresh = age < self.ttl and (interviewer_sheet_id in index or age < self.min_refresh)
+        return fresh, index.get(interviewer_sheet_id)
+
+    async def find_row(self, sheet_id: str, title: str, interviewer_sheet_id: str) -> Optional[int]:
+        """Номер строки собеседующего или None, если его нет в листе."""
+        key = (sheet_id, title)
+        interviewer_sheet_id = str(interviewer_sheet_id or '').strip()
+
+        fresh, row = self._lookup(key, interviewer_sheet_id)
+        if fresh:
+            return row
+
+        # Одновременные экспорты ждут одно перечитывание, а не делают своё
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            fresh, row = self._lookup(key, interviewer_sheet_id)
+            if fresh:
+                return row
+            try:
+                index = await self._load(sheet_id, title)
+            except Exception:
+                sheets_holder.invalidate(sheet_id)
+                raise
+            self._indexes[key] = (index, time.monotonic())
+            return index.get(interviewer_sheet_id)
+
+    def invalidate(self, sheet_id: str, title: str) -> None:
+        """Сбрасывает индекс листа (например, после ошибки записи)."""
+        self._indexes.pop((sheet_id, title), None)
+
+
+matrix_row_index = MatrixRowIndex()
@@ -0,0 +1,253 @@
+"""
+Асинхронный фасад над gspread.
+
+gspread синхронный: каждый вызов — HTTP-запрос, который блокирует поток.
+Из хендлеров его вызывать нельзя, иначе пока идёт запрос к таблице
+(или time.sleep в ретраях) бот не обрабатывает ни одного апдейта.
+
+Здесь все вызовы gspread выполняются в отдельном ограниченном пуле потоков
+(SHEETS_MAX_WORKERS), каждый — с таймаутом (SHEETS_CALL_TIMEOUT). Перед каждым
+запросом берётся токен общей квоты (utils.sheets_quota): все модули делят
+один лимит Google.
+
+Повторяются только временные ошибки — 429, 5xx, таймауты и сетевые сбои
+(400/403/404 пробрасываются сразу) — и только в пределах общего бюджета
+повторов (retry_budget). Добавление строк (append_rows и т.п.) после таймаута
+или 5xx не повторяется: первый запрос мог уже примениться, и строка
+добавилась бы дважды. Такую ошибку решает вызывающий (sheet_outbox). После SHEETS_BREAKER_FAILURES сбоев подряд автомат
+sheets_breaker размыкается: SHEETS_BREAKER_OPEN_SECONDS секунд вызовы сразу
+получают SheetsUnavailable, затем один пробный запрос решает, замкнуть ли его.
+Экспорты записей в это время ждут в sheet_outbox.
+
+    worksheet = await sheets_call(spreadsheet.worksheet, 'WORK')
+    values = await sheets_call(worksheet.get_all_values)
+"""
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Optional
+
+from google.auth.exceptions import TransportError
+from gspread.exceptions import APIError
+from requests.exceptions import ConnectionError as RequestsConnectionError, Timeout as RequestsTimeout
+
+from utils.sheets_quota import sheets_quota, quota_bucket
+
+
+# Одновременных запросов к Google Sheets (потоков пула)
+SHEETS_MAX_WORKERS = int(os.getenv('SHEETS_MAX_WORKERS', '4'))
+# Таймаут одного вызова (секунды)
+SHEETS_CALL_TIMEOUT = float(os.getenv('SHEETS_CALL_TIMEOUT', '30'))
+# Сбоев подряд, после которых автомат размыкается
+SHEETS_BREAKER_FAILURES = int(os.getenv('SHEETS_BREAKER_FAILURES', '5'))
+# Сколько автомат остаётся разомкнутым до пробного запроса (секунды)
+SHEETS_BREAKER_OPEN_SECONDS = float(os.getenv('SHEETS_BREAKER_OPEN_SECONDS', '30'))
+# Бюджет повторов за минуту: доля от числа запросов, но не меньше SHEETS_RETRY_BUDGET_MIN
+SHEETS_RETRY_BUDGET_RATIO = float(os.getenv('SHEETS_RETRY_BUDGET_RATIO', '0.2'))
+SHEETS_RETRY_BUDGET_MIN = int(os.getenv('SHEETS_RETRY_BUDGET_MIN', '5'))
+SHEETS_RETRY_BUDGET_WINDOW = 60
+
+_executor = ThreadPoolExecutor(max_workers=SHEETS_MAX_WORKERS, thread_name_prefix='sheets')
+
+# Виды ошибок
+RATE_LIMITED = 'rate_limited'  # 429: сервис работает, превышена квота
+OUTAGE = 'outage'  # 5xx, таймаут, сеть: сервис недоступен
+PERMANENT = 'permanent'  # 400/403/404 и прочее: повтор не поможет
+
+
+# Методы, повтор которых после OUTAGE может задвоить данные (429 повторять можно: запрос не выполнен)
+_NON_IDEMPOTENT_METHODS = {'append_row', 'append_rows', 'values_append', 'insert_row', 'insert_rows'}
+
+
+class SheetsUnavailable(Exception):
+    """Google Sheets недоступен: автомат разомкнут, запрос не отправлялся."""
+
+
+def classify_error(error: Exception) -> str:
+    """Вид ошибки вызова Google Sheets: RATE_LIMITED, OUTAGE или PERMANENT."""
+    if isinstance(error, (asyncio.TimeoutError, RequestsConnectionError, RequestsTimeout, TransportError)):
+        return OUTAGE
+    response = getattr(error, 'response', None)
+    code = getattr(response, 'status_code', None)
+    if isinstance(error, APIError) and code is not None:
+        if code == 429:
+            return RATE_LIMITED
+        return OUTAGE if code >= 500 else PERMANENT
+    # Код ответа неизвестен — судим по тексту
+    msg = str(error).lower()
+    if any(s in msg for s in ['rate limit', 'rate_limit', 'quota', '429']):
+        return RATE_LIMITED
+    if any(s in msg for s in ['backenderror', 'internal error', 'deadline', 'unavailable']):
+        return OUTAGE
+    return PERMANENT
+
+
+class CircuitBreaker:
+    """Автомат closed / open / half-open для вызовов Google Sheets."""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold: int = SHEETS_BREAKER_FAILURES, open_seconds: float = SHEETS_BREAKER_OPEN_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self.failures = 0  # сбоев подряд
+        self.opened_at = 0.0
+        self.opened_count = 0
+        self.rejected = 0  # вызовов, отклонённых без запроса
+        self._probe_started: Optional[float] = None
+
+    def _refresh(self) -> None:
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.open_seconds:
+            self.state = self.HALF_OPEN
+            self._probe_started = None
+
+    def _probe_in_flight(self) -> bool:
+        # Пробный вызов, отменённый снаружи, не держит автомат дольше двух таймаутов
+        return self._probe_started is not None and time.monotonic() - self._probe_started < SHEETS_CALL_TIMEOUT * 2
+
+    @property
+    def is_open(self) -> bool:
+        """Вызовы сейчас отклоняются."""
+        self._refresh()
+        return self.state == self.OPEN or (self.state == self.HALF_OPEN and self._probe_in_flight())
+
+    def before_call(self) -> None:
+        """Пропускает вызов или бросает SheetsUnavailable."""
+        self._refresh()
+        if self.state == self.CLOSED:
+            return
+        if self.state == self.HALF_OPEN and not self._probe_in_flight():
+            self._probe_started = time.monotonic()
+            return
+        self.rejected += 1
+        raise SheetsUnavailable('Google Sheets временно недоступен, вызов отложен')
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            print("✅ Google Sheets снова доступен, автомат замкнут")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_started = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.opened_count += 1
+                print(f"🔌 Google Sheets недоступен ({self.failures} сбоев подряд), вызовы приостановлены на {self.open_seconds:.0f} с")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self._probe_started = None
+
+    def format_status(self) -> str:
+        self._refresh()
+        line = f'🔌 Автомат: {self.state}, сбоев подряд: {self.failures}, размыканий: {self.opened_count}, отклонено вызовов: {self.rejected}'
+        if self.state == self.OPEN:
+            left = self.open_seconds - (time.monotonic() - self.opened_at)
+            line += f', пробный запрос через {max(left, 0):.0f} с'
+        return line
+
+
+class RetryBudget:
+    """Повторов за окно — не больше доли от числа запросов (но не меньше minimum)."""
+
+    def __init__(self, ratio: float = SHEETS_RETRY_BUDGET_RATIO, minimum: int = SHEETS_RETRY_BUDGET_MIN, window: float = SHEETS_RETRY_BUDGET_WINDOW):
+        self.ratio = ratio
+        self.minimum = minimum
+        self.window = window
+        self._requests = deque()
+        self._retries = deque()
+        self.exhausted = 0
+
+    def _trim(self, now: float) -> None:
+        for stamps in (self._requests, self._retries):
+            while stamps and now - stamps[0] > self.window:
+                stamps.popleft()
+
+    def record_request(self) -> None:
+        self._requests.append(time.monotonic())
+
+    def try_spend(self) -> bool:
+        now = time.monotonic()
+        self._trim(now)
+        if len(self._retries) >= max(self.minimum, len(self._requests) * self.ratio):
+            self.exhausted += 1
+            return False
+        self._retries.append(now)
+        return True
+
+    def format_status(self) -> str:
+        self._trim(time.monotonic())
+        return (
+            f'🔁 Повторов за {self.window:.0f} с: {len(self._retries)} на {len(self._requests)} вызовов, '
+            f'бюджет исчерпан: {self.exhausted} раз'
+        )
+
+
+sheets_breaker = CircuitBreaker()
+retry_budget = RetryBudget()
+
+
+async def run_sheets(callable_fn, *args, timeout: float = None, **kwargs):
+    """
+    Выполняет синхронный вызов gspread в пуле потоков, не блокируя event loop.
+
+    По таймауту бросает asyncio.TimeoutError (поток при этом дорабатывает запрос сам).
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(_executor, partial(callable_fn, *args, **kwargs))
+    return await asyncio.wait_for(future, timeout=timeout or SHEETS_CALL_TIMEOUT)
+
+
+async def sheets_call(callable_fn, *args, max_attempts: int = 5, base_delay: float = 0.8, timeout: float = None, **kwargs):
+    """
+    Вызов Google Sheets API в пуле потоков с экспоненциальным бэкоффом и джиттером.
+
+    Если автомат разомкнут — сразу SheetsUnavailable, без запроса.
+    """
+    bucket = quota_bucket(callable_fn)
+    retry_on_outage = getattr(callable_fn, '__name__', '') not in _NON_IDEMPOTENT_METHODS
+    retry_budget.record_request()
+    attempt = 0
+    while True:
+        sheets_breaker.before_call()
+        try:
+            # Каждая попытка — отдельный запрос к API, тратит токен квоты
+            if bucket:
+                await sheets_quota.acquire(bucket)
+            result = await run_sheets(callable_fn, *args, timeout=timeout, **kwargs)
+        except Exception as e:
+            kind = classify_error(e)
+            if kind == OUTAGE:
+                sheets_breaker.record_failure()
+            else:
+                # Google ответил — сервис работает
+                sheets_breaker.record_success()
+            if kind == RATE_LIMITED:
+                sheets_quota.record_throttled()
+
+            attempt += 1
+            if kind == PERMANENT or (kind == OUTAGE and not retry_on_outage):
+                raise
+            if attempt >= max_attempts or sheets_breaker.is_open or not retry_budget.try_spend():
+                raise
+
+            # Экспоненциальный бэкофф с джиттером
+            delay = base_delay * (2 ** (attempt - 1))
+            delay = delay + random.uniform(0, 0.25)
+            await asyncio.sleep(delay)
+        else:
+            sheets_breaker.record_success()
+            return result
+
+
+def shutdown_sheets_executor() -> None:
+    """Останавливает пул потоков (при завершении бота)."""
+    _executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,240 @@
+"""
+Общая квота запросов к Google Sheets (token bucket).
+
+Google ограничивает нас примерно 60 запросами чтения и 60 запросами записи
+в минуту на пользователя. Раньше каждый модуль сам делал паузы, и они
+мешали друг другу: /sync_slots во время наплыва записей приводил к 429
+в экспортах. Теперь каждый вызов gspread (utils.sheets_client.sheets_call)
+сначала берёт токен из общего ведра: read или write, в зависимости от метода.
+
+Ожидающие обслуживаются по приоритету: экспорт записей (PRIORITY_HIGH)
+раньше интерактивных запросов (PRIORITY_NORMAL), а они — раньше админских
+синхронизаций и выгрузок (PRIORITY_LOW). Приоритет задаётся contextvar:
+
+    @with_sheets_priority(PRIORITY_LOW)
+    async def get_schedules_data(): ...
+
+SHEETS_QUOTA_DB=1 — дополнительно брать токен из общего ведра в таблице
+sheets_quota (миграция 012), чтобы квоту делили несколько процессов бота.
+
+Время ожидания токена по ведрам и приоритетам — команда /sheets_stats.
+"""
+import asyncio
+import functools
+import heapq
+import itertools
+import os
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+
+# Запросов в минуту (с запасом от лимита Google в 60)
+SHEETS_READ_PER_MINUTE = float(os.getenv('SHEETS_READ_PER_MINUTE', '55'))
+SHEETS_WRITE_PER_MINUTE = float(os.getenv('SHEETS_WRITE_PER_MINUTE', '55'))
+# Сколько запросов можно сделать подряд без ожидания
+SHEETS_QUOTA_BURST = float(os.getenv('SHEETS_QUOTA_BURST', '10'))
+# Делить квоту между процессами через PostgreSQL
+SHEETS_QUOTA_DB = os.getenv('SHEETS_QUOTA_DB', '0').lower() in ('1', 'true', 'yes')
+
+READ = 'read'
+WRITE = 'write'
+
+# Меньше — раньше
+PRIORITY_HIGH = 0  # экспорт записей на собеседования
+PRIORITY_NORMAL = 1  # интерактивные запросы (вход собеседующего по коду)
+PRIORITY_LOW = 2  # админские синхронизации и выгрузки
+
+PRIORITY_NAMES = {PRIORITY_HIGH: 'high', PRIORITY_NORMAL: 'normal', PRIORITY_LOW: 'low'}
+
+sheets_priority: ContextVar[int] = ContextVar('sheets_priority', default=PRIORITY_NORMAL)
+
+# Методы gspread, которые расходуют квоту записи
+_WRITE_METHODS = {
+    'update', 'update_acell', 'update_cell', 'update_cells', 'append_row', 'append_rows',
+    'insert_row', 'insert_rows', 'delete_rows', 'clear', 'batch_clear', 'batch_update', 'format',
+    'values_update', 'values_append', 'values_clear', 'values_batch_update', 'values_batch_clear',
+    'add_worksheet', 'del_worksheet', 'duplicate_sheet', 'add_rows', 'add_cols', 'resize',
+}
+
+
+def with_sheets_priority(priority: int):
+    """Декоратор корутины: все запросы к Sheets внутри идут с приоритетом priority."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            token = sheets_priority.set(priority)
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                sheets_priority.reset(token)
+        return wrapper
+    return decorator
+
+
+def quota_bucket(callable_fn) -> Optional[str]:
+    """Ведро для вызова: write/read для методов gspread, None — не запрос к Sheets API."""
+    owner = getattr(callable_fn, '__self__', None)
+    if owner is None or not type(owner).__module__.startswith('gspread'):
+        return None
+    return WRITE if getattr(callable_fn, '__name__', '') in _WRITE_METHODS else READ
+
+
+class _WaitCounter:
+    __slots__ = ('count', 'waited', 'total_ms', 'max_ms')
+
+    def __init__(self):
+        self.count = 0
+        self.waited = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, wait_ms: float) -> None:
+        self.count += 1
+        if wait_ms >= 1:
+            self.waited += 1
+        self.total_ms += wait_ms
+        self.max_ms = max(self.max_ms, wait_ms)
+
+
+class TokenBucket:
+    """Ведро токенов с очередью ожидающих по приоритету."""
+
+    def __init__(self, name: str, per_minute: float, burst: float):
+        self.name = name
+        self.rate = per_minute / 60
+        self.capacity = burst
+        self.tokens = burst
+        self._updated = time.monotonic()
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []  # (priority, seq, future)
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    async def acquire(self, priority: int) -> None:
+        self._refill()
+        if not self._waiters and self.tokens >= 1:
+            self.tokens -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._timer is None:
+            self._dispatch()
+        await future
+
+    def _dispatch(self) -> None:
+        """Раздаёт накопившиеся токены ожидающим и планирует следующую раздачу."""
+        self._timer = None
+        self._refill()
+        while self._waiters and self.tokens >= 1:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():  # ожидающий отменён
+                continue
+            self.tokens -= 1
+            future.set_result(None)
+        while self._waiters and self._waiters[0][2].done():
+            heapq.heappop(self._waiters)
+        if self._waiters:
+            delay = (1 - self.tokens) / self.rate
+            self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+
+# Общее ведро в PostgreSQL: пополнение и списание одним запросом.
+# Параметры приведены к double precision явно: иначе тип :capacity выводится из "- 1" как integer
+_DB_ACQUIRE_SQL = text("""
+    INSERT INTO sheets_quota AS q (bucket, tokens, updated_at)
+    VALUES (:bucket, CAST(:capacity AS double precision) - 1, clock_timestamp())
+    ON CONFLICT (bucket) DO UPDATE SET
+        tokens = least(
+            CAST(:capacity AS double precision),
+            q.tokens + extract(epoch FROM clock_timestamp() - q.updated_at) * CAST(:rate AS double precision)
+        ) - 1,
+        updated_at = clock_timestamp()
+    WHERE least(
+        CAST(:capacity AS double precision),
+        q.tokens + extract(epoch FROM clock_timestamp() - q.updated_at) * CAST(:rate AS double precision)
+    ) >= 1
+    RETURNING tokens
+""")
+
+
+class SheetsQuota:
+    """Ведра read/write на процесс (и, при SHEETS_QUOTA_DB, общие в БД) и метрики ожидания."""
+
+    def __init__(self, use_db: bool = SHEETS_QUOTA_DB):
+        self.buckets: Dict[str, TokenBucket] = {
+            READ: TokenBucket(READ, SHEETS_READ_PER_MINUTE, SHEETS_QUOTA_BURST),
+            WRITE: TokenBucket(WRITE, SHEETS_WRITE_PER_MINUTE, SHEETS_QUOTA_BURST),
+        }
+        self.use_db = use_db
+        self.reset()
+
+    def reset(self) -> None:
+        self.waits: Dict[Tuple[str, int], _WaitCounter] = {}
+        self.throttled = 0  # ответов 429 от Google
+        self.started_at = time.time()
+
+    async def acquire(self, bucket_name: str, priority: Optional[int] = None) -> float:
+        """Ждёт токен для запроса. Возвращает время ожидания в миллисекундах."""
+        if priority is None:
+            priority = sheets_priority.get()
+        bucket = self.buckets[bucket_name]
+        started = time.perf_counter()
+        await bucket.acquire(priority)
+        if self.use_db:
+            await self._acquire_db(bucket)
+        wait_ms = (time.perf_counter() - started) * 1000
+        self.waits.setdefault((bucket_name, priority), _WaitCounter()).add(wait_ms)
+        return wait_ms
+
+    async def _acquire_db(self, bucket: TokenBucket) -> None:
+        # Импорт здесь: без SHEETS_QUOTA_DB модулю не нужна БД
+        from db.engine import async_session_maker
+
+        params = {'bucket': bucket.name, 'capacity': bucket.capacity, 'rate': bucket.rate}
+        while True:
+            async with async_session_maker() as session:
+                result = await session.execute(_DB_ACQUIRE_SQL, params)
+                granted = result.first() is not None
+                await session.commit()
+            if granted:
+                return
+            await asyncio.sleep(1 / bucket.rate)
+
+    def record_throttled(self) -> None:
+        self.throttled += 1
+
+    def format_report(self) -> str:
+        minutes = (time.time() - self.started_at) / 60
+        lines = [
+            f'📊 Квота Google Sheets за {minutes:.0f} мин',
+            f"Лимит: чтение {SHEETS_READ_PER_MINUTE:.0f}/мин, запись {SHEETS_WRITE_PER_MINUTE:.0f}/мин"
+            f"{', общий для процессов (БД)' if self.use_db else ''}",
+            f'Ответов 429 (rate limit): {self.throttled}',
+            '',
+        ]
+        for name, bucket in self.buckets.items():
+            bucket._refill()
+            lines.append(f'🪣 {name}: токенов {bucket.tokens:.1f} из {bucket.capacity:.0f}, в очереди: {bucket.queued}')
+            for priority, priority_name in PRIORITY_NAMES.items():
+                counter = self.waits.get((name, priority))
+                if not counter:
+                    continue
+                lines.append(
+                    f'  • {priority_name}: {counter.count} запросов, ждали {counter.waited}, '
+                    f'в среднем {counter.total_ms / counter.count:.0f} мс, макс. {counter.max_ms:.0f} мс'
+                )
+        return '\n'.join(lines)
+
+
+sheets_quota = SheetsQuota()
@@ -0,0 +1,140 @@
+"""
+Отложенная пакетная запись в Google Sheets (write-behind).
+
+Экспорт каждой записи на собеседование — это обновление ячейки в матрице
+и добавление строки в журнал. Вместо отдельных запросов на каждую запись
+изменения копятся в очереди и раз в SHEETS_FLUSH_INTERVAL секунд уходят
+пачкой: все обновления ячеек одной таблицы — одним values_batch_update,
+все новые строки одного листа — одним append_rows.
+
+    ok = await sheets_writer.append_row(SHEET_ID, 'WORK', row)
+
+append_row/update_cells возвращают future: True после успешной отправки
+пачки, False при ошибке (ошибка печатается в лог).
+"""
+import asyncio
+import os
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from utils.google_sheets import open_spreadsheet, open_worksheet, sheets_holder
+from utils.sheets_client import sheets_call
+from utils.sheets_quota import sheets_priority, PRIORITY_HIGH
+
+
+# Период отправки накопленных изменений (секунды)
+SHEETS_FLUSH_INTERVAL = float(os.getenv('SHEETS_FLUSH_INTERVAL', '3'))
+
+
+def _a1_range(title: str, cell: str) -> str:
+    """Диапазон вида 'лист'!B5 (кавычки в названии удваиваются)."""
+    return "'{}'!{}".format(title.replace("'", "''"), cell)
+
+
+class SheetsWriteBehind:
+    """Очередь изменений Google Sheets с периодической пакетной отправкой."""
+
+    def __init__(self, interval: float = SHEETS_FLUSH_INTERVAL):
+        self.interval = interval
+        # sheet_id -> [(title, cell, values, future)]
+        self._updates: Dict[str, List[Tuple[str, str, list, asyncio.Future]]] = defaultdict(list)
+        # (sheet_id, title) -> [(row, future)]
+        self._appends: Dict[Tuple[str, str], List[Tuple[list, asyncio.Future]]] = defaultdict(list)
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+    def _ensure_started(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def update_cells(self, sheet_id: str, title: str, cell: str, values: list) -> asyncio.Future:
+        """Ставит в очередь запись values (двумерный список) начиная с ячейки cell."""
+        future = asyncio.get_running_loop().create_future()
+        self._updates[sheet_id].append((title, cell, values, future))
+        self._ensure_started()
+        return future
+
+    def append_row(self, sheet_id: str, title: str, row: list) -> asyncio.Future:
+        """Ставит в очередь добавление строки в конец листа."""
+        future = asyncio.get_running_loop().create_future()
+        self._appends[(sheet_id, title)].append((row, future))
+        self._ensure_started()
+        return future
+
+    async def _run(self) -> None:
+        # Здесь уходят экспорты записей — они впереди админских синхронизаций
+        sheets_priority.set(PRIORITY_HIGH)
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"⚠️ Ошибка отправки изменений в Google Sheets: {e}")
+
+    async def flush(self) -> None:
+        """Отправляет всё накопленное: по запросу на таблицу и по запросу на лист."""
+        async with self._flush_lock:
+            updates, self._updates = self._updates, defaultdict(list)
+            appends, self._appends = self._appends, defaultdict(list)
+            try:
+                await self._send(updates, appends)
+            finally:
+                # Отправка прервана (отмена, непойманная ошибка) — ожидающие получают False, а не висят
+                for items in updates.values():
+                    _resolve([future for _, _, _, future in items], False)
+                for items in appends.values():
+                    _resolve([future for _, future in items], False)
+
+    async def _send(self, updates: Dict, appends: Dict) -> None:
+        for sheet_id, items in updates.items():
+            futures = [future for _, _, _, future in items]
+            try:
+                spreadsheet = await open_spreadsheet(sheet_id)
+                body = {
+                    'valueInputOption': 'RAW',
+                    'data': [
+                        {'range': _a1_range(title, cell), 'values': values}
+                        for title, cell, values, _ in items
+                    ],
+                }
+                await sheets_call(spreadsheet.values_batch_update, body)
+                print(f"📤 Google Sheets: обновлено ячеек — {len(items)} (одним запросом)")
+                _resolve(futures, True)
+            except Exception as e:
+                print(f"❌ Ошибка пакетного обновления ячеек ({len(items)} шт.): {e}")
+                sheets_holder.invalidate(sheet_id)
+                _resolve(futures, False)
+
+        for (sheet_id, title), items in appends.items():
+            futures = [future for _, future in items]
+            try:
+                worksheet = await open_worksheet(sheet_id, title)
+                await sheets_call(worksheet.append_rows, [row for row, _ in items], value_input_option='RAW')
+                print(f"📤 Google Sheets: добавлено строк в '{title}' — {len(items)} (одним запросом)")
+                _resolve(futures, True)
+            except Exception as e:
+                print(f"❌ Ошибка добавления строк в '{title}' ({len(items)} шт.): {e}")
+                sheets_holder.invalidate(sheet_id, title)
+                _resolve(futures, False)
+
+    async def stop(self) -> None:
+        """Останавливает периодическую отправку и отправляет остаток (при завершении бота)."""
+        if self._task is not None:
+            # Идущую отправку не прерываем: под блокировкой цикл либо спит, либо ждёт её
+            async with self._flush_lock:
+                self._task.cancel()
+                try:
+                    await self._task
+                except asyncio.CancelledError:
+                    pass
+            self._task = None
+        await self.flush()
+
+
+def _resolve(futures: List[asyncio.Future], result: bool) -> None:
+    for future in futures:
+        if not future.done():
+            future.set_result(result)
+
+
+sheets_writer = SheetsWriteBehind()
@@ -0,0 +1,149 @@
+"""
+Фоновая синхронизация слотов из Google Sheets.
+
+Без неё слоты обновлялись, только когда админ вызывал /sync_slots или
+/parse_reserv, и бот до этого показывал устаревшее расписание. Теперь
+slot_autosync раз в SLOT_SYNC_INTERVAL секунд (± SLOT_SYNC_JITTER, чтобы
+процессы не ходили в таблицу одновременно) синхронизирует листы "1"-"6",
+"резерв" и "финфак" через utils.slot_sync.
+
+- Неизменённые листы пропускаются (utils.slot_sync), так что частый
+  прогон дешёвый.
+- Ход пропускается, если синхронизация уже идёт (ручная или в другом
+  процессе — advisory lock) или Google Sheets недоступен.
+- Админ получает короткую сводку, только если в слотах что-то поменялось.
+  Об ошибках применения строк и непрочитанных листах — отдельной строкой и
+  только когда они изменились с прошлого прохода: строка, которая падает
+  каждый раз, не присылает одно и то же сообщение каждые 10 минут.
+
+SLOT_SYNC_INTERVAL=0 отключает фоновую синхронизацию.
+"""
+import asyncio
+import os
+import random
+from typing import Dict, List, Optional, Tuple
+
+from aiogram import Bot
+
+from config import ADMIN_ID
+from utils.sheets_client import sheets_breaker
+from utils.slot_sync import sync_slots, SlotSyncResult, SCHEDULE, RESERV, FINFAK
+
+# Период синхронизации (секунды)
+SLOT_SYNC_INTERVAL = float(os.getenv('SLOT_SYNC_INTERVAL', '600'))
+# Разброс периода (доля от SLOT_SYNC_INTERVAL)
+SLOT_SYNC_JITTER = float(os.getenv('SLOT_SYNC_JITTER', '0.2'))
+
+SOURCE_TITLES = {
+    SCHEDULE: 'Собеседования (листы 1-6)',
+    RESERV: 'Резерв',
+    FINFAK: 'Финфак',
+}
+
+
+def _problems(result: SlotSyncResult) -> Tuple[int, Tuple[str, ...]]:
+    """Что в источнике не применилось: (ошибок строк, непрочитанные листы)."""
+    return result.errors, tuple(result.sheets_unread)
+
+
+def format_autosync_summary(changed: List[SlotSyncResult], problems: List[SlotSyncResult] = ()) -> str:
+    """Сводка для админа: changed — источники с изменениями, problems — с изменившимися ошибками."""
+    lines = []
+    if changed:
+        lines.append('🔄 Автосинхронизация слотов: есть изменения')
+    for result in changed:
+        lines.append(
+            f"• {SOURCE_TITLES.get(result.source, result.source)}: "
+            f"+{result.added} новых, {result.updated} обновлено, −{result.deleted} удалено"
+        )
+    if problems:
+        if lines:
+            lines.append('')
+        lines.append('⚠️ Автосинхронизация слотов: ошибки изменились')
+    for result in problems:
+        title = SOURCE_TITLES.get(result.source, result.source)
+        if not result.errors and not result.sheets_unread:
+            lines.append(f"• {title}: ошибок больше нет")
+            continue
+        details = []
+        if result.errors:
+            details.append(f"ошибок в строках: {result.errors} (см. лог)")
+        if result.sheets_unread:
+            details.append(f"листы не найдены: {', '.join(result.sheets_unread)}")
+        lines.append(f"• {title}: {'; '.join(details)}")
+    return '\n'.join(lines)
+
+
+class SlotAutoSync:
+    """Периодическая синхронизация слотов с уведомлением админа об изменениях."""
+
+    def __init__(self, interval: float = SLOT_SYNC_INTERVAL, jitter: float = SLOT_SYNC_JITTER):
+        self.interval = interval
+        self.jitter = jitter
+        self._task: Optional[asyncio.Task] = None
+        # Ошибки источников с прошлого прохода: о неизменившихся не сообщаем повторно
+        self._last_problems: Dict[str, Tuple[int, Tuple[str, ...]]] = {}
+
+    def _next_delay(self) -> float:
+        return self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    async def start(self, bot: Bot) -> None:
+        if self.interval <= 0:
+            print("⏸ Автосинхронизация слотов отключена (SLOT_SYNC_INTERVAL=0)")
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run(bot))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, bot: Bot) -> None:
+        while True:
+            await asyncio.sleep(self._next_delay())
+            try:
+                await self.run_once(bot)
+            except Exception as e:
+                print(f"⚠️ Ошибка автосинхронизации слотов: {e}")
+
+    async def run_once(self, bot: Bot) -> List[SlotSyncResult]:
+        """Один проход по всем источникам. Возвращает результаты с изменениями."""
+        if sheets_breaker.is_open:
+            print("⏭ Автосинхронизация слотов пропущена: Google Sheets недоступен")
+            return []
+
+        changed = []
+        problems = []
+        for source in (SCHEDULE, RESERV, FINFAK):
+            try:
+                result = await sync_slots(source, wait=False)
+            except Exception as e:
+                print(f"⚠️ Автосинхронизация '{source}' не удалась: {e}")
+                continue
+            if result is None:
+                print("⏭ Автосинхронизация слотов пропущена: синхронизация уже идёт")
+                break
+            if result.has_changes:
+                changed.append(result)
+            if not result.loaded and not result.sheets_unread:
+                # Слотов не получено — по ошибкам судить не по чему
+                continue
+            current = _problems(result)
+            if current != self._last_problems.get(source, (0, ())):
+                problems.append(result)
+            self._last_problems[source] = current
+
+        if changed or problems:
+            try:
+                await bot.send_message(ADMIN_ID, format_autosync_summary(changed, problems))
+            except Exception as e:
+                print(f"⚠️ Не удалось отправить сводку автосинхронизации: {e}")
+        return changed
+
+
+slot_autosync = SlotAutoSync()
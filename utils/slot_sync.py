@@ -0,0 +1,385 @@
+"""
+Синхронизация слотов собеседований из Google Sheets с отслеживанием изменений.
+
+Раньше /sync_slots, /parse_reserv и /parse_finfak каждый раз заново
+применяли к БД все слоты из таблицы, даже если её никто не трогал. Теперь
+для каждого листа в таблице sheet_sync_state (миграция 013) хранятся хэши
+с прошлой синхронизации: хэш строки каждого собеседующего (его слоты на
+листе) и хэш всего листа.
+
+- Лист, хэш которого не изменился, пропускается целиком.
+- В изменённом листе применяются только строки собеседующих, чьи слоты
+  изменились (или которые пропали с листа), — по ключу (собеседующий, дата).
+- Строки, которые применить не удалось (собеседующий ещё не зарегистрирован,
+  ошибка), не запоминаются и будут применены при следующей синхронизации.
+- Лист, который не удалось прочитать (удалён или переименован), не трогается:
+  иначе все его слоты выглядели бы удалёнными из таблицы. Не трогаются и
+  строки других листов с той же датой (листы "2" и "3").
+- Строка, в которой убранный из таблицы слот пришлось оставить (на него есть
+  запись), тоже не запоминается: после отмены записи слот будет удалён
+  при следующей синхронизации. Отменённые записи на удаляемый слот удаляются
+  вместе с ним, как при повторной записи на слот.
+
+force=True применяет все строки, как раньше.
+
+Синхронизации не пересекаются: в процессе — общий asyncio.Lock, между
+процессами — advisory lock PostgreSQL. Ручная команда ждёт окончания
+идущей синхронизации, фоновая (utils.slot_autosync, wait=False) пропускает ход.
+
+    result = await sync_slots(SCHEDULE, force=False)
+    await message.answer(format_sync_result(result))
+"""
+import asyncio
+import hashlib
+import json
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import delete, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.engine import engine, async_session_maker
+from db.booking_view import delete_booking_view, KIND_SOBES, KIND_RESERV, KIND_FINFAK
+from db.models import (
+    Interviewer, TimeSlot, Interview, ReservTimeSlot, ReservBooking,
+    FinfakTimeSlot, FinfakBooking, SheetSyncState,
+)
+from utils.google_sheets import get_schedules_data, SCHEDULE_SHEETS
+from utils.reserv_parser import parse_reserv_sheets, RESERV_SHEETS
+
+
+# Источники слотов
+SCHEDULE = 'schedule'  # листы "1"-"6" -> time_slots
+RESERV = 'резерв'  # лист "резерв" -> reserv_time_slots
+FINFAK = 'финфак'  # лист "финфак" -> finfak_time_slots
+
+
+class SlotSource(NamedTuple):
+    key: str
+    slot_model: type
+    booking_model: type
+    booking_kind: str  # вид записи в витрине db.booking_view
+    update_faculties: bool  # дописывать собеседующему факультеты листа
+    sheet_dates: Dict[str, str]  # лист -> дата собеседований
+
+
+SOURCES = {
+    SCHEDULE: SlotSource(
+        SCHEDULE, TimeSlot, Interview, KIND_SOBES, True,
+        {name: info['date'] for name, info in SCHEDULE_SHEETS.items()},
+    ),
+    RESERV: SlotSource(
+        RESERV, ReservTimeSlot, ReservBooking, KIND_RESERV, False,
+        {RESERV: RESERV_SHEETS[RESERV]['date']},
+    ),
+    FINFAK: SlotSource(
+        FINFAK, FinfakTimeSlot, FinfakBooking, KIND_FINFAK, False,
+        {FINFAK: RESERV_SHEETS[FINFAK]['date']},
+    ),
+}
+
+
+class SlotSyncResult(NamedTuple):
+    source: str
+    loaded: bool  # данные из таблицы получены
+    slots_total: int  # слотов в таблице
+    sheets_skipped: List[str]  # листы без изменений
+    sheets_unread: List[str]  # листы, которых нет в таблице (не применялись)
+    changed_rows: int  # строк собеседующих с изменениями
+    added: int
+    updated: int
+    skipped: int  # занятые слоты и незарегистрированные собеседующие
+    deleted: int
+    errors: int
+    interviewer_stats: Dict
+
+    @property
+    def has_changes(self) -> bool:
+        """В БД что-то поменялось (строки незарегистрированных собеседующих и ошибки не считаются)."""
+        return bool(self.added or self.updated or self.deleted)
+
+
+def _digest(value) -> str:
+    return hashlib.sha1(json.dumps(value, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+def _row_digest(slots: List[Dict]) -> str:
+    """Хэш строки собеседующего на листе: всё, что из неё попадает в БД."""
+    return _digest(sorted(
+        [slot['interviewer_name'], slot['date'], slot['time_start'], slot['time_end'], sorted(slot.get('faculties') or [])]
+        for slot in slots
+    ))
+
+
+async def _fetch(source: SlotSource) -> Tuple[List[Dict], Dict, Set[str]]:
+    unread_sheets: Set[str] = set()
+    if source.key == SCHEDULE:
+        slots, interviewer_stats = await get_schedules_data(unread_sheets=unread_sheets)
+    else:
+        slots, interviewer_stats = await parse_reserv_sheets(sheet_names=[source.key], unread_sheets=unread_sheets)
+    return slots, interviewer_stats, unread_sheets
+
+
+async def _apply_row(session: AsyncSession, source: SlotSource, interviewer: Interviewer, date: str, slots: List[Dict]) -> Dict[str, int]:
+    """
+    Приводит слоты собеседующего на дату к строкам таблицы. Занятые слоты не трогает.
+
+    counts['kept'] — убранные из таблицы слоты, оставленные из-за записи на них.
+    """
+    model = source.slot_model
+    counts = {'added': 0, 'updated': 0, 'skipped': 0, 'deleted': 0, 'kept': 0}
+
+    if source.update_faculties and slots:
+        # Факультеты дописываются, не перезаписываются
+        faculties = set(interviewer.faculties.split(',')) if interviewer.faculties else set()
+        for slot in slots:
+            faculties.update(slot['faculties'])
+        interviewer.faculties = ','.join(sorted(faculties))
+
+    result = await session.execute(
+        select(model).where(model.interviewer_id == interviewer.id, model.date == date)
+    )
+    existing = {slot.time_start: slot for slot in result.scalars().all()}
+    wanted = {slot['time_start']: slot for slot in slots}
+    now = datetime.now()
+
+    for time_start, slot_info in wanted.items():
+        slot = existing.get(time_start)
+        if slot is None:
+            session.add(model(
+                interviewer_id=interviewer.id,
+                date=date,
+                time_start=time_start,
+                time_end=slot_info['time_end'],
+                is_available=True,
+                google_sheet_sync=now,
+            ))
+            counts['added'] += 1
+        elif slot.is_available:
+            slot.time_end = slot_info['time_end']
+            slot.google_sheet_sync = now
+            counts['updated'] += 1
+        else:
+            # Слот занят - не трогаем
+            counts['skipped'] += 1
+
+    # Свободные слоты, которых больше нет в таблице, удаляем, если на них нет записи (кроме отменённых)
+    stale = [slot for time_start, slot in existing.items() if time_start not in wanted and slot.is_available]
+    if stale:
+        booking = source.booking_model
+        bookings_result = await session.execute(
+            select(booking.id, booking.time_slot_id, booking.status).where(
+                booking.time_slot_id.in_([slot.id for slot in stale])
+            )
+        )
+        bookings = bookings_result.all()
+        # Отменённые записи удаляются вместе со слотом (time_slot_id NOT NULL), прочие слот удерживают
+        kept_slots = {slot_id for _, slot_id, status in bookings if status != 'cancelled'}
+        stale_ids = {slot.id for slot in stale}
+        cancelled = [booking_id for booking_id, slot_id, status in bookings if status == 'cancelled' and slot_id not in kept_slots]
+        if cancelled:
+            await session.execute(delete(booking).where(booking.id.in_(cancelled)))
+            await delete_booking_view(session, source.booking_kind, cancelled)
+        for slot in stale:
+            if slot.id in kept_slots:
+                counts['kept'] += 1
+                continue
+            await session.delete(slot)
+            counts['deleted'] += 1
+
+    return counts
+
+
+# Одна синхронизация слотов на процесс
+slot_sync_lock = asyncio.Lock()
+# Ключ advisory lock PostgreSQL — одна синхронизация на все процессы бота
+SLOT_SYNC_LOCK_KEY = "hashtext('slot_sync')"
+
+
+@asynccontextmanager
+async def slot_sync_guard(wait: bool = True):
+    """
+    Исключительный доступ к синхронизации слотов. Отдаёт True, если получен.
+
+    wait=False — не ждать: если синхронизация уже идёт (здесь или в другом процессе), отдаёт False.
+    """
+    if not wait and slot_sync_lock.locked():
+        yield False
+        return
+    async with slot_sync_lock:
+        # Advisory lock живёт в сессии PostgreSQL — держим отдельное соединение до конца синхронизации
+        async with engine.connect() as conn:
+            if wait:
+                await conn.execute(text(f"SELECT pg_advisory_lock({SLOT_SYNC_LOCK_KEY})"))
+                acquired = True
+            else:
+                acquired = bool(await conn.scalar(text(f"SELECT pg_try_advisory_lock({SLOT_SYNC_LOCK_KEY})")))
+            await conn.commit()
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    await conn.execute(text(f"SELECT pg_advisory_unlock({SLOT_SYNC_LOCK_KEY})"))
+                    await conn.commit()
+
+
+async def sync_slots(source_key: str, force: bool = False, wait: bool = True) -> Optional[SlotSyncResult]:
+    """
+    Синхронизирует слоты источника source_key (SCHEDULE / RESERV / FINFAK) с таблицей.
+
+    None — только при wait=False, если синхронизация уже идёт.
+    """
+    async with slot_sync_guard(wait) as acquired:
+        if not acquired:
+            return None
+        return await _sync_slots(SOURCES[source_key], force)
+
+
+async def _sync_slots(source: SlotSource, force: bool) -> SlotSyncResult:
+    slots, interviewer_stats, unread_sheets = await _fetch(source)
+    sheets_unread = sorted(unread_sheets)
+    if not slots:
+        return SlotSyncResult(source.key, False, 0, [], sheets_unread, 0, 0, 0, 0, 0, 0, interviewer_stats)
+
+    # Текущие строки: лист -> ID собеседующего -> слоты; и слоты по (собеседующий, дата)
+    sheet_rows: Dict[str, Dict[str, List[Dict]]] = defaultdict(lambda: defaultdict(list))
+    date_rows: Dict[Tuple[str, str], List[Dict]] = defaultdict(list)
+    for slot in slots:
+        sheet_rows[slot['sheet_name']][slot['interviewer_sheet_id']].append(slot)
+        date_rows[(slot['interviewer_sheet_id'], slot['date'])].append(slot)
+
+    counts = {'added': 0, 'updated': 0, 'skipped': 0, 'deleted': 0, 'errors': 0}
+    sheets_skipped = []
+    changed_rows = 0
+
+    async with async_session_maker() as session:
+        states_result = await session.execute(
+            select(SheetSyncState).where(SheetSyncState.source == source.key)
+        )
+        states = {state.sheet_name: state for state in states_result.scalars().all()}
+
+        # Что изменилось с прошлой синхронизации
+        sheet_hashes: Dict[str, Dict[str, str]] = {}
+        sheet_changes: Dict[str, Set[str]] = {}
+        dirty: Set[Tuple[str, str]] = set()  # (ID собеседующего, дата)
+        for sheet_name, date in source.sheet_dates.items():
+            if sheet_name in unread_sheets:
+                continue
+            current = {iid: _row_digest(rows) for iid, rows in sheet_rows.get(sheet_name, {}).items()}
+            state = states.get(sheet_name)
+            stored = (state.row_hashes or {}) if state else {}
+            if not force and state and state.content_hash == _digest(current):
+                sheets_skipped.append(sheet_name)
+                continue
+            changed = {
+                iid for iid in current.keys() | stored.keys()
+                if force or current.get(iid) != stored.get(iid)
+            }
+            sheet_hashes[sheet_name] = current
+            sheet_changes[sheet_name] = changed
+            dirty.update((iid, date) for iid in changed)
+        changed_rows = sum(len(changed) for changed in sheet_changes.values())
+        # В дни непрочитанных листов слоты этих листов не получены — такие строки не применяем
+        unread_dates = {source.sheet_dates[name] for name in unread_sheets if name in source.sheet_dates}
+
+        # Собеседующие изменённых строк — одним запросом
+        interviewers = {}
+        if dirty:
+            interviewers_result = await session.execute(
+                select(Interviewer).where(Interviewer.interviewer_sheet_id.in_({iid for iid, _ in dirty}))
+            )
+            for interviewer in interviewers_result.scalars().all():
+                interviewers.setdefault(interviewer.interviewer_sheet_id, interviewer)
+
+        failed: Set[Tuple[str, str]] = set()
+        for iid, date in sorted(dirty):
+            if date in unread_dates:
+                failed.add((iid, date))
+                continue
+            rows = date_rows.get((iid, date), [])
+            interviewer = interviewers.get(iid)
+            if interviewer is None:
+                # Собеседующий не зарегистрирован - применим, когда появится
+                if rows:
+                    counts['skipped'] += len(rows)
+                    failed.add((iid, date))
+                continue
+            try:
+                async with session.begin_nested():
+                    row_counts = await _apply_row(session, source, interviewer, date, rows)
+                if row_counts.pop('kept'):
+                    # Слот удержан записью — строку повторим, когда запись отменят
+                    failed.add((iid, date))
+                for key, value in row_counts.items():
+                    counts[key] += value
+            except Exception as e:
+                print(f"Ошибка обработки слотов собеседующего {iid} на {date}: {e}")
+                counts['errors'] += 1
+                failed.add((iid, date))
+
+        # Запоминаем применённое состояние листов (неприменённые строки — со старым хэшем)
+        now = datetime.now().astimezone()
+        for sheet_name, current in sheet_hashes.items():
+            date = source.sheet_dates[sheet_name]
+            state = states.get(sheet_name)
+            stored = (state.row_hashes or {}) if state else {}
+            applied = dict(current)
+            for iid in sheet_changes[sheet_name]:
+                if (iid, date) in failed:
+                    if iid in stored:
+                        applied[iid] = stored[iid]
+                    else:
+                        applied.pop(iid, None)
+            stmt = insert(SheetSyncState).values(
+                source=source.key, sheet_name=sheet_name,
+                content_hash=_digest(applied), row_hashes=applied, synced_at=now,
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['source', 'sheet_name'],
+                set_={'content_hash': stmt.excluded.content_hash, 'row_hashes': stmt.excluded.row_hashes, 'synced_at': now},
+            )
+            await session.execute(stmt)
+
+        await session.commit()
+
+    return SlotSyncResult(
+        source.key, True, len(slots), sheets_skipped, sheets_unread, changed_rows,
+        counts['added'], counts['updated'], counts['skipped'], counts['deleted'], counts['errors'],
+        interviewer_stats,
+    )
+
+
+def format_sync_result(result: SlotSyncResult) -> str:
+    """Сводка синхронизации для сообщения админу."""
+    total_sheets = len(SOURCES[result.source].sheet_dates)
+    unread = f"⚠️ Листы не найдены в таблице (не применялись): {', '.join(result.sheets_unread)}\n"
+    if not result.changed_rows:
+        return (
+            f"✅ Изменений в таблице нет — ничего не применялось.\n\n"
+            f"{unread if result.sheets_unread else ''}"
+            f"📋 Листов без изменений: {len(result.sheets_skipped)} из {total_sheets}\n"
+            f"📋 Слотов в Google Sheets: {result.slots_total}"
+        )
+    lines = [
+        "✅ Синхронизация завершена!",
+        "",
+        "📊 Статистика:",
+        f"• Изменённых строк собеседующих: {result.changed_rows}",
+        f"• Добавлено новых слотов: {result.added}",
+        f"• Обновлено существующих: {result.updated}",
+        f"• Пропущено (занято или нет собеседующего): {result.skipped}",
+    ]
+    if result.deleted:
+        lines.append(f"• Удалено устаревших: {result.deleted}")
+    if result.errors:
+        lines.append(f"• ⚠️ Ошибок: {result.errors}")
+    lines.append("")
+    if result.sheets_unread:
+        lines.append(unread.rstrip())
+    if result.sheets_skipped:
+        lines.append(f"📋 Листов без изменений (пропущены): {', '.join(result.sheets_skipped)}")
+    lines.append(f"📋 Слотов в Google Sheets: {result.slots_total}")
+    return '\n'.join(lines)